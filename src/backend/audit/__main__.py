@@ -0,0 +1,95 @@
+# backend/audit/__main__.py
+"""
+Audit log 維運工具：
+
+    python -m backend.audit verify [--log audit.log] [--full] [--blocks A:B] [--workers N]
+    python -m backend.audit query [--since ISO] [--until ISO] [--user U] [--action A] [--file-id F] [--ip IP] [--count-by FIELD]
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from .chain import load_verify_key, verify_log, AUDIT_SIGNING_KEY
+from .index import get_index, INDEX_FIELDS
+from .logger import AUDIT_LOG_PATH
+
+
+def _cmd_verify(args) -> int:
+    blocks = None
+    if args.blocks:
+        a, _, b = args.blocks.partition(":")
+        blocks = (int(a or 0), int(b) if b else None)
+    try:
+        pub = load_verify_key(args.key)
+    except FileNotFoundError as e:
+        print("✗", e, file=sys.stderr)
+        return 2
+    report = verify_log(
+        args.log,
+        pub,
+        full=args.full,
+        blocks=blocks,
+        workers=args.workers,
+    )
+    print(
+        f"checkpoints={report.checkpoints} blocks_verified={report.blocks_verified} "
+        f"tail_records={report.tail_records} ok={report.ok}"
+    )
+    for error in report.errors:
+        print("  ✗", error)
+    return 0 if report.ok else 1
+
+
+def _cmd_query(args) -> int:
+    index = get_index(args.log)
+    index.refresh()
+    since = datetime.fromisoformat(args.since).timestamp() if args.since else None
+    until = datetime.fromisoformat(args.until).timestamp() if args.until else None
+    filters = {"user_id": args.user, "action": args.action, "file_id": args.file_id, "ip": args.ip}
+    if args.count_by:
+        counts = index.count_by(args.count_by, since, until, filters)
+        for value, n in sorted(counts.items(), key=lambda kv: -kv[1]):
+            print(f"{n}\t{value}")
+        return 0
+    cursor = 0
+    while cursor is not None:
+        records, cursor = index.query(since, until, filters, cursor, 1000)
+        for record in records:
+            print(json.dumps(record, ensure_ascii=False, default=str))
+    return 0
+
+
+def main(argv=None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="python -m backend.audit", description="Audit log tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    verify = sub.add_parser("verify", help="Verify the hash chain and signed checkpoints")
+    verify.add_argument("--log", default=AUDIT_LOG_PATH)
+    verify.add_argument("--key", default=AUDIT_SIGNING_KEY, help="Public key (.pub), or the signing key path whose .pub is used")
+    verify.add_argument("--full", action="store_true", help="Re-verify every block, not just new ones")
+    verify.add_argument("--blocks", help="Only verify block range A:B (checkpoint indexes)")
+    verify.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    verify.set_defaults(func=_cmd_verify)
+
+    query = sub.add_parser("query", help="Search the audit log through the segment index")
+    query.add_argument("--log", default=AUDIT_LOG_PATH)
+    query.add_argument("--since", help="ISO 8601 lower bound (inclusive)")
+    query.add_argument("--until", help="ISO 8601 upper bound (exclusive)")
+    query.add_argument("--user")
+    query.add_argument("--action")
+    query.add_argument("--file-id")
+    query.add_argument("--ip")
+    query.add_argument("--count-by", choices=INDEX_FIELDS)
+    query.set_defaults(func=_cmd_query)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+# backend/audit/chain.py
+"""
+防竄改 audit log：每筆紀錄帶 seq / prev / hash 形成 hash chain，
+每 AUDIT_BLOCK_SIZE 筆封成一個 block，寫一個 Ed25519 簽章的 checkpoint
+（block 內所有 record hash 的 Merkle root + 頭尾 hash + byte offset）。
+
+驗證時可以只檢查上次驗證過的 checkpoint 之後的 block，
+而且每個 block 都能單獨驗證，所以可以分給多個 process 平行跑。
+
+多個 writer process 可以共用同一個 log：寫入端在 flock 底下確認檔尾沒有被別人動過，
+動過就先用 ChainState.recover 從檔案重建 chain（見 logger.AuditWriter._write_batch）。
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+
+from ..keyfile import load_or_create
+
+GENESIS_HASH = "0" * 64
+AUDIT_BLOCK_SIZE = int(os.getenv("AUDIT_BLOCK_SIZE", "1024"))
+AUDIT_SIGNING_KEY = os.getenv("AUDIT_SIGNING_KEY", "audit_signing_key.pem")
+
+
+def canonical(obj: dict) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def record_hash(record: dict) -> str:
+    body = {k: v for k, v in record.items() if k != "hash"}
+    return hashlib.sha256(canonical(body)).hexdigest()
+
+
+def merkle_root(hashes: List[str]) -> str:
+    """leaf = H(0x00 || h)，node = H(0x01 || left || right)，奇數個時最後一個直接升上去。"""
+    if not hashes:
+        return GENESIS_HASH
+    level = [hashlib.sha256(b"\x00" + bytes.fromhex(h)).digest() for h in hashes]
+    while len(level) > 1:
+        nxt = [hashlib.sha256(b"\x01" + level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            nxt.append(level[-1])
+        level = nxt
+    return level[0].hex()
+
+
+def checkpoint_path(log_path: str) -> str:
+    return log_path + ".checkpoints"
+
+
+def verified_state_path(log_path: str) -> str:
+    return log_path + ".verified"
+
+
+# --- 簽章金鑰 ---
+def _generate_signing_pem() -> bytes:
+    return Ed25519PrivateKey.generate().private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+
+
+def load_signing_key(path: str = AUDIT_SIGNING_KEY) -> Ed25519PrivateKey:
+    """讀取 Ed25519 私鑰（只有 writer 會用）；不存在就產生一把，並寫出 .pub 給驗證端用。"""
+    key = serialization.load_pem_private_key(load_or_create(path, _generate_signing_pem), password=None)
+    if not os.path.exists(path + ".pub"):
+        public_pem = key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        load_or_create(path + ".pub", lambda: public_pem, mode=0o644)
+    return key
+
+
+def load_verify_key(path: str = AUDIT_SIGNING_KEY) -> Ed25519PublicKey:
+    """
+    驗證端只讀公鑰：path 可以是 .pub 本身，或是簽章私鑰的路徑（讀旁邊的 <path>.pub）。
+    找不到就丟 FileNotFoundError，絕不會產生新的金鑰。
+    """
+    pub_path = path if path.endswith(".pub") else path + ".pub"
+    try:
+        with open(pub_path, "rb") as f:
+            return serialization.load_pem_public_key(f.read())
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Audit verify key {pub_path} not found (copy it from the writer host)")
+
+
+def sign_checkpoint(cp: dict, key: Ed25519PrivateKey) -> dict:
+    cp = {k: v for k, v in cp.items() if k != "sig"}
+    cp["sig"] = key.sign(canonical(cp)).hex()
+    return cp
+
+
+def checkpoint_signature_ok(cp: dict, pub: Ed25519PublicKey) -> bool:
+    body = {k: v for k, v in cp.items() if k != "sig"}
+    try:
+        pub.verify(bytes.fromhex(cp.get("sig", "")), canonical(body))
+        return True
+    except (InvalidSignature, ValueError):
+        return False
+
+
+def read_checkpoints(log_path: str) -> List[dict]:
+    try:
+        with open(checkpoint_path(log_path), "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def iter_lines(log_path: str, start: int, end: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """(offset, line) for each line in [start, end)."""
+    with open(log_path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            if end is not None and offset >= end:
+                break
+            yield offset, line
+            offset += len(line)
+
+
+def parse_chained(line: bytes) -> Optional[dict]:
+    """回傳帶 hash chain 欄位的紀錄；舊格式（純文字 / 沒有 hash）的行回傳 None。"""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict) or "hash" not in record:
+        return None
+    return record
+
+
+# --- 寫入端狀態 ---
+@dataclass
+class ChainState:
+    log_path: str
+    key: Ed25519PrivateKey
+    block_size: int = AUDIT_BLOCK_SIZE
+    seq: int = 0
+    last_hash: str = GENESIS_HASH
+    block: int = 0
+    block_prev_hash: str = GENESIS_HASH
+    block_start: Optional[int] = None
+    block_hashes: List[str] = field(default_factory=list)
+
+    @classmethod
+    def recover(cls, log_path: str, key: Ed25519PrivateKey, block_size: int = AUDIT_BLOCK_SIZE) -> "ChainState":
+        """從最後一個 checkpoint 接著讀 log 尾巴，重建目前 block 的狀態。"""
+        state = cls(log_path=log_path, key=key, block_size=block_size)
+        start = 0
+        cps = read_checkpoints(log_path)
+        if cps:
+            last = cps[-1]
+            state.seq = last["last_seq"] + 1
+            state.last_hash = state.block_prev_hash = last["last_hash"]
+            state.block = last["block"] + 1
+            start = last["end_offset"]
+        if not os.path.exists(log_path):
+            return state
+        for offset, line in iter_lines(log_path, start):
+            record = parse_chained(line)
+            if record is None:
+                continue
+            if state.block_start is None:
+                state.block_start = offset
+            state.seq = record["seq"] + 1
+            state.last_hash = record["hash"]
+            state.block_hashes.append(record["hash"])
+        return state
+
+    def seal(self, record: dict, offset: int) -> Tuple[bytes, Optional[dict]]:
+        """
+        幫 record 接上 chain 並序列化；offset 是這一行即將寫入的位置。
+        block 滿了會回傳簽好的 checkpoint（由呼叫端在 log 寫入之後再寫出）。
+        """
+        record = dict(record, seq=self.seq, prev=self.last_hash)
+        record["hash"] = record_hash(record)
+        line = canonical(record) + b"\n"
+        if self.block_start is None:
+            self.block_start = offset
+        self.seq += 1
+        self.last_hash = record["hash"]
+        self.block_hashes.append(record["hash"])
+        checkpoint = None
+        if len(self.block_hashes) >= self.block_size:
+            checkpoint = sign_checkpoint({
+                "block": self.block,
+                "first_seq": self.seq - len(self.block_hashes),
+                "last_seq": self.seq - 1,
+                "start_offset": self.block_start,
+                "end_offset": offset + len(line),
+                "prev_hash": self.block_prev_hash,
+                "last_hash": self.last_hash,
+                "merkle_root": merkle_root(self.block_hashes),
+            }, self.key)
+            self.block += 1
+            self.block_prev_hash = self.last_hash
+            self.block_start = None
+            self.block_hashes = []
+        return line, checkpoint
+
+
+# --- 驗證 ---
+def verify_records(
+    log_path: str, start: int, end: Optional[int], prev_hash: str, first_seq: Optional[int]
+) -> Tuple[List[str], str, int, Optional[str]]:
+    """
+    重算 [start, end) 內每筆紀錄的 hash 與 chain 連結。
+    回傳 (hashes, last_hash, next_seq, error)。
+    """
+    hashes: List[str] = []
+    last_hash = prev_hash
+    seq = first_seq
+    for offset, line in iter_lines(log_path, start, end):
+        record = parse_chained(line)
+        if record is None:
+            if end is None and not hashes and first_seq is None:
+                continue  # 開頭的舊格式紀錄
+            return hashes, last_hash, seq or 0, f"unchained or corrupt record at offset {offset}"
+        if seq is not None and record.get("seq") != seq:
+            return hashes, last_hash, seq, f"sequence gap at offset {offset}: expected {seq}, got {record.get('seq')}"
+        if record.get("prev") != last_hash:
+            return hashes, last_hash, seq or 0, f"broken chain link at offset {offset} (seq {record.get('seq')})"
+        if record_hash(record) != record["hash"]:
+            return hashes, last_hash, seq or 0, f"hash mismatch at offset {offset} (seq {record.get('seq')})"
+        hashes.append(record["hash"])
+        last_hash = record["hash"]
+        seq = record["seq"] + 1
+    return hashes, last_hash, seq or 0, None
+
+
+def verify_block(log_path: str, cp: dict) -> Tuple[int, Optional[str]]:
+    """單獨驗證一個 block（可以在 worker process 裡跑）。"""
+    hashes, last_hash, _, error = verify_records(
+        log_path, cp["start_offset"], cp["end_offset"], cp["prev_hash"], cp["first_seq"]
+    )
+    if error:
+        return cp["block"], error
+    if len(hashes) != cp["last_seq"] - cp["first_seq"] + 1:
+        return cp["block"], "record count does not match checkpoint"
+    if last_hash != cp["last_hash"]:
+        return cp["block"], "last hash does not match checkpoint"
+    if merkle_root(hashes) != cp["merkle_root"]:
+        return cp["block"], "merkle root does not match checkpoint"
+    return cp["block"], None
+
+
+@dataclass
+class VerifyReport:
+    ok: bool
+    checkpoints: int = 0
+    blocks_verified: int = 0
+    tail_records: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+def _load_verified(log_path: str) -> int:
+    try:
+        with open(verified_state_path(log_path), "r", encoding="utf-8") as f:
+            return int(json.load(f)["block"])
+    except (FileNotFoundError, ValueError, KeyError):
+        return -1
+
+
+def _save_verified(log_path: str, block: int, last_hash: str) -> None:
+    tmp = verified_state_path(log_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"block": block, "last_hash": last_hash}, f)
+    os.replace(tmp, verified_state_path(log_path))
+
+
+def verify_log(
+    log_path: str,
+    pub: Ed25519PublicKey,
+    full: bool = False,
+    blocks: Optional[Tuple[int, int]] = None,
+    workers: int = 1,
+) -> VerifyReport:
+    """
+    1. 檢查所有 checkpoint 的簽章與彼此的連結（便宜，O(#checkpoints)）
+    2. 重算需要驗證的 block：預設只驗上次驗證之後的新 block，
+       full=True 全部重驗，blocks=(a, b) 只驗 [a, b)；workers > 1 時分給多個 process
+    3. 驗證最後一個 checkpoint 之後、尚未封 block 的尾巴
+    """
+    report = VerifyReport(ok=True)
+    cps = read_checkpoints(log_path)
+    report.checkpoints = len(cps)
+    prev = None
+    for i, cp in enumerate(cps):
+        if cp.get("block") != i:
+            report.errors.append(f"checkpoint {i}: unexpected block number {cp.get('block')}")
+        if not checkpoint_signature_ok(cp, pub):
+            report.errors.append(f"checkpoint {i}: bad signature")
+        if prev is not None and (
+            cp["prev_hash"] != prev["last_hash"]
+            or cp["first_seq"] != prev["last_seq"] + 1
+            or cp["start_offset"] < prev["end_offset"]
+        ):
+            report.errors.append(f"checkpoint {i}: does not link to checkpoint {i - 1}")
+        prev = cp
+    if report.errors:
+        report.ok = False
+        return report
+
+    verified = -1 if full else _load_verified(log_path)
+    if blocks is not None:
+        todo = cps[blocks[0]:blocks[1]]
+    else:
+        todo = cps[verified + 1:]
+
+    if workers > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(verify_block, [log_path] * len(todo), todo, chunksize=max(1, len(todo) // (workers * 4))))
+    else:
+        results = [verify_block(log_path, cp) for cp in todo]
+    for block, error in results:
+        if error:
+            report.errors.append(f"block {block}: {error}")
+        else:
+            report.blocks_verified += 1
+
+    if blocks is None:
+        tail_start = cps[-1]["end_offset"] if cps else 0
+        prev_hash = cps[-1]["last_hash"] if cps else GENESIS_HASH
+        first_seq = cps[-1]["last_seq"] + 1 if cps else None
+        if os.path.exists(log_path):
+            hashes, _, _, error = verify_records(log_path, tail_start, None, prev_hash, first_seq)
+            report.tail_records = len(hashes)
+            if error:
+                report.errors.append(f"tail: {error}")
+
+    report.ok = not report.errors
+    if report.ok and blocks is None and cps:
+        _save_verified(log_path, len(cps) - 1, cps[-1]["last_hash"])
+    return report
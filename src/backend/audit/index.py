@@ -0,0 +1,265 @@
+# backend/audit/index.py
+"""
+Audit log 查詢索引。
+
+log 依紀錄數切成固定大小的 segment，每個 segment 存成一個 JSON 檔：
+byte 範圍、min/max 時間，以及 user_id / action / file_id / ip 的 posting list
+（值 -> 該 segment 內紀錄的 byte offset）。查詢時先用時間範圍挑 segment、
+用 posting list 取交集，再只 seek 到命中的那幾行讀出來，不必掃整個 log。
+
+尚未滿的最後一個 segment 只留在記憶體，每次 refresh 從上一個已封存 segment 的結尾接著讀。
+"""
+import ast
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+INDEX_FIELDS = ("user_id", "action", "file_id", "ip")
+AUDIT_SEGMENT_RECORDS = int(os.getenv("AUDIT_SEGMENT_RECORDS", "4096"))
+
+
+def index_dir(log_path: str) -> str:
+    return log_path + ".idx"
+
+
+def _to_epoch(ts: str) -> Optional[float]:
+    try:
+        # 舊格式是本地時間（naive），新格式帶時區
+        return datetime.fromisoformat(ts.strip()).timestamp()
+    except ValueError:
+        return None
+
+
+def parse_line(line: bytes) -> Optional[dict]:
+    """解析一行 log：JSON lines 或舊的 `ts | user | action | {dict}` 格式。"""
+    text = line.decode("utf-8", errors="replace").strip()
+    if not text:
+        return None
+    if text.startswith("{"):
+        try:
+            record = json.loads(text)
+        except ValueError:
+            return None
+        return record if isinstance(record, dict) else None
+    parts = text.split(" | ", 3)
+    if len(parts) != 4:
+        return None
+    try:
+        metadata = ast.literal_eval(parts[3])
+    except (ValueError, SyntaxError):
+        metadata = {"raw": parts[3]}
+    return {"ts": parts[0], "user_id": parts[1], "action": parts[2], "metadata": metadata}
+
+
+def index_terms(record: dict) -> Iterator[Tuple[str, str]]:
+    metadata = record.get("metadata") or {}
+    if not isinstance(metadata, dict):
+        metadata = {}
+    yield "user_id", str(record.get("user_id", ""))
+    yield "action", str(record.get("action", ""))
+    file_ids = metadata.get("file_ids") or ([metadata["file_id"]] if metadata.get("file_id") else [])
+    for fid in file_ids:
+        yield "file_id", str(fid)
+    if metadata.get("ip"):
+        yield "ip", str(metadata["ip"])
+
+
+@dataclass
+class Segment:
+    start: int
+    end: int = 0
+    count: int = 0
+    min_ts: Optional[float] = None
+    max_ts: Optional[float] = None
+    postings: Dict[str, Dict[str, List[int]]] = field(default_factory=lambda: {f: {} for f in INDEX_FIELDS})
+
+    def add(self, offset: int, length: int, record: dict) -> None:
+        ts = _to_epoch(str(record.get("ts", "")))
+        if ts is not None:
+            self.min_ts = ts if self.min_ts is None else min(self.min_ts, ts)
+            self.max_ts = ts if self.max_ts is None else max(self.max_ts, ts)
+        for name, value in index_terms(record):
+            self.postings[name].setdefault(value, []).append(offset)
+        self.count += 1
+        self.end = offset + length
+
+    def overlaps(self, since: Optional[float], until: Optional[float]) -> bool:
+        if self.min_ts is None:
+            return True
+        if since is not None and self.max_ts < since:
+            return False
+        if until is not None and self.min_ts >= until:
+            return False
+        return True
+
+    def candidates(self, filters: Dict[str, str]) -> List[int]:
+        """posting list 交集；沒有條件時用 action posting 的聯集（每筆紀錄都有 action）。"""
+        result: Optional[Set[int]] = None
+        for name, value in filters.items():
+            offsets = set(self.postings.get(name, {}).get(value, ()))
+            result = offsets if result is None else result & offsets
+            if not result:
+                return []
+        if result is None:
+            result = {o for offsets in self.postings["action"].values() for o in offsets}
+        return sorted(result)
+
+
+class AuditIndex:
+    def __init__(self, log_path: str, segment_records: int = AUDIT_SEGMENT_RECORDS):
+        self.log_path = log_path
+        self.dir = index_dir(log_path)
+        self.segment_records = segment_records
+        self._lock = threading.Lock()
+        self._sealed: List[Segment] = []
+        self._tail: Optional[Segment] = None
+        self._loaded = False
+
+    # --- 持久化 ---
+    def _segment_path(self, n: int) -> str:
+        return os.path.join(self.dir, f"seg-{n:06d}.json")
+
+    def _load(self) -> None:
+        os.makedirs(self.dir, exist_ok=True)
+        n = 0
+        while os.path.exists(self._segment_path(n)):
+            with open(self._segment_path(n), "r", encoding="utf-8") as f:
+                self._sealed.append(Segment(**json.load(f)))
+            n += 1
+        self._loaded = True
+
+    def _seal(self, seg: Segment) -> None:
+        path = self._segment_path(len(self._sealed))
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(seg.__dict__, f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+        self._sealed.append(seg)
+
+    # --- 增量建索引 ---
+    def refresh(self) -> None:
+        """把上次封存之後新增的紀錄補進索引（只讀 log 尾巴）。"""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            start = self._sealed[-1].end if self._sealed else 0
+            seg = Segment(start=start, end=start)
+            if not os.path.exists(self.log_path):
+                self._tail = seg
+                return
+            with open(self.log_path, "rb") as f:
+                f.seek(start)
+                offset = start
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # writer 還在寫的半行
+                    record = parse_line(line)
+                    if record is not None:
+                        seg.add(offset, len(line), record)
+                    else:
+                        seg.end = offset + len(line)
+                    offset += len(line)
+                    if seg.count >= self.segment_records:
+                        self._seal(seg)
+                        seg = Segment(start=offset, end=offset)
+            self._tail = seg
+
+    def segments(self) -> List[Segment]:
+        return self._sealed + ([self._tail] if self._tail and self._tail.count else [])
+
+    # --- 查詢 ---
+    def _open(self):
+        """log 還沒建立（還沒有任何事件）時回傳 None，查詢結果就是空的。"""
+        try:
+            return open(self.log_path, "rb")
+        except FileNotFoundError:
+            return None
+
+    def query(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        filters: Optional[Dict[str, str]] = None,
+        cursor: int = 0,
+        limit: int = 100,
+    ) -> Tuple[List[dict], Optional[int]]:
+        """
+        依 offset 順序回傳最多 limit 筆符合條件的紀錄，以及下一頁的 cursor（byte offset）。
+        """
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        results: List[dict] = []
+        f = self._open()
+        if f is None:
+            return results, None
+        with f:
+            for seg in self.segments():
+                if seg.end <= cursor or not seg.overlaps(since, until):
+                    continue
+                for offset in seg.candidates(filters):
+                    if offset < cursor:
+                        continue
+                    f.seek(offset)
+                    record = parse_line(f.readline())
+                    if record is None:
+                        continue
+                    ts = _to_epoch(str(record.get("ts", "")))
+                    if ts is not None and ((since is not None and ts < since) or (until is not None and ts >= until)):
+                        continue
+                    if len(results) == limit:
+                        return results, offset
+                    results.append(record)
+        return results, None
+
+    def count_by(
+        self,
+        name: str,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        filters: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, int]:
+        """
+        依某個欄位分組計數（例如每個 IP 的 2fa_verify_failed 次數）。
+        完全落在時間範圍內的 segment 只用 posting list 計算，不讀 log。
+        """
+        if name not in INDEX_FIELDS:
+            raise ValueError(f"Cannot group by {name}")
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        counts: Dict[str, int] = {}
+        f = self._open()
+        if f is None:
+            return counts
+        with f:
+            for seg in self.segments():
+                if not seg.overlaps(since, until):
+                    continue
+                cand = set(seg.candidates(filters))
+                if not cand:
+                    continue
+                inside = seg.min_ts is not None and (since is None or seg.min_ts >= since) and (
+                    until is None or seg.max_ts < until
+                )
+                if not inside:
+                    kept = set()
+                    for offset in cand:
+                        f.seek(offset)
+                        record = parse_line(f.readline())
+                        ts = _to_epoch(str(record.get("ts", ""))) if record else None
+                        if ts is None or ((since is None or ts >= since) and (until is None or ts < until)):
+                            kept.add(offset)
+                    cand = kept
+                for value, offsets in seg.postings[name].items():
+                    n = len(cand.intersection(offsets))
+                    if n:
+                        counts[value] = counts.get(value, 0) + n
+        return counts
+
+
+_indexes: Dict[str, AuditIndex] = {}
+
+
+def get_index(log_path: str) -> AuditIndex:
+    if log_path not in _indexes:
+        _indexes[log_path] = AuditIndex(log_path)
+    return _indexes[log_path]
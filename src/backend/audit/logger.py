@@ -1,5 +1,252 @@
-from datetime import datetime
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import replace
+from datetime import datetime, timezone
+from typing import Optional
 
-def log_event(user_id: str, action: str, metadata: dict = {}):
-    with open("audit.log", "a") as f:
-        f.write(f"{datetime.now()} | {user_id} | {action} | {metadata}\n")
+from .chain import ChainState, checkpoint_path, load_signing_key, AUDIT_BLOCK_SIZE, AUDIT_SIGNING_KEY
+
+# --- 設定 ---
+AUDIT_LOG_PATH = os.getenv("AUDIT_LOG_PATH", "audit.log")
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "512"))
+# fsync 策略：batch = 每次 group commit 後 fsync；interval = 最多每 AUDIT_FSYNC_INTERVAL 秒一次；never = 交給 OS
+AUDIT_FSYNC = os.getenv("AUDIT_FSYNC", "batch")
+AUDIT_FSYNC_INTERVAL = float(os.getenv("AUDIT_FSYNC_INTERVAL", "1.0"))
+# queue 滿時：drop_oldest = 丟掉最舊的；drop_newest = 丟掉新事件；
+# keep = 不丟，超過上限也照樣交給背景 writer（順序不變，但 queue 會超出上限吃記憶體）。
+# 三種都不會在 event loop 上寫檔
+AUDIT_OVERFLOW = os.getenv("AUDIT_OVERFLOW", "drop_oldest")
+
+
+def make_record(user_id: str, action: str, metadata: Optional[dict] = None) -> dict:
+    return {
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "user_id": str(user_id),
+        "action": str(action),
+        "metadata": metadata or {},
+    }
+
+
+class AuditWriter:
+    """
+    背景 audit writer：log_event 只把紀錄丟進有上限的 queue，
+    由 event loop 上的背景 task 一次取出一批、單次 write + fsync（group commit）。
+    寫入時每筆紀錄都會接上 hash chain，並在 block 滿時寫出簽章 checkpoint（見 chain.py）。
+    每一批都在 log 檔的 flock 底下寫，多個 uvicorn worker 共用同一個 log 也只會有一條 chain。
+    """
+
+    def __init__(
+        self,
+        path: str = AUDIT_LOG_PATH,
+        queue_size: int = AUDIT_QUEUE_SIZE,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        fsync: str = AUDIT_FSYNC,
+        fsync_interval: float = AUDIT_FSYNC_INTERVAL,
+        overflow: str = AUDIT_OVERFLOW,
+        block_size: int = AUDIT_BLOCK_SIZE,
+        signing_key_path: str = AUDIT_SIGNING_KEY,
+    ):
+        if fsync not in ("batch", "interval", "never"):
+            raise ValueError(f"Unknown AUDIT_FSYNC policy: {fsync}")
+        if overflow not in ("drop_newest", "drop_oldest", "keep"):
+            raise ValueError(f"Unknown AUDIT_OVERFLOW policy: {overflow}")
+        self.path = path
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.overflow = overflow
+        self.block_size = block_size
+        self.signing_key_path = signing_key_path
+        self._chain: Optional[ChainState] = None
+        self._log_end = 0  # 上一批寫完時的檔尾
+        self._queue: deque = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._file = None
+        self._io_lock = threading.Lock()
+        self._last_fsync = 0.0
+        self.written = 0
+        self.dropped = 0
+        self.overflowed = 0  # keep 策略下超出上限仍排入的筆數
+        self.batches = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # --- 生命週期（接在 FastAPI lifespan 上）---
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._file = await asyncio.to_thread(open, self.path, "ab")
+        self._task = asyncio.create_task(self._run(), name="audit-writer")
+
+    async def stop(self) -> None:
+        """停止背景 task，並把 queue 裡剩下的紀錄全部寫完（shutdown flush）。"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        await asyncio.to_thread(self._close)
+
+    # --- 寫入端 ---
+    def submit(self, record: dict) -> None:
+        if not self.running:
+            # 沒有啟動背景 writer（例如 CLI / 測試）時直接同步寫
+            self._write_batch([record])
+            return
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            self._enqueue(record)
+        else:
+            # 從 threadpool（sync 路由）呼叫時，交給 loop thread 排入
+            self._loop.call_soon_threadsafe(self._enqueue, record)
+
+    def _enqueue(self, record: dict) -> None:
+        if len(self._queue) >= self.queue_size:
+            if self.overflow == "drop_newest":
+                self.dropped += 1
+                return
+            if self.overflow == "drop_oldest":
+                self._queue.popleft()
+                self.dropped += 1
+            else:
+                self.overflowed += 1
+        self._queue.append(record)
+        self._wakeup.set()
+
+    # --- 背景 task ---
+    def _take_batch(self) -> list:
+        n = min(self.batch_size, len(self._queue))
+        return [self._queue.popleft() for _ in range(n)]
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue:
+                # 寫檔期間新進來的事件會累積成下一批
+                await asyncio.to_thread(self._write_batch, self._take_batch())
+            if self._stopping:
+                return
+
+    def _write_batch(self, records: list) -> None:
+        if not records:
+            return
+        with self._io_lock:
+            f = self._file if self._file is not None else open(self.path, "ab")
+            try:
+                # 多個 worker process 寫同一個 log：整批（含 checkpoint）都在檔案鎖底下做，
+                # 檔尾跟上次自己寫完的位置不同就表示別的 process 寫過，從檔案重建 chain 再接上去
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                start = f.seek(0, os.SEEK_END)
+                if self._chain is None or start != self._log_end:
+                    self._chain = ChainState.recover(
+                        self.path, load_signing_key(self.signing_key_path), self.block_size
+                    )
+                    self._log_end = start
+                self._seal_and_write(f, start, records)
+            finally:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                finally:
+                    if f is not self._file:
+                        f.close()
+
+    def _seal_and_write(self, f, start: int, records: list) -> None:
+        # 在副本上接 chain，寫入（含 fsync）成功才換成新的狀態；
+        # 失敗時把寫了一半的資料截掉，下一批會從同一個 seq / hash 接上
+        chain = replace(self._chain, block_hashes=list(self._chain.block_hashes))
+        offset = start
+        lines, checkpoints = [], []
+        for record in records:
+            line, checkpoint = chain.seal(record, offset)
+            offset += len(line)
+            lines.append(line)
+            if checkpoint:
+                checkpoints.append(checkpoint)
+        try:
+            f.write(b"".join(lines))
+            f.flush()
+            if self._file is None:
+                if self.fsync != "never":
+                    os.fsync(f.fileno())
+            else:
+                self._maybe_fsync(f)
+        except BaseException:
+            self._rollback(f, start)
+            raise
+        self._chain = chain
+        self._log_end = offset
+        if checkpoints:
+            # checkpoint 一定在對應的 log 資料之後才落地
+            try:
+                with open(checkpoint_path(self.path), "a", encoding="utf-8") as cf:
+                    cf.write("".join(json.dumps(cp, sort_keys=True) + "\n" for cp in checkpoints))
+                    cf.flush()
+                    os.fsync(cf.fileno())
+            except BaseException:
+                # log 已經寫進去了：下次寫入時從檔案重建狀態（會把這個 block 併進下一個 checkpoint）
+                self._chain = None
+                raise
+        self.written += len(records)
+        self.batches += 1
+
+    @staticmethod
+    def _rollback(f, size: int) -> None:
+        """盡量把這一批寫出去的部分截掉（例如磁碟滿了只寫進半行）。"""
+        try:
+            os.ftruncate(f.fileno(), size)
+        except OSError:
+            pass
+
+    def _maybe_fsync(self, f) -> None:
+        if self.fsync == "never":
+            return
+        now = time.monotonic()
+        if self.fsync == "batch" or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(f.fileno())
+            self._last_fsync = now
+
+    def _close(self) -> None:
+        with self._io_lock:
+            if self._file is not None:
+                self._file.flush()
+                if self.fsync != "never":
+                    os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "overflowed": self.overflowed,
+            "batches": self.batches,
+        }
+
+
+# 全域共用的 writer（main.py 的 lifespan 會 start / stop）
+audit_writer = AuditWriter()
+
+
+def log_event(user_id: str, action: str, metadata: Optional[dict] = None):
+    audit_writer.submit(make_record(user_id, action, metadata))
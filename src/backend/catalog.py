@@ -0,0 +1,254 @@
+# backend/catalog.py
+"""
+檔案目錄（catalog）：把每個檔案的 metadata 存在 SQLite，
+/files/list 直接查索引，不必每次掃整個 bucket。
+
+欄位沿用 webpage/schema.sql 的 files 表（filename / owner / wrapped_key / iv / upload_time），
+主鍵改成 storage 用的 file_id 字串。
+
+    python -m backend.catalog reconcile   # 依 storage 內容重建 catalog
+"""
+import asyncio
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from .encryption.container import read_header
+from .storage.base import StorageBackend, ObjectChanged, ObjectNotFound
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id     TEXT PRIMARY KEY,
+    filename    TEXT NOT NULL,
+    owner_id    TEXT,
+    wrapped_key BLOB,
+    iv          BLOB,
+    alg         TEXT,
+    size        INTEGER,
+    upload_time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_filename ON files(filename, file_id);
+CREATE INDEX IF NOT EXISTS idx_files_owner ON files(owner_id, file_id);
+CREATE INDEX IF NOT EXISTS idx_files_owner_filename ON files(owner_id, filename, file_id);
+"""
+
+# 前綴查詢的上界：filename >= prefix AND filename < prefix + MAX_CHAR 可以直接走索引
+_MAX_CHAR = "\U0010ffff"
+
+
+@dataclass
+class FileRecord:
+    file_id: str
+    filename: str
+    owner_id: Optional[str] = None
+    wrapped_key: Optional[bytes] = None
+    iv: Optional[bytes] = None
+    alg: Optional[str] = None
+    size: Optional[int] = None
+    upload_time: float = 0.0
+
+
+def _encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+class FileCatalog:
+    """SQLite（WAL 模式）實作；所有查詢都在 thread 裡跑，不佔用 event loop。"""
+
+    def __init__(self, path: str = "files.db"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+    def _run(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # --- 寫入 ---
+    def _upsert(self, rec: FileRecord) -> None:
+        self._run(
+            "INSERT OR REPLACE INTO files"
+            " (file_id, filename, owner_id, wrapped_key, iv, alg, size, upload_time)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (rec.file_id, rec.filename, rec.owner_id, rec.wrapped_key, rec.iv,
+             rec.alg, rec.size, rec.upload_time or time.time()),
+        )
+
+    async def upsert(self, rec: FileRecord) -> None:
+        await asyncio.to_thread(self._upsert, rec)
+
+    async def update_wrapped_key(self, file_id: str, wrapped_key: bytes) -> None:
+        """rewrap 之後跟著換掉 wrapped_key（紀錄不存在就什麼都不做）。"""
+        await asyncio.to_thread(
+            self._run, "UPDATE files SET wrapped_key = ? WHERE file_id = ?", (wrapped_key, file_id)
+        )
+
+    async def delete(self, file_id: str) -> None:
+        await asyncio.to_thread(self._run, "DELETE FROM files WHERE file_id = ?", (file_id,))
+
+    async def get(self, file_id: str) -> Optional[FileRecord]:
+        rows = await asyncio.to_thread(self._run, "SELECT * FROM files WHERE file_id = ?", (file_id,))
+        return FileRecord(**dict(rows[0])) if rows else None
+
+    # --- 查詢 ---
+    def _list(
+        self,
+        owner_id: Optional[str],
+        prefix: Optional[str],
+        cursor: Optional[str],
+        limit: int,
+    ) -> Tuple[List[FileRecord], Optional[str]]:
+        where, params = [], []
+        if owner_id is not None:
+            where.append("owner_id = ?")
+            params.append(owner_id)
+        if prefix:
+            where.append("filename >= ? AND filename < ?")
+            params += [prefix, prefix + _MAX_CHAR]
+            # 有前綴時依 filename 排序才能用 (owner_id,) filename 索引
+            order = ("filename", "file_id")
+        else:
+            order = ("file_id",)
+        if cursor:
+            last = _decode_cursor(cursor)
+            if len(last) != len(order):
+                raise ValueError("Cursor does not match query")
+            # keyset pagination：(a, b) > (?, ?)，不會隨頁數變慢
+            where.append(f"({', '.join(order)}) > ({', '.join('?' * len(order))})")
+            params += last
+        sql = "SELECT * FROM files"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {', '.join(order)} LIMIT ?"
+        rows = self._run(sql, tuple(params) + (limit + 1,))
+        records = [FileRecord(**dict(r)) for r in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            tail = records[-1]
+            next_cursor = _encode_cursor([getattr(tail, col) for col in order])
+        return records, next_cursor
+
+    async def list(
+        self,
+        owner_id: Optional[str] = None,
+        prefix: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> Tuple[List[FileRecord], Optional[str]]:
+        return await asyncio.to_thread(self._list, owner_id, prefix, cursor, limit)
+
+    def _file_ids(self) -> List[str]:
+        return [r["file_id"] for r in self._run("SELECT file_id FROM files")]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+async def reconcile(catalog: FileCatalog, storage: StorageBackend) -> dict:
+    """
+    以 storage 為準重建 catalog：補上缺少的檔案、移除 storage 已不存在的紀錄。
+    只在排程 / 維運時跑，會讀取每個 .enc 的 header（舊格式則是每個 .key 物件）。
+    """
+    seen = set()
+    added = 0
+    async for obj in storage.list():
+        if obj.name.endswith(".enc") and "/" not in obj.name:
+            file_id = obj.name[:-4]
+            seen.add(file_id)
+            try:
+                header, offset, _ = await read_header(storage, obj.name, generation=obj.generation)
+            except ObjectChanged:
+                # 列出之後被覆寫了（rewrap）：大小要跟 header 同一版才算得出密文長度
+                obj = await storage.stat(obj.name)
+                header, offset, _ = await read_header(storage, obj.name, generation=obj.generation)
+            await catalog.upsert(FileRecord(
+                file_id=file_id,
+                filename=header.filename or f"{file_id}.bin",
+                owner_id=header.owner or None,
+                wrapped_key=header.wrapped_dek,
+                iv=header.iv,
+                alg=header.alg,
+                size=obj.size - offset,
+                upload_time=obj.updated or time.time(),
+            ))
+            added += 1
+            continue
+        if not obj.name.endswith(".bin"):
+            continue
+        file_id = obj.name[:-4]
+        seen.add(file_id)
+        try:
+            wrapped_key = await storage.get(f"{file_id}.key")
+        except ObjectNotFound:
+            wrapped_key = None
+        md = obj.metadata
+        await catalog.upsert(FileRecord(
+            file_id=file_id,
+            filename=md.get("filename", f"{file_id}.bin"),
+            owner_id=md.get("owner") or None,
+            wrapped_key=wrapped_key,
+            iv=bytes.fromhex(md["iv"]) if md.get("iv") else None,
+            alg=md.get("alg"),
+            size=obj.size,
+            upload_time=obj.updated or time.time(),
+        ))
+        added += 1
+    removed = 0
+    for file_id in await asyncio.to_thread(catalog._file_ids):
+        # 掃描途中上傳的檔案有 catalog 紀錄、但 list 已經走過它的名字了：刪之前再確認一次物件真的不在
+        if file_id not in seen and not await _exists(storage, file_id):
+            await catalog.delete(file_id)
+            removed += 1
+    return {"indexed": added, "removed": removed}
+
+
+async def _exists(storage: StorageBackend, file_id: str) -> bool:
+    for name in (f"{file_id}.enc", f"{file_id}.bin"):
+        try:
+            await storage.stat(name)
+            return True
+        except ObjectNotFound:
+            continue
+    return False
+
+
+@lru_cache(maxsize=None)
+def get_catalog() -> FileCatalog:
+    """FastAPI dependency：共用的 catalog（路徑由 FILE_CATALOG_PATH 設定）。"""
+    return FileCatalog(os.getenv("FILE_CATALOG_PATH", "files.db"))
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    from .storage.base import get_storage
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="File catalog maintenance")
+    parser.add_argument("command", choices=["reconcile"])
+    args = parser.parse_args()
+    if args.command == "reconcile":
+        print(asyncio.run(reconcile(get_catalog(), get_storage())))
@@ -0,0 +1,93 @@
+# backend/certs/__main__.py
+"""
+憑證簽發工具：
+
+    python -m backend.certs issue-batch --names devices.txt [--key-alg ec-p256] [--p12-password PW] [--out certs/devices]
+    python -m backend.certs issue-batch --count 1000 --prefix device- [--workers N]
+    python -m backend.certs issue-batch --csr-dir csrs/ [--server]
+    python -m backend.certs key-pool fill|status
+"""
+import argparse
+import sys
+
+from .key_pool import KeyPool
+from .bulk import CA_CERT_PATH, CA_KEY_PATH, issue_batch, jobs_from_csr_dir, jobs_from_names
+from .keys import KEY_ALGORITHMS
+
+
+def _cmd_issue_batch(args) -> int:
+    if args.csr_dir:
+        jobs = jobs_from_csr_dir(args.csr_dir)
+    elif args.names:
+        with open(args.names, "r", encoding="utf-8") as f:
+            jobs = jobs_from_names(f)
+    else:
+        jobs = jobs_from_names(f"{args.prefix}{i:06d}" for i in range(args.count))
+    if not jobs:
+        print("nothing to issue", file=sys.stderr)
+        return 1
+
+    report = issue_batch(
+        jobs,
+        out_dir=args.out,
+        key_alg=args.key_alg,
+        days_valid=args.days,
+        server=args.server,
+        p12_password=args.p12_password,
+        workers=args.workers,
+        ca_key_path=args.ca_key,
+        ca_cert_path=args.ca_cert,
+    )
+    print(
+        f"issued={report.issued} failed={report.failed} "
+        f"seconds={report.seconds:.2f} rate={report.per_second:.1f}/s"
+    )
+    for error in report.errors[:20]:
+        print("  ✗", error)
+    return 0 if not report.failed else 1
+
+
+def _cmd_key_pool(args) -> int:
+    pool = KeyPool()
+    if args.action == "fill":
+        # 預先把池子補滿（例如部署前），產生的 key 會加密存在 KEY_POOL_DIR
+        with pool:
+            pool.fill()
+    else:
+        # 只讀現有的檔案，不啟動 worker
+        pool.load()
+    for alg, n in pool.stats()["available"].items():
+        print(f"{alg}: {n}/{pool.size}")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend.certs")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    b = sub.add_parser("issue-batch", help="issue many device certificates in parallel")
+    src = b.add_mutually_exclusive_group(required=True)
+    src.add_argument("--names", help="file with one device name (CN) per line")
+    src.add_argument("--count", type=int, help="issue N certificates named <prefix><n>")
+    src.add_argument("--csr-dir", help="sign every <name>.csr.pem in this directory")
+    b.add_argument("--prefix", default="device-")
+    b.add_argument("--key-alg", choices=KEY_ALGORITHMS, default="ec-p256")
+    b.add_argument("--days", type=int, default=365)
+    b.add_argument("--server", action="store_true", help="serverAuth + SAN instead of clientAuth")
+    b.add_argument("--p12-password", default=None, help="also write <name>.p12 (empty string = unencrypted)")
+    b.add_argument("--workers", type=int, default=None)
+    b.add_argument("--out", default="certs/devices")
+    b.add_argument("--ca-key", default=CA_KEY_PATH)
+    b.add_argument("--ca-cert", default=CA_CERT_PATH)
+    b.set_defaults(func=_cmd_issue_batch)
+
+    k = sub.add_parser("key-pool", help="pre-generated private key pool (see key_pool.py)")
+    k.add_argument("action", choices=["fill", "status"])
+    k.set_defaults(func=_cmd_key_pool)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# backend/certs/bulk.py
+"""
+大量簽發裝置憑證。
+
+- 每個 worker process 啟動時讀一次 CA（不再每張憑證都 load_ca）
+- 產生金鑰 + 簽章都在 process pool 裡平行做；也可以直接簽外部提供的 CSR
+  （只取 CSR 的公鑰，subject 照檔名組，CSR 裡的 CN 不算數）
+- 主行程一邊收結果一邊寫檔（每台裝置 key / cert，選配 PKCS#12），最後寫 manifest.csv
+- 回傳 BatchReport（張數、耗時、每秒張數）
+"""
+import csv
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone, timedelta
+from typing import Iterable, List, Optional, Sequence
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+from .ca_utils import load_ca
+from .keys import generate_private_key, key_pem, signing_hash
+
+CA_KEY_PATH = "certs/ca/ca.key.pem"
+CA_CERT_PATH = "certs/ca/ca.cert.pem"
+
+
+@dataclass
+class IssueJob:
+    name: str                      # CN，也是輸出檔名
+    csr_pem: Optional[bytes] = None  # 有給就簽這個 CSR，不產生金鑰
+
+
+@dataclass
+class IssueResult:
+    name: str
+    cert_pem: bytes = b""
+    key_pem: bytes = b""
+    p12: bytes = b""
+    serial: int = 0
+    sha256: str = ""
+    not_after: str = ""
+    error: str = ""
+
+
+@dataclass
+class BatchReport:
+    issued: int
+    failed: int
+    seconds: float
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def per_second(self) -> float:
+        return self.issued / self.seconds if self.seconds else 0.0
+
+
+# ---- worker process ----
+_ca_key = None
+_ca_cert = None
+_options: dict = {}
+
+
+def _init_worker(ca_key_path: str, ca_cert_path: str, options: dict) -> None:
+    global _ca_key, _ca_cert, _options
+    _ca_key, _ca_cert = load_ca(ca_key_path, ca_cert_path)
+    _options = options
+
+
+def _subject(name: str) -> x509.Name:
+    return x509.Name([
+        x509.NameAttribute(NameOID.COUNTRY_NAME, _options["country"]),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, _options["org"]),
+        x509.NameAttribute(NameOID.COMMON_NAME, name),
+    ])
+
+
+def _issue_one(job: IssueJob) -> IssueResult:
+    try:
+        if not job.name or job.name.startswith(".") or "/" in job.name or "\\" in job.name:
+            raise ValueError("invalid device name")
+        key = None
+        if job.csr_pem:
+            csr = x509.load_pem_x509_csr(job.csr_pem)
+            if not csr.is_signature_valid:
+                raise ValueError("CSR signature invalid")
+            # subject 一律照檔名組，CSR 自己填的 CN（例如 admin）不採用
+            public_key = csr.public_key()
+        else:
+            key = generate_private_key(_options["key_alg"])
+            public_key = key.public_key()
+        subject = _subject(job.name)
+
+        now = datetime.now(timezone.utc)
+        usage = ExtendedKeyUsageOID.SERVER_AUTH if _options["server"] else ExtendedKeyUsageOID.CLIENT_AUTH
+        builder = (
+            x509.CertificateBuilder()
+            .subject_name(subject)
+            .issuer_name(_ca_cert.subject)
+            .public_key(public_key)
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now)
+            .not_valid_after(now + timedelta(days=_options["days_valid"]))
+            .add_extension(x509.ExtendedKeyUsage([usage]), critical=False)
+        )
+        if _options["server"]:
+            builder = builder.add_extension(x509.SubjectAlternativeName([x509.DNSName(job.name)]), critical=False)
+        cert = builder.sign(_ca_key, signing_hash(_ca_key))
+
+        result = IssueResult(
+            name=job.name,
+            cert_pem=cert.public_bytes(serialization.Encoding.PEM),
+            serial=cert.serial_number,
+            sha256=hashlib.sha256(cert.public_bytes(serialization.Encoding.DER)).hexdigest(),
+            not_after=cert.not_valid_after_utc.isoformat(),
+        )
+        if key is not None:
+            result.key_pem = key_pem(key)
+            if _options["p12_password"] is not None:
+                password = _options["p12_password"]
+                encryption = (
+                    serialization.BestAvailableEncryption(password.encode())
+                    if password else serialization.NoEncryption()
+                )
+                result.p12 = pkcs12.serialize_key_and_certificates(
+                    job.name.encode(), key, cert, [_ca_cert], encryption
+                )
+        return result
+    except Exception as e:
+        return IssueResult(name=job.name, error=f"{type(e).__name__}: {e}")
+
+
+# ---- 主行程 ----
+def _write(path: str, data: bytes, mode: int = 0o644) -> None:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+
+
+def issue_batch(
+    jobs: Sequence[IssueJob],
+    out_dir: str = "certs/devices",
+    key_alg: str = "ec-p256",
+    days_valid: int = 365,
+    server: bool = False,
+    p12_password: Optional[str] = None,
+    workers: Optional[int] = None,
+    ca_key_path: str = CA_KEY_PATH,
+    ca_cert_path: str = CA_CERT_PATH,
+    country: str = "TW",
+    org: str = "MyOrg",
+) -> BatchReport:
+    """
+    簽發一批憑證寫到 out_dir：<name>.key.pem / <name>.cert.pem（/ <name>.p12），
+    外加 manifest.csv（name, serial, sha256, not_after）。
+    p12_password=None 不產生 PKCS#12；空字串表示不加密的 PKCS#12。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    options = {
+        "key_alg": key_alg, "days_valid": days_valid, "server": server,
+        "p12_password": p12_password, "country": country, "org": org,
+    }
+    workers = workers or os.cpu_count() or 1
+    # 每個 task 很短，分批送進 worker 減少 IPC 次數
+    chunksize = max(1, min(64, len(jobs) // (workers * 4) or 1))
+
+    start = time.perf_counter()
+    issued, errors, manifest = 0, [], []
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(ca_key_path, ca_cert_path, options)
+    ) as pool:
+        for result in pool.map(_issue_one, jobs, chunksize=chunksize):
+            if result.error:
+                errors.append(f"{result.name}: {result.error}")
+                continue
+            base = os.path.join(out_dir, result.name)
+            _write(base + ".cert.pem", result.cert_pem)
+            if result.key_pem:
+                _write(base + ".key.pem", result.key_pem, 0o600)
+            if result.p12:
+                _write(base + ".p12", result.p12, 0o600)
+            manifest.append((result.name, format(result.serial, "x"), result.sha256, result.not_after))
+            issued += 1
+
+    with open(os.path.join(out_dir, "manifest.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(("name", "serial", "sha256", "not_after"))
+        writer.writerows(manifest)
+    return BatchReport(issued=issued, failed=len(errors), seconds=time.perf_counter() - start, errors=errors)
+
+
+def jobs_from_names(names: Iterable[str]) -> List[IssueJob]:
+    return [IssueJob(name=n.strip()) for n in names if n.strip()]
+
+
+def jobs_from_csr_dir(csr_dir: str) -> List[IssueJob]:
+    """目錄裡的每個 <name>.csr.pem 各簽一張，輸出檔名沿用 <name>。"""
+    jobs = []
+    for entry in sorted(os.scandir(csr_dir), key=lambda e: e.name):
+        if entry.is_file() and entry.name.endswith(".csr.pem"):
+            with open(entry.path, "rb") as f:
+                jobs.append(IssueJob(name=entry.name[: -len(".csr.pem")], csr_pem=f.read()))
+    return jobs
@@ -1,9 +1,18 @@
+from functools import lru_cache
+
 from cryptography import x509
 from cryptography.hazmat.primitives import serialization
 
+def load_ca_cert(ca_cert_path: str) -> x509.Certificate:
+    with open(ca_cert_path, "rb") as f:
+        return x509.load_pem_x509_certificate(f.read())
+
 def load_ca(ca_key_path: str, ca_cert_path: str):
     with open(ca_key_path, "rb") as f:
         ca_key = serialization.load_pem_private_key(f.read(), password=None)
-    with open(ca_cert_path, "rb") as f:
-        ca_cert = x509.load_pem_x509_certificate(f.read())
-    return ca_key, ca_cert
+    return ca_key, load_ca_cert(ca_cert_path)
+
+@lru_cache(maxsize=4)
+def load_ca_cached(ca_key_path: str, ca_cert_path: str):
+    """同 load_ca，但同一組路徑只讀一次（單張簽發時不用每次都重新解析 CA 私鑰）"""
+    return load_ca(ca_key_path, ca_cert_path)
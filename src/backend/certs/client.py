@@ -2,11 +2,12 @@
 import os
 from cryptography import x509
 from cryptography.x509.oid import NameOID, ExtendedKeyUsageOID
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives import serialization
 from datetime import datetime, timezone, timedelta
 
-from ..ca_utils import load_ca
+from .ca_utils import load_ca_cached
+from .key_pool import get_key_pool
+from .keys import key_pem, signing_hash
 
 def issue_client_cert(
     username: str,
@@ -14,17 +15,15 @@ def issue_client_cert(
     days_valid: int = 365,
     country: str = "TW",
     org: str = "MyOrg",
+    key_alg: str = "rsa2048",
 ):
     os.makedirs(out_dir, exist_ok=True)
     # 1. 產生私鑰
-    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    # 從背景 key pool 拿預先產生好的 key（池子空了才當場產生）
+    key = get_key_pool().take(key_alg)
     key_path = os.path.join(out_dir, "client.key.pem")
     with open(key_path, "wb") as f:
-        f.write(key.private_bytes(
-            encoding    = serialization.Encoding.PEM,
-            format      = serialization.PrivateFormat.TraditionalOpenSSL,
-            encryption_algorithm = serialization.NoEncryption()
-        ))
+        f.write(key_pem(key))
 
     # 2. 建 CSR
     csr = (
@@ -34,14 +33,14 @@ def issue_client_cert(
             x509.NameAttribute(NameOID.ORGANIZATION_NAME, org),
             x509.NameAttribute(NameOID.COMMON_NAME, username),
         ]))
-        .sign(key, hashes.SHA256())
+        .sign(key, signing_hash(key))
     )
     csr_path = os.path.join(out_dir, "client.csr.pem")
     with open(csr_path, "wb") as f:
         f.write(csr.public_bytes(serialization.Encoding.PEM))
 
     # 3. 簽發
-    ca_key, ca_cert = load_ca("certs/ca/ca.key.pem", "certs/ca/ca.cert.pem")
+    ca_key, ca_cert = load_ca_cached("certs/ca/ca.key.pem", "certs/ca/ca.cert.pem")
     cert = (
         x509.CertificateBuilder()
         .subject_name(csr.subject)
@@ -51,7 +50,7 @@ def issue_client_cert(
         .not_valid_before(datetime.now(timezone.utc))
         .not_valid_after(datetime.now(timezone.utc) + timedelta(days=days_valid))
         .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.CLIENT_AUTH]), critical=False)
-        .sign(ca_key, hashes.SHA256())
+        .sign(ca_key, signing_hash(ca_key))
     )
     cert_path = os.path.join(out_dir, "client.cert.pem")
     with open(cert_path, "wb") as f:
@@ -0,0 +1,255 @@
+# backend/certs/key_pool.py
+"""
+預先產生的私鑰池。
+
+RSA 產生金鑰的時間又長又不穩定，所以事先在 worker process 裡產生好放著：
+- 每種演算法維持 KEY_POOL_SIZE 把，低於 KEY_POOL_LOW_WATERMARK 就在背景補滿
+- 每把 key 用 AES-GCM（KEK 見 KEY_POOL_KEK / KEY_POOL_KEK_FILE）加密後各存成一個檔，重啟後還在
+- 取用時刪掉對應的檔；刪除成功才算拿到，多個行程共用同一個目錄也不會把同一把 key 發兩次
+- 池子空了就退回當場產生，不會卡住簽發
+- 背景產生要明確 start() / stop()（或 with KeyPool() as pool），長駐的服務在啟動 / 關閉時呼叫；
+  沒有 start 的池子只會用磁碟上現成的 key，不會開 worker process
+- 同時在 worker 裡產生的 key 最多 workers 把，一把做完才補下一把，所以 stop() 只要等手上那幾把
+"""
+import base64
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import Deque, Dict, Iterable, Optional, Tuple
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from ..keyfile import load_or_create
+from .keys import KEY_ALGORITHMS, generate_key_der, generate_private_key
+
+KEY_POOL_DIR = os.getenv("KEY_POOL_DIR", "certs/key_pool")
+KEY_POOL_SIZE = int(os.getenv("KEY_POOL_SIZE", "32"))
+KEY_POOL_LOW_WATERMARK = int(os.getenv("KEY_POOL_LOW_WATERMARK", "8"))
+KEY_POOL_WORKERS = int(os.getenv("KEY_POOL_WORKERS", "2"))
+KEY_POOL_ALGORITHMS = tuple(a for a in os.getenv("KEY_POOL_ALGORITHMS", "rsa2048").split(",") if a)
+# 長駐服務（main.py 的 lifespan）是否在背景補充共用的池子；設成 0 就只用磁碟上現成的 key
+KEY_POOL_BACKGROUND = os.getenv("KEY_POOL_BACKGROUND", "1") != "0"
+
+
+def load_pool_kek() -> bytes:
+    """同 db._load_kek：優先用 KEY_POOL_KEK（base64），否則讀 KEY_POOL_KEK_FILE，沒有就產生一把。"""
+    env = os.getenv("KEY_POOL_KEK")
+    if env:
+        kek = base64.b64decode(env)
+    else:
+        kek = load_or_create(
+            os.getenv("KEY_POOL_KEK_FILE", "key_pool_kek.bin"), lambda: AESGCM.generate_key(bit_length=256)
+        )
+    if len(kek) not in (16, 24, 32):
+        raise RuntimeError("Key pool KEK must be 128/192/256 bits")
+    return kek
+
+
+class KeyPool:
+    def __init__(
+        self,
+        directory: str = KEY_POOL_DIR,
+        size: int = KEY_POOL_SIZE,
+        low_watermark: int = KEY_POOL_LOW_WATERMARK,
+        algorithms: Iterable[str] = KEY_POOL_ALGORITHMS,
+        workers: int = KEY_POOL_WORKERS,
+        kek: Optional[bytes] = None,
+    ):
+        for alg in algorithms:
+            if alg not in KEY_ALGORITHMS:
+                raise ValueError(f"Unknown key algorithm: {alg}")
+        self.directory = directory
+        self.size = size
+        self.low_watermark = min(low_watermark, size)
+        self.algorithms = tuple(algorithms)
+        self.workers = workers
+        self._aead = AESGCM(kek or load_pool_kek())
+        self._keys: Dict[str, Deque[Tuple[str, bytes]]] = {alg: deque() for alg in self.algorithms}
+        self._inflight: Dict[str, int] = {alg: 0 for alg in self.algorithms}
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._started = False
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+
+    # --- 持久化 ---
+    def _alg_dir(self, alg: str) -> str:
+        return os.path.join(self.directory, alg)
+
+    def _store(self, alg: str, der: bytes) -> str:
+        nonce = os.urandom(12)
+        path = os.path.join(self._alg_dir(alg), os.urandom(16).hex() + ".key")
+        fd = os.open(path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(nonce + self._aead.encrypt(nonce, der, alg.encode()))
+        os.replace(path + ".tmp", path)
+        return path
+
+    def _load_existing(self, alg: str) -> None:
+        directory = self._alg_dir(alg)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        for entry in os.scandir(directory):
+            if not entry.name.endswith(".key"):
+                continue
+            try:
+                with open(entry.path, "rb") as f:
+                    blob = f.read()
+                der = self._aead.decrypt(blob[:12], blob[12:], alg.encode())
+            except Exception:
+                continue  # 壞掉或 KEK 不符的檔案就跳過
+            self._keys[alg].append((entry.path, der))
+
+    def load(self) -> None:
+        """讀進磁碟上現成的 key（不啟動 worker）。"""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+        for alg in self.algorithms:
+            self._load_existing(alg)
+
+    # --- 生命週期 ---
+    def start(self) -> None:
+        """開 worker process 並在背景補滿；服務啟動時呼叫，關閉時一定要配 stop()。"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.load()
+        for alg in self.algorithms:
+            self._refill(alg, force=True)
+
+    def stop(self) -> None:
+        """取消還沒開始的產生工作，只等 worker 手上正在產生的那幾把。"""
+        with self._lock:
+            pool, self._pool, self._started = self._pool, None, False
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "KeyPool":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # --- 補充 ---
+    def _refill(self, alg: str, force: bool = False) -> None:
+        with self._lock:
+            if self._pool is None:
+                return
+            available = len(self._keys[alg])
+            if not force and (available >= self.low_watermark or self._inflight[alg]):
+                return
+            # 一次只交給 worker 它們做得完的量，其他的等做完一把再補（見 _added）
+            need = min(self.size - available - self._inflight[alg], self.workers - self._inflight[alg])
+            if need <= 0:
+                return
+            self._inflight[alg] += need
+            pool = self._pool
+        for _ in range(need):
+            self._submit(alg, pool)
+
+    def _submit(self, alg: str, pool: ProcessPoolExecutor) -> None:
+        """送出一把 key 的產生工作（呼叫前 _inflight 已經先加好）。"""
+        try:
+            future = pool.submit(generate_key_der, alg)
+        except RuntimeError:  # 剛好被 stop() 關掉
+            with self._lock:
+                self._inflight[alg] -= 1
+            return
+        future.add_done_callback(partial(self._added, alg))
+
+    def _added(self, alg: str, future: Future) -> None:
+        try:
+            der = future.result()
+            path = self._store(alg, der)
+        except Exception:
+            # 被 stop() 取消或產生失敗：這一輪就停在這裡，下次 take 再觸發補充
+            with self._lock:
+                self._inflight[alg] -= 1
+            return
+        with self._lock:
+            self._keys[alg].append((path, der))
+            self.generated += 1
+            # 還沒滿就直接把這個名額交給下一把（_inflight 不會中途歸零，fill() 才不會提早結束）
+            pool = self._pool
+            if pool is None or len(self._keys[alg]) + self._inflight[alg] > self.size:
+                self._inflight[alg] -= 1
+                return
+        self._submit(alg, pool)
+
+    # --- 取用 ---
+    def take(self, alg: str = "rsa2048"):
+        """拿一把私鑰（cryptography 物件）；池子空了就當場產生。"""
+        if alg not in self._keys:
+            self.misses += 1
+            return generate_private_key(alg)
+        key = None
+        while key is None:
+            with self._lock:
+                item = self._keys[alg].popleft() if self._keys[alg] else None
+            if item is None:
+                break
+            path, der = item
+            try:
+                os.unlink(path)  # 刪得掉才算是自己拿到的
+            except FileNotFoundError:
+                continue
+            key = serialization.load_der_private_key(der, password=None)
+        self._refill(alg)
+        if key is None:
+            self.misses += 1
+            return generate_private_key(alg)
+        self.hits += 1
+        return key
+
+    def fill(self, timeout: Optional[float] = None) -> None:
+        """阻塞直到每種演算法都補滿（CLI 預先填充用）。"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for alg in self.algorithms:
+            self._refill(alg, force=True)
+        while any(self._inflight.values()):
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "available": {alg: len(q) for alg, q in self._keys.items()},
+                "inflight": dict(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "generated": self.generated,
+            }
+
+
+@lru_cache(maxsize=None)
+def get_key_pool() -> KeyPool:
+    """
+    issue_client_cert / issue_server_cert 共用的池子。這裡只載入現成的 key，不會開 worker：
+    一次性的呼叫端（CLI、script）不會在結束時卡著等背景產生。
+    長駐服務由 start_shared_pool() / stop_shared_pool() 管理（main.py 的 lifespan），
+    啟動後每次 take 讓池子低於 low watermark 都會在背景補滿。
+    """
+    pool = KeyPool()
+    pool.load()
+    return pool
+
+
+def start_shared_pool() -> None:
+    if KEY_POOL_BACKGROUND:
+        get_key_pool().start()
+
+
+def stop_shared_pool() -> None:
+    if get_key_pool.cache_info().currsize:
+        get_key_pool().stop()
@@ -0,0 +1,41 @@
+# backend/certs/keys.py
+"""憑證私鑰的演算法選項（bulk 簽發與 client / server 簽發共用）。"""
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+# rsa2048 跟原本 issue_client_cert 一樣；ec-p256 / ed25519 產生速度快好幾個數量級
+KEY_ALGORITHMS = ("rsa2048", "rsa3072", "rsa4096", "ec-p256", "ed25519")
+
+
+def generate_private_key(alg: str = "rsa2048"):
+    if alg.startswith("rsa"):
+        return rsa.generate_private_key(public_exponent=65537, key_size=int(alg[3:]))
+    if alg == "ec-p256":
+        return ec.generate_private_key(ec.SECP256R1())
+    if alg == "ed25519":
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Unknown key algorithm: {alg}")
+
+
+def generate_key_der(alg: str = "rsa2048") -> bytes:
+    """PKCS#8 DER；給 worker process 用（回傳 bytes 才能 pickle 回主行程）。"""
+    return generate_private_key(alg).private_bytes(
+        serialization.Encoding.DER,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+
+
+def key_pem(key) -> bytes:
+    # RSA 沿用原本的 TraditionalOpenSSL 格式，EC / Ed25519 用 PKCS#8（Ed25519 只支援 PKCS#8）
+    fmt = (
+        serialization.PrivateFormat.TraditionalOpenSSL
+        if isinstance(key, rsa.RSAPrivateKey)
+        else serialization.PrivateFormat.PKCS8
+    )
+    return key.private_bytes(serialization.Encoding.PEM, fmt, serialization.NoEncryption())
+
+
+def signing_hash(key):
+    """CSR / 憑證簽章用的雜湊；Ed25519 不能指定雜湊，要傳 None。"""
+    return None if isinstance(key, ed25519.Ed25519PrivateKey) else hashes.SHA256()
@@ -0,0 +1,219 @@
+# backend/certs/mtls.py
+"""
+mTLS client certificate 驗證。
+
+- 以 DER 的 SHA-256 指紋為 key，快取解析後的憑證與驗證結果；
+  快取 TTL 不超過憑證的 notAfter，所以過期的憑證不會因為快取而繼續通過。
+- 驗證：由 MTLS_CA_CERT 這張 CA 直接簽發、在有效期間內、EKU 允許 clientAuth。
+- 撤銷：MTLS_CRL_PATH 的 CRL（PEM 或 DER，需由同一張 CA 簽章）載入成 serial number 的 set，
+  檔案 mtime 變了就重新載入（最多每 MTLS_CRL_CHECK_INTERVAL 秒檢查一次）。
+  撤銷是每次請求都查（set lookup），不會被驗證結果的快取蓋掉。
+  CRL 的 nextUpdate 過了、或檔案在卻一次都沒載入成功時查不到撤銷狀態，
+  丟 RevocationUnavailable（路由回 503），不會當成「沒被撤銷」放行。
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import FrozenSet, Optional, Tuple
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.x509.oid import ExtendedKeyUsageOID
+
+from .ca_utils import load_ca_cert
+
+MTLS_CA_CERT = os.getenv("MTLS_CA_CERT", "certs/ca/ca.cert.pem")
+MTLS_CRL_PATH = os.getenv("MTLS_CRL_PATH", "certs/ca/ca.crl.pem")
+MTLS_CRL_CHECK_INTERVAL = float(os.getenv("MTLS_CRL_CHECK_INTERVAL", "10"))
+MTLS_CACHE_TTL = float(os.getenv("MTLS_CACHE_TTL", "3600"))
+MTLS_CACHE_SIZE = int(os.getenv("MTLS_CACHE_SIZE", "10000"))
+# 驗證失敗的結果也快取，但時間短一點（例如 CA 換了之後要能很快恢復）
+MTLS_NEGATIVE_TTL = 30.0
+
+
+class CertRejected(Exception):
+    def __init__(self, reason: str, revoked: bool = False):
+        super().__init__(reason)
+        self.reason = reason
+        self.revoked = revoked
+
+
+class RevocationUnavailable(Exception):
+    """CRL 過期或讀不到，無法判斷憑證有沒有被撤銷。"""
+
+
+@dataclass(frozen=True)
+class _Entry:
+    cert: Optional[x509.Certificate]
+    error: Optional[str]
+    expires: float
+
+
+class RevocationList:
+    """
+    CRL 裡的 serial number。
+
+    - 檔案從來沒出現過：還沒發過 CRL，當成空集合。
+    - 載入過之後檔案不見了、或新檔載入失敗（寫到一半 / 簽章不對）：沿用上次的 set，下次再試；
+      舊的 set 一樣受 nextUpdate 限制，過期就不再採信。
+    """
+
+    def __init__(self, path: str, ca_cert: x509.Certificate, check_interval: float = MTLS_CRL_CHECK_INTERVAL):
+        self.path = path
+        self.ca_cert = ca_cert
+        self.check_interval = check_interval
+        self.serials: FrozenSet[int] = frozenset()
+        self.next_update: Optional[datetime] = None
+        self.loaded_mtime: Optional[float] = None
+        self.error: Optional[str] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _load(self) -> Tuple[FrozenSet[int], Optional[datetime]]:
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if b"-----BEGIN" in data:
+            crl = x509.load_pem_x509_crl(data)
+        else:
+            crl = x509.load_der_x509_crl(data)
+        if crl.issuer != self.ca_cert.subject or not crl.is_signature_valid(self.ca_cert.public_key()):
+            raise ValueError(f"CRL {self.path} is not signed by the configured CA")
+        return frozenset(r.serial_number for r in crl), crl.next_update_utc
+
+    def refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return
+        with self._lock:
+            if not force and now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except FileNotFoundError:
+                return
+            if mtime == self.loaded_mtime and not force:
+                return
+            try:
+                self.serials, self.next_update = self._load()
+            except Exception as e:
+                self.error = f"CRL {self.path} could not be loaded: {e}"
+                raise
+            self.loaded_mtime = mtime
+            self.error = None
+            self.reloads += 1
+
+    def is_revoked(self, serial: int) -> bool:
+        """查不到可信的撤銷狀態時丟 RevocationUnavailable。"""
+        try:
+            self.refresh()
+        except Exception:
+            pass  # 原因記在 self.error，有舊的 set 就先用舊的
+        if self.loaded_mtime is None and self.error:
+            raise RevocationUnavailable(self.error)
+        if self.next_update is not None and self.next_update <= datetime.now(timezone.utc):
+            raise RevocationUnavailable(f"CRL {self.path} expired at {self.next_update.isoformat()}")
+        return serial in self.serials
+
+
+class ClientCertVerifier:
+    def __init__(
+        self,
+        ca_cert: x509.Certificate,
+        crl_path: Optional[str] = MTLS_CRL_PATH,
+        ttl: float = MTLS_CACHE_TTL,
+        max_entries: int = MTLS_CACHE_SIZE,
+    ):
+        self.ca_cert = ca_cert
+        self.revocations = RevocationList(crl_path, ca_cert) if crl_path else None
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[bytes, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _check(self, der: bytes) -> Tuple[Optional[x509.Certificate], Optional[str], float]:
+        """完整驗證一次，回傳 (cert, 錯誤原因, 快取到期的 epoch 秒數)。"""
+        now = time.time()
+        try:
+            cert = x509.load_der_x509_certificate(der)
+        except ValueError:
+            return None, "Malformed client certificate", now + MTLS_NEGATIVE_TTL
+        not_after = cert.not_valid_after_utc.timestamp()
+        if cert.issuer != self.ca_cert.subject:
+            return None, "Client certificate not issued by trusted CA", now + MTLS_NEGATIVE_TTL
+        try:
+            cert.verify_directly_issued_by(self.ca_cert)
+        except (ValueError, TypeError, InvalidSignature):
+            return None, "Client certificate signature invalid", now + MTLS_NEGATIVE_TTL
+        if cert.not_valid_before_utc > datetime.now(timezone.utc):
+            return None, "Client certificate not yet valid", now + MTLS_NEGATIVE_TTL
+        if not_after <= now:
+            return None, "Client certificate expired", now + MTLS_NEGATIVE_TTL
+        try:
+            eku = cert.extensions.get_extension_for_class(x509.ExtendedKeyUsage).value
+            if ExtendedKeyUsageOID.CLIENT_AUTH not in eku:
+                return None, "Certificate not valid for client authentication", now + MTLS_NEGATIVE_TTL
+        except x509.ExtensionNotFound:
+            pass
+        return cert, None, min(now + self.ttl, not_after)
+
+    def verify(self, der: bytes) -> x509.Certificate:
+        """
+        回傳驗證過的憑證；不通過丟 CertRejected，CRL 不可用時丟 RevocationUnavailable。
+        快取命中時只是一次 dict 查詢 + 撤銷 set 查詢。
+        """
+        fingerprint = hashlib.sha256(der).digest()
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(fingerprint)
+            if entry is not None and entry.expires > now:
+                self._cache.move_to_end(fingerprint)
+                self.hits += 1
+            else:
+                entry = None
+                self.misses += 1
+        if entry is None:
+            entry = _Entry(*self._check(der))
+            with self._lock:
+                self._cache[fingerprint] = entry
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        if entry.error:
+            raise CertRejected(entry.error)
+        if self.revocations is not None and self.revocations.is_revoked(entry.cert.serial_number):
+            raise CertRejected("Client certificate revoked", revoked=True)
+        return entry.cert
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "revoked_serials": len(self.revocations.serials) if self.revocations else 0,
+            "crl_reloads": self.revocations.reloads if self.revocations else 0,
+            "crl_next_update": (
+                self.revocations.next_update.isoformat()
+                if self.revocations and self.revocations.next_update else None
+            ),
+        }
+
+
+_verifier: Optional[ClientCertVerifier] = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier() -> ClientCertVerifier:
+    """第一次用到才讀 CA（沒有設定 mTLS 的環境照樣可以啟動）。"""
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = ClientCertVerifier(load_ca_cert(MTLS_CA_CERT))
+    return _verifier
@@ -2,11 +2,12 @@
 import os
 from cryptography import x509
 from cryptography.x509.oid import NameOID, ExtendedKeyUsageOID
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives import serialization
 from datetime import datetime, timezone, timedelta
 
-from ..ca_utils import load_ca
+from .ca_utils import load_ca_cached
+from .key_pool import get_key_pool
+from .keys import key_pem, signing_hash
 
 def issue_server_cert(
     common_name: str = "localhost",
@@ -17,17 +18,15 @@ def issue_server_cert(
     locality: str= "Taipei",
     org: str     = "MyOrg",
     san: list[str] = None,
+    key_alg: str = "rsa2048",
 ):
     os.makedirs(out_dir, exist_ok=True)
     # 1. 產生私鑰
-    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    # 從背景 key pool 拿預先產生好的 key（池子空了才當場產生）
+    key = get_key_pool().take(key_alg)
     key_path = os.path.join(out_dir, "server.key.pem")
     with open(key_path, "wb") as f:
-        f.write(key.private_bytes(
-            encoding    = serialization.Encoding.PEM,
-            format      = serialization.PrivateFormat.TraditionalOpenSSL,
-            encryption_algorithm = serialization.NoEncryption()
-        ))
+        f.write(key_pem(key))
 
     # 2. 建 CSR
     builder = x509.CertificateSigningRequestBuilder().subject_name(x509.Name([
@@ -42,13 +41,13 @@ def issue_server_cert(
             x509.SubjectAlternativeName([x509.DNSName(n) for n in san]),
             critical=False
         )
-    csr = builder.sign(key, hashes.SHA256())
+    csr = builder.sign(key, signing_hash(key))
     csr_path = os.path.join(out_dir, "server.csr.pem")
     with open(csr_path, "wb") as f:
         f.write(csr.public_bytes(serialization.Encoding.PEM))
 
     # 3. 簽發
-    ca_key, ca_cert = load_ca("certs/ca/ca.key.pem", "certs/ca/ca.cert.pem")
+    ca_key, ca_cert = load_ca_cached("certs/ca/ca.key.pem", "certs/ca/ca.cert.pem")
     cert_builder = (
         x509.CertificateBuilder()
         .subject_name(csr.subject)
@@ -64,7 +63,7 @@ def issue_server_cert(
             x509.SubjectAlternativeName([x509.DNSName(n) for n in san]),
             critical=False
         )
-    cert = cert_builder.sign(ca_key, hashes.SHA256())
+    cert = cert_builder.sign(ca_key, signing_hash(ca_key))
 
     cert_path = os.path.join(out_dir, "server.cert.pem")
     with open(cert_path, "wb") as f:
@@ -1,21 +1,304 @@
 # simplefinal/backend/db.py
+"""
+TOTP secret 的儲存層。
 
-# 用一个最简单的 dict 当「假数据库」
-_store: dict[str, dict[str, str | bool]] = {}
+- TOTP_STORE=sqlite（預設，WAL 模式，同一台機器上多個 uvicorn worker 可共用）
+- TOTP_STORE=mysql（連線池，沿用 webpage 的 secure_share 資料庫，可跨主機）
+- TOTP_STORE=memory（舊的行程內 dict，只給測試用）
 
+secret 一律用 AES-GCM 在 KEK 底下加密後才落地（AAD 綁 user_id），
+外面再包一層短 TTL 的 read-through cache。
+"""
+import base64
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Dict, Tuple
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from .keyfile import load_or_create
+
+
+# --- 共用的連線工具（webauthn 的 store 也會用）---
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=10000")
+    return conn
+
+
+def mysql_pool(pool_name: str):
+    """建立 mysql.connector 連線池，連線設定跟 webpage/app.py 一樣讀 DB_* 環境變數。"""
+    from mysql.connector import pooling
+    return pooling.MySQLConnectionPool(
+        pool_name=pool_name,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "8")),
+        pool_reset_session=True,
+        host=os.getenv("DB_HOST", "localhost"),
+        user=os.getenv("DB_USER", "root"),
+        password=os.getenv("DB_PASSWORD", ""),
+        database=os.getenv("DB_NAME", "secure_share"),
+    )
+
+
+# --- secret 加密 ---
+@lru_cache(maxsize=None)
+def _load_kek() -> bytes:
+    """
+    KEK 只讀一次就快取在記憶體：優先用 TOTP_KEK（base64），
+    否則讀 TOTP_KEK_FILE，檔案不存在時產生一把新的。
+    """
+    env = os.getenv("TOTP_KEK")
+    if env:
+        kek = base64.b64decode(env)
+    else:
+        # 多個 worker 同時第一次啟動也只會產生一把（見 keyfile.py）
+        kek = load_or_create(
+            os.getenv("TOTP_KEK_FILE", "totp_kek.bin"), lambda: AESGCM.generate_key(bit_length=256)
+        )
+    if len(kek) not in (16, 24, 32):
+        raise RuntimeError("TOTP KEK must be 128/192/256 bits")
+    return kek
+
+
+def seal_secret(user_id: str, secret: str) -> bytes:
+    nonce = os.urandom(12)
+    return nonce + AESGCM(_load_kek()).encrypt(nonce, secret.encode(), user_id.encode())
+
+
+def open_secret(user_id: str, blob: bytes) -> str:
+    return AESGCM(_load_kek()).decrypt(blob[:12], blob[12:], user_id.encode()).decode()
+
+
+# --- 儲存介面 ---
+class TotpStore(ABC):
+    """回傳 / 接收的 secret 都是明文；實作自己負責加密落地。"""
+
+    @abstractmethod
+    def save_totp_secret(self, user_id: str, secret: str) -> None: ...
+
+    @abstractmethod
+    def get_totp_entry(self, user_id: str) -> Tuple[str, bool]:
+        """回傳 (secret, enabled)，找不到就丟 KeyError。"""
+
+    @abstractmethod
+    def enable_totp(self, user_id: str) -> None: ...
+
+    @abstractmethod
+    def record_totp_step(self, user_id: str, step: int) -> bool:
+        """
+        原子地把最後接受的 time-step 推進到 step；
+        step 不大於已記錄的值（重放）就回傳 False。
+        """
+
+    def get_totp_secret(self, user_id: str) -> str:
+        return self.get_totp_entry(user_id)[0]
+
+    def is_totp_enabled(self, user_id: str) -> bool:
+        try:
+            return self.get_totp_entry(user_id)[1]
+        except KeyError:
+            return False
+
+
+class MemoryTotpStore(TotpStore):
+    def __init__(self):
+        self._store: Dict[str, Dict[str, str | bool]] = {}
+
+    def save_totp_secret(self, user_id: str, secret: str) -> None:
+        self._store[user_id] = {"secret": secret, "enabled": False}
+
+    def get_totp_entry(self, user_id: str) -> Tuple[str, bool]:
+        entry = self._store.get(user_id)
+        if not entry:
+            raise KeyError(f"No TOTP secret for {user_id}")
+        return entry["secret"], bool(entry["enabled"])  # type: ignore
+
+    def enable_totp(self, user_id: str) -> None:
+        if user_id not in self._store:
+            raise KeyError(f"No TOTP secret for {user_id}")
+        self._store[user_id]["enabled"] = True
+
+    def record_totp_step(self, user_id: str, step: int) -> bool:
+        entry = self._store.get(user_id)
+        if not entry or entry.get("last_step", -1) >= step:  # type: ignore
+            return False
+        entry["last_step"] = step
+        return True
+
+
+class SqliteTotpStore(TotpStore):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS totp_secrets (
+        user_id    TEXT PRIMARY KEY,
+        secret     BLOB NOT NULL,
+        enabled    INTEGER NOT NULL DEFAULT 0,
+        last_step  INTEGER NOT NULL DEFAULT -1,
+        updated_at REAL NOT NULL
+    )
+    """
+
+    def __init__(self, path: str = "totp.db"):
+        self._conn = connect_sqlite(path)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(self.SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(totp_secrets)")}
+            if "last_step" not in columns:
+                self._conn.execute("ALTER TABLE totp_secrets ADD COLUMN last_step INTEGER NOT NULL DEFAULT -1")
+
+    def save_totp_secret(self, user_id: str, secret: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO totp_secrets (user_id, secret, enabled, updated_at) VALUES (?, ?, 0, ?)",
+                (user_id, seal_secret(user_id, secret), time.time()),
+            )
+
+    def get_totp_entry(self, user_id: str) -> Tuple[str, bool]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT secret, enabled FROM totp_secrets WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if not row:
+            raise KeyError(f"No TOTP secret for {user_id}")
+        return open_secret(user_id, row[0]), bool(row[1])
+
+    def enable_totp(self, user_id: str) -> None:
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE totp_secrets SET enabled = 1, updated_at = ? WHERE user_id = ?", (time.time(), user_id)
+            )
+        if cur.rowcount == 0:
+            raise KeyError(f"No TOTP secret for {user_id}")
+
+    def record_totp_step(self, user_id: str, step: int) -> bool:
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE totp_secrets SET last_step = ? WHERE user_id = ? AND last_step < ?", (step, user_id, step)
+            )
+        return cur.rowcount == 1
+
+
+class MySQLTotpStore(TotpStore):
+    """使用 webpage/schema.sql 裡的 totp_secrets 表。"""
+
+    def __init__(self):
+        self._pool = mysql_pool("totp")
+
+    def _execute(self, sql: str, params: tuple, fetch: bool = False):
+        conn = self._pool.get_connection()
+        try:
+            cur = conn.cursor(prepared=True)
+            cur.execute(sql, params)
+            result = cur.fetchone() if fetch else cur.rowcount
+            cur.close()
+            if not fetch:
+                conn.commit()
+            return result
+        finally:
+            conn.close()  # 歸還連線池
+
+    def save_totp_secret(self, user_id: str, secret: str) -> None:
+        self._execute(
+            "REPLACE INTO totp_secrets (user_id, secret, enabled) VALUES (%s, %s, 0)",
+            (user_id, seal_secret(user_id, secret)),
+        )
+
+    def get_totp_entry(self, user_id: str) -> Tuple[str, bool]:
+        row = self._execute("SELECT secret, enabled FROM totp_secrets WHERE user_id = %s", (user_id,), fetch=True)
+        if not row:
+            raise KeyError(f"No TOTP secret for {user_id}")
+        return open_secret(user_id, bytes(row[0])), bool(row[1])
+
+    def enable_totp(self, user_id: str) -> None:
+        if self._execute("UPDATE totp_secrets SET enabled = 1 WHERE user_id = %s", (user_id,)) == 0:
+            # MySQL 在值沒變時 rowcount 也是 0，再確認一次是不是真的不存在
+            self.get_totp_entry(user_id)
+
+    def record_totp_step(self, user_id: str, step: int) -> bool:
+        return self._execute(
+            "UPDATE totp_secrets SET last_step = %s WHERE user_id = %s AND last_step < %s", (step, user_id, step)
+        ) == 1
+
+
+class CachedTotpStore(TotpStore):
+    """
+    read-through cache：讀取先查本地（TTL 內有效），寫入直接打後端並讓本地失效。
+    其他 worker 的寫入最多延遲 ttl 秒才看得到，所以 TTL 要保持很短。
+    """
+
+    def __init__(self, backend: TotpStore, ttl: float = 30.0, max_entries: int = 10000):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache: Dict[str, Tuple[str, bool, float]] = {}
+        self._lock = threading.Lock()
+
+    def _invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def save_totp_secret(self, user_id: str, secret: str) -> None:
+        self.backend.save_totp_secret(user_id, secret)
+        self._invalidate(user_id)
+
+    def get_totp_entry(self, user_id: str) -> Tuple[str, bool]:
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(user_id)
+        if hit and hit[2] > now:
+            return hit[0], hit[1]
+        secret, enabled = self.backend.get_totp_entry(user_id)
+        with self._lock:
+            if len(self._cache) >= self.max_entries:
+                self._cache.clear()
+            self._cache[user_id] = (secret, enabled, now + self.ttl)
+        return secret, enabled
+
+    def enable_totp(self, user_id: str) -> None:
+        self.backend.enable_totp(user_id)
+        self._invalidate(user_id)
+
+    def record_totp_step(self, user_id: str, step: int) -> bool:
+        # 重放檢查必須打後端（跨 worker 的原子更新），不能走快取
+        return self.backend.record_totp_step(user_id, step)
+
+
+@lru_cache(maxsize=None)
+def get_totp_store() -> TotpStore:
+    kind = os.getenv("TOTP_STORE", "sqlite").lower()
+    if kind == "memory":
+        return MemoryTotpStore()
+    if kind == "sqlite":
+        backend: TotpStore = SqliteTotpStore(os.getenv("TOTP_DB_PATH", "totp.db"))
+    elif kind == "mysql":
+        backend = MySQLTotpStore()
+    else:
+        raise RuntimeError(f"Unknown TOTP_STORE: {kind}")
+    return CachedTotpStore(backend, ttl=float(os.getenv("TOTP_CACHE_TTL", "30")))
+
+
+# --- 舊介面：routes/totp.py 直接呼叫這幾個函式 ---
 def save_totp_secret(user_id: str, secret: str) -> None:
     """存下这个 user 的 TOTP secret，并默认还没启用 2FA"""
-    _store[user_id] = {"secret": secret, "enabled": False}
+    get_totp_store().save_totp_secret(user_id, secret)
 
 def get_totp_secret(user_id: str) -> str:
-    """取出存在 _store 里的 secret"""
-    entry = _store.get(user_id)
-    if not entry:
-        raise KeyError(f"No TOTP secret for {user_id}")
-    return entry["secret"]  # type: ignore
+    """取出这个 user 的 secret，找不到丟 KeyError"""
+    return get_totp_store().get_totp_secret(user_id)
 
 def enable_totp(user_id: str) -> None:
     """把这个 user 的 2FA 标记设为已启用"""
-    if user_id not in _store:
-        raise KeyError(f"No TOTP secret for {user_id}")
-    _store[user_id]["enabled"] = True  # type: ignore
+    get_totp_store().enable_totp(user_id)
+
+def is_totp_enabled(user_id: str) -> bool:
+    return get_totp_store().is_totp_enabled(user_id)
+
+def record_totp_step(user_id: str, step: int) -> bool:
+    """記錄已使用的 time-step；重放時回傳 False"""
+    return get_totp_store().record_totp_step(user_id, step)
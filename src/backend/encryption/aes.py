@@ -1,7 +1,8 @@
 # encryption/aes.py
 import os
+import struct
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from typing import Tuple
+from typing import Iterable, Iterator, Tuple
 
 def aes_encrypt(key: bytes, data: bytes) -> Tuple[bytes, bytes]:
     """
@@ -19,3 +20,123 @@ def aes_decrypt(key: bytes, ciphertext: bytes, iv: bytes) -> bytes:
     """
     aesgcm = AESGCM(key)
     return aesgcm.decrypt(iv, ciphertext, None)
+
+
+# --- 分段 (framed) AES-GCM 串流格式 ---
+#
+#   header : MAGIC(4) | version(1) | frame_size(4, BE) | frame_count(8, BE)
+#   frames : frame_count 個 AES-GCM 密文，每個 frame_size + 16 bytes（最後一個可較短）
+#
+# 第 i 個 frame 的 nonce = base_iv XOR i（12 bytes big-endian），
+# 整個 header 當作每個 frame 的 AAD，所以竄改 frame_size / frame_count 或
+# 調換、截斷 frame 都會讓解密失敗。
+
+STREAM_ALG = "AES-GCM-STREAM"
+STREAM_MAGIC = b"AGS1"
+STREAM_VERSION = 1
+STREAM_HEADER = struct.Struct(">4sBIQ")
+STREAM_HEADER_LEN = STREAM_HEADER.size
+TAG_LEN = 16
+DEFAULT_FRAME_SIZE = 1024 * 1024
+
+def frame_count_for(total_size: int, frame_size: int = DEFAULT_FRAME_SIZE) -> int:
+    """明文長度對應的 frame 數；空檔案也會有一個（只含 tag 的）frame。"""
+    return max(1, -(-total_size // frame_size))
+
+def build_stream_header(frame_size: int, frame_count: int) -> bytes:
+    return STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, frame_size, frame_count)
+
+def parse_stream_header(header: bytes) -> Tuple[int, int]:
+    """解析 header，回傳 (frame_size, frame_count)。"""
+    if len(header) < STREAM_HEADER_LEN:
+        raise ValueError("Truncated stream header")
+    magic, version, frame_size, frame_count = STREAM_HEADER.unpack(header[:STREAM_HEADER_LEN])
+    if magic != STREAM_MAGIC or version != STREAM_VERSION:
+        raise ValueError("Not an AES-GCM stream container")
+    if frame_size <= 0 or frame_count <= 0:
+        raise ValueError("Invalid stream header")
+    return frame_size, frame_count
+
+def frame_ciphertext_range(index: int, frame_size: int, ciphertext_size: int) -> Tuple[int, int]:
+    """第 index 個 frame 在整個密文物件裡的 [start, end) 位移。"""
+    start = STREAM_HEADER_LEN + index * (frame_size + TAG_LEN)
+    return start, min(start + frame_size + TAG_LEN, ciphertext_size)
+
+def stream_plaintext_size(ciphertext_size: int, frame_size: int, frame_count: int) -> int:
+    """由密文大小推回明文大小，順便檢查跟 header 是否一致。"""
+    size = ciphertext_size - STREAM_HEADER_LEN - frame_count * TAG_LEN
+    if not (frame_count - 1) * frame_size <= size <= frame_count * frame_size:
+        raise ValueError("Ciphertext size does not match stream header")
+    return size
+
+def frame_nonce(base_iv: bytes, index: int) -> bytes:
+    if len(base_iv) != 12:
+        raise ValueError("Base IV must be 12 bytes")
+    return (int.from_bytes(base_iv, "big") ^ index).to_bytes(12, "big")
+
+def aes_encrypt_frame(aesgcm: AESGCM, base_iv: bytes, header: bytes, index: int, data: bytes) -> bytes:
+    return aesgcm.encrypt(frame_nonce(base_iv, index), data, header)
+
+def aes_decrypt_frame(aesgcm: AESGCM, base_iv: bytes, header: bytes, index: int, frame: bytes) -> bytes:
+    return aesgcm.decrypt(frame_nonce(base_iv, index), frame, header)
+
+def aes_encrypt_stream(
+    key: bytes,
+    iv: bytes,
+    chunks: Iterable[bytes],
+    total_size: int,
+    frame_size: int = DEFAULT_FRAME_SIZE,
+) -> Iterator[bytes]:
+    """
+    把任意切法的明文 chunks 加密成分段格式，先 yield header 再逐個 yield frame。
+    iv 由呼叫端產生（os.urandom(12)），total_size 用來在 header 裡寫入 frame 數。
+    記憶體用量最多一個 frame。
+    """
+    frame_count = frame_count_for(total_size, frame_size)
+    header = build_stream_header(frame_size, frame_count)
+    aesgcm = AESGCM(key)
+    yield header
+
+    buf = bytearray()
+    index = 0
+    seen = 0
+    for chunk in chunks:
+        seen += len(chunk)
+        buf += chunk
+        while len(buf) >= frame_size and index < frame_count - 1:
+            yield aes_encrypt_frame(aesgcm, iv, header, index, bytes(buf[:frame_size]))
+            del buf[:frame_size]
+            index += 1
+    if seen != total_size:
+        raise ValueError(f"Expected {total_size} bytes of plaintext, got {seen}")
+    yield aes_encrypt_frame(aesgcm, iv, header, index, bytes(buf))
+
+def aes_decrypt_stream(key: bytes, iv: bytes, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    aes_encrypt_stream 的反向操作：讀入任意切法的密文 chunks，
+    每湊滿一個 frame 就解密並 yield 明文。frame 數或結尾不符會丟 ValueError，
+    任何 frame 驗證失敗則丟 cryptography 的 InvalidTag。
+    """
+    aesgcm = AESGCM(key)
+    buf = bytearray()
+    header = None
+    frame_size = frame_count = 0
+    index = 0
+    for chunk in chunks:
+        buf += chunk
+        if header is None:
+            if len(buf) < STREAM_HEADER_LEN:
+                continue
+            header = bytes(buf[:STREAM_HEADER_LEN])
+            frame_size, frame_count = parse_stream_header(header)
+            del buf[:STREAM_HEADER_LEN]
+        # 最後一個 frame 要等到輸入結束才知道長度，所以這裡只處理前面的 frame
+        while index < frame_count - 1 and len(buf) >= frame_size + TAG_LEN:
+            yield aes_decrypt_frame(aesgcm, iv, header, index, bytes(buf[:frame_size + TAG_LEN]))
+            del buf[:frame_size + TAG_LEN]
+            index += 1
+    if header is None or index != frame_count - 1:
+        raise ValueError("Truncated stream")
+    if not TAG_LEN <= len(buf) <= frame_size + TAG_LEN:
+        raise ValueError("Invalid final frame length")
+    yield aes_decrypt_frame(aesgcm, iv, header, index, bytes(buf))
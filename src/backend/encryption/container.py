@@ -0,0 +1,112 @@
+# encryption/container.py
+"""
+單一物件的檔案格式：<file_id>.enc = 檔案 header + 前端產生的密文（AES-GCM 或 AES-GCM-STREAM）。
+
+    header : MAGIC "EFH1"(4) | header_len(4, BE，含 MAGIC) | version(1)
+             | 依序 8 個欄位，各為 len(2, BE) + bytes：
+               alg, iv, wrapped_dek, kek_id, wrap, key_version, filename, owner
+
+取代原本 <file_id>.bin（iv / alg / filename / owner 放在 metadata）加上 <file_id>.key 的兩個物件，
+下載時一次 ranged read 就能拿到解包 DEK 需要的所有資訊（通常連串流格式的 frame header 一起）。
+header 本身沒有加密也沒有驗證：wrapped DEK 靠 KEK 的 AAD / RSA-OAEP 保護，
+密文內容靠 AES-GCM 保護，跟原本放在 metadata 時一樣。
+"""
+import hashlib
+import struct
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+CONTAINER_MAGIC = b"EFH1"
+CONTAINER_VERSION = 1
+_PREAMBLE = struct.Struct(">4sIB")
+_FIELD_LEN = struct.Struct(">H")
+_FIELDS = ("alg", "iv", "wrapped_dek", "kek_id", "wrap", "key_version", "filename", "owner")
+_BINARY = ("iv", "wrapped_dek")
+
+# 物件 metadata 裡記錄 header 摘要的欄位：header 跟物件大小是分開讀的，
+# 用它確認兩次讀到的是同一版（rewrap 會原地覆寫物件，header 長度可能改變）
+HEADER_DIGEST_KEY = "header_sha256"
+
+# 下載時第一次讀取的長度：一般 header 只有幾百 bytes，這樣連後面的串流 header 也一起讀到
+HEADER_PREFETCH = 4096
+
+
+@dataclass
+class FileHeader:
+    alg: str
+    iv: bytes
+    wrapped_dek: bytes
+    kek_id: str = ""        # 空字串表示 wrapped_dek 是直接用 KMS 公鑰 RSA 包的
+    wrap: str = ""
+    key_version: str = ""
+    filename: str = ""
+    owner: str = ""
+
+    def key_metadata(self) -> dict:
+        """跟 .key 物件 metadata 相同格式的欄位（給 KEK / key version 判斷共用）。"""
+        if self.kek_id:
+            return {"kek_id": self.kek_id, "wrap": self.wrap}
+        return {"key_version": self.key_version} if self.key_version else {}
+
+
+def pack_header(header: FileHeader) -> bytes:
+    body = bytearray()
+    for name in _FIELDS:
+        value = getattr(header, name)
+        raw = value if name in _BINARY else value.encode("utf-8")
+        if len(raw) > 0xFFFF:
+            raise ValueError(f"{name} too long")
+        body += _FIELD_LEN.pack(len(raw)) + raw
+    return _PREAMBLE.pack(CONTAINER_MAGIC, _PREAMBLE.size + len(body), CONTAINER_VERSION) + bytes(body)
+
+
+def header_digest(header: bytes) -> str:
+    return hashlib.sha256(header).hexdigest()[:32]
+
+
+def header_length(prefix: bytes) -> int:
+    """由物件開頭（至少 9 bytes）算出整個 header 的長度。"""
+    if len(prefix) < _PREAMBLE.size:
+        raise ValueError("Truncated file header")
+    magic, length, version = _PREAMBLE.unpack(prefix[:_PREAMBLE.size])
+    if magic != CONTAINER_MAGIC or version != CONTAINER_VERSION:
+        raise ValueError("Not a file container")
+    if length < _PREAMBLE.size:
+        raise ValueError("Invalid file header")
+    return length
+
+
+def parse_header(data: bytes) -> Tuple[FileHeader, int]:
+    """解析 header，回傳 (FileHeader, 密文開始的位移)。data 必須包含整個 header。"""
+    length = header_length(data)
+    if len(data) < length:
+        raise ValueError("Truncated file header")
+    pos = _PREAMBLE.size
+    values = {}
+    for name in _FIELDS:
+        if pos + _FIELD_LEN.size > length:
+            raise ValueError("Truncated file header")
+        (n,) = _FIELD_LEN.unpack_from(data, pos)
+        pos += _FIELD_LEN.size
+        raw = bytes(data[pos:pos + n])
+        if pos + n > length:
+            raise ValueError("Truncated file header")
+        pos += n
+        values[name] = raw if name in _BINARY else raw.decode("utf-8")
+    return FileHeader(**values), length
+
+
+async def read_header(
+    storage, name: str, prefix: bytes = b"", generation: Optional[str] = None
+) -> Tuple[FileHeader, int, bytes]:
+    """
+    從 storage（任何有 async get_range 的物件）讀出 header；prefix 是已經讀到的物件開頭，可以省一次讀取。
+    generation 會傳給 get_range，把讀取固定在 stat 到的那一版。
+    回傳 (header, 密文開始的位移, 讀到的物件開頭 bytes)。
+    """
+    head = prefix or await storage.get_range(name, 0, HEADER_PREFETCH, generation=generation)
+    length = header_length(head)
+    if length > len(head):
+        head += await storage.get_range(name, len(head), length, generation=generation)
+    header, offset = parse_header(head)
+    return header, offset, head
@@ -0,0 +1,41 @@
+# backend/keyfile.py
+"""
+「讀不到就產生一把」的金鑰檔（TOTP KEK、key pool KEK 等共用）。
+
+多個 worker 同時第一次啟動時：每個人都先把自己產生的 key 完整寫進暫存檔，
+再用 os.link 放到正式路徑（目標已存在就失敗，不會覆蓋）。搶輸的一方改讀贏家的檔，
+所以大家拿到的是同一把 key；正式路徑上也永遠不會出現寫到一半的檔案。
+"""
+import os
+import tempfile
+from typing import Callable
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def load_or_create(path: str, generate: Callable[[], bytes], mode: int = 0o600) -> bytes:
+    """回傳 path 的內容；檔案不存在時寫入 generate() 的結果（權限 mode）並回傳。"""
+    try:
+        return _read(path)
+    except FileNotFoundError:
+        pass
+    data = generate()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".key")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, mode)
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            return _read(path)  # 別的行程先建好了，用它的
+    finally:
+        os.unlink(tmp)
+    return data
@@ -0,0 +1,129 @@
+# backend/kms/__main__.py
+"""
+KMS / 金鑰維運工具：
+
+    python -m backend.kms rewrap [--concurrency 8] [--rate 50] [--checkpoint rewrap.json] [--restart]
+    python -m backend.kms migrate-layout [--concurrency 8] [--rate 50] [--checkpoint migrate.json] [--restart]
+
+rewrap：把 storage 裡所有的 key 物件帶到目前的 KMS key version（GCP_KEY_VERSION / LOCAL_KMS_KEY_VERSION）：
+- keks/<kek_id>.key：還在舊版本的 data-KEK 重新包到新版本（KEK 本身不變，檔案的 DEK 不用動）
+- <file_id>.enc / <file_id>.key：直接用 KMS 公鑰 RSA 包的 DEK 改包到 data-KEK 底下；
+  ENVELOPE_ENCRYPTION=0 時則是重新用新版本的公鑰包
+
+migrate-layout：把舊的 <file_id>.bin + <file_id>.key 轉成單一的 <file_id>.enc（見 encryption/container.py），
+不需要 KMS，--rate 限制的是每秒搬幾個檔案。
+
+沒有 key_version metadata 的舊物件用 KMS_LEGACY_KEY_VERSION 解。已經處理過的物件會略過，
+可以在服務運作中執行、中斷後用同一個 --checkpoint 接著跑。
+"""
+import argparse
+import asyncio
+import os
+import sys
+from typing import Awaitable, Callable, Optional
+
+from ..catalog import get_catalog
+from ..routes.files import migrate_legacy_file, needs_rewrap, rewrap_file_key
+from ..routes.kms import kek_ring, public_key_cache
+from ..storage.base import ObjectStat, get_storage
+from .envelope import KEK_PREFIX
+from .rotation import RewrapJob, RotationProgress
+
+LAYOUT_TARGET = "layout:EFH1"
+
+
+def _print_progress(p: RotationProgress) -> None:
+    print(
+        f"scanned={p.scanned} processed={p.processed} skipped={p.skipped} failed={p.failed} "
+        f"rate={p.per_second:.1f}/s seconds={p.seconds:.1f} after={p.after!r}",
+        flush=True,
+    )
+
+
+async def _run_job(
+    args,
+    target: str,
+    needs_work: Callable[[ObjectStat], bool],
+    process: Callable[[ObjectStat], Awaitable[bool]],
+) -> int:
+    if args.restart and args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    job = RewrapJob(
+        get_storage(), target, needs_work, process,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        checkpoint_path=args.checkpoint,
+        progress_interval=args.progress_interval,
+        report=_print_progress,
+    )
+    progress = await job.run()
+    for failure in progress.failures[:20]:
+        print("  ✗", failure, file=sys.stderr)
+    return 0 if not progress.failed else 1
+
+
+def _file_id(name: str) -> Optional[str]:
+    """<file_id>.enc / .key / .bin 的 file_id；其他物件（keks/、uploads/ 底下）回傳 None。"""
+    if "/" in name or not name.endswith((".enc", ".key", ".bin")):
+        return None
+    return name[:-4]
+
+
+async def _rewrap(args) -> int:
+    storage, catalog = get_storage(), get_catalog()
+    target = (await public_key_cache.get()).key_version
+
+    def needs_work(obj: ObjectStat) -> bool:
+        if obj.name.startswith(KEK_PREFIX):
+            return obj.name.endswith(".key") and obj.metadata.get("key_version") != target
+        if _file_id(obj.name) is None or obj.name.endswith(".bin"):
+            return False
+        return needs_rewrap(obj.metadata, target)
+
+    async def process(obj: ObjectStat) -> bool:
+        if obj.name.startswith(KEK_PREFIX):
+            return await kek_ring.rotate(storage, obj.name[len(KEK_PREFIX):-4], obj.metadata)
+        return await rewrap_file_key(storage, catalog, _file_id(obj.name))
+
+    print(f"target key version: {target}")
+    return await _run_job(args, target, needs_work, process)
+
+
+async def _migrate_layout(args) -> int:
+    storage = get_storage()
+
+    def needs_work(obj: ObjectStat) -> bool:
+        return obj.name.endswith(".bin") and _file_id(obj.name) is not None
+
+    async def process(obj: ObjectStat) -> bool:
+        return await migrate_legacy_file(storage, _file_id(obj.name))
+
+    return await _run_job(args, LAYOUT_TARGET, needs_work, process)
+
+
+def _job_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--concurrency", type=int, default=8, help="objects processed at once")
+    p.add_argument("--rate", type=float, default=50.0, help="max objects processed per second")
+    p.add_argument("--checkpoint", default=None, help="JSON file to resume from / save progress to")
+    p.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    p.add_argument("--progress-interval", type=float, default=10.0)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend.kms")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("rewrap", help="re-wrap stored keys for the current KMS key version")
+    _job_args(r)
+    r.set_defaults(func=lambda args: asyncio.run(_rewrap(args)))
+
+    m = sub.add_parser("migrate-layout", help="convert legacy .bin/.key pairs into single .enc objects")
+    _job_args(m)
+    m.set_defaults(func=lambda args: asyncio.run(_migrate_layout(args)))
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
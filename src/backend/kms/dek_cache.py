@@ -0,0 +1,125 @@
+# backend/kms/dek_cache.py
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+CacheKey = Tuple[Optional[str], bytes]
+
+
+def _zeroize(buf: bytearray) -> None:
+    # 原地覆寫，讓被淘汰的明文 DEK 不會留在 heap 裡等 GC
+    buf[:] = bytes(len(buf))
+
+
+class DEKCache:
+    """
+    已解包 DEK 的行程內快取，放在 KMS asymmetric_decrypt 前面。
+
+    - key 是 (file_id, sha256(wrapped_key))，wrapped key 換了就自動 miss
+    - TTL 到期或超過 max_entries（LRU）就淘汰，淘汰時把明文歸零
+    - 同一把 key 的並行 miss 只會打一次 KMS
+    """
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, Tuple[bytearray, float]]" = OrderedDict()
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(file_id: Optional[str], wrapped_key: bytes) -> CacheKey:
+        return file_id, hashlib.sha256(wrapped_key).digest()
+
+    def get(self, key: CacheKey) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            buf, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                _zeroize(buf)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return bytes(buf)
+
+    def put(self, key: CacheKey, dek: bytes) -> None:
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                _zeroize(old[0])
+            self._entries[key] = (bytearray(dek), time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                _, (buf, _) = self._entries.popitem(last=False)
+                _zeroize(buf)
+                self.evictions += 1
+
+    async def get_or_load(self, key: CacheKey, loader: Callable[[], Awaitable[bytes]]) -> bytes:
+        dek = self.get(key)
+        if dek is not None:
+            return dek
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            dek = await loader()
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # 沒有其他等待者時避免 "exception never retrieved"
+            raise
+        else:
+            self.put(key, dek)
+            future.set_result(dek)
+            return dek
+        finally:
+            self._inflight.pop(key, None)
+
+    def invalidate(self, file_id: Optional[str]) -> int:
+        """移除某個檔案的所有快取項目（例如刪檔或 rewrap 之後）。"""
+        with self._lock:
+            keys = [k for k in self._entries if k[0] == file_id]
+            for k in keys:
+                _zeroize(self._entries.pop(k)[0])
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            for buf, _ in self._entries.values():
+                _zeroize(buf)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# files 與 /kms/decrypt 共用的單一實例
+dek_cache = DEKCache(
+    ttl=float(os.getenv("DEK_CACHE_TTL", "300")),
+    max_entries=int(os.getenv("DEK_CACHE_MAX_ENTRIES", "1024")),
+)
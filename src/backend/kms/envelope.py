@@ -0,0 +1,153 @@
+# backend/kms/envelope.py
+"""
+兩層金鑰：KMS key → data-KEK → 每個檔案的 DEK。
+
+- data-KEK 是隨機的 AES-256 key，用 KMS 公鑰（RSA-OAEP-SHA256）包起來存在 keks/<kek_id>.key，
+  每個 tenant（上傳者）每個輪替週期（KEK_ROTATION_SECONDS，預設一天）一把
+- 檔案的 DEK 在本機用 AES-GCM 包在 KEK 底下（AAD 綁 file_id + kek_id），
+  kek_id 寫在 <file_id>.key 物件的 metadata 裡
+- 解開過的 KEK 放在記憶體快取，所以 KMS 呼叫次數只跟 KEK 數量有關，跟下載次數無關
+
+kek_id 帶一段亂數：多個行程同一天各自建 KEK 也不會互相覆蓋（storage 沒有 put-if-absent）。
+"""
+import asyncio
+import os
+import re
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from ..storage.base import ObjectNotFound, StorageBackend
+from .dek_cache import DEKCache
+
+KEK_PREFIX = "keks/"
+WRAP_ALG = "AES-GCM"
+
+KEK_ROTATION_SECONDS = int(os.getenv("KEK_ROTATION_SECONDS", str(24 * 3600)))
+KEK_CACHE_TTL = float(os.getenv("KEK_CACHE_TTL", "3600"))
+KEK_CACHE_MAX_ENTRIES = int(os.getenv("KEK_CACHE_MAX_ENTRIES", "256"))
+
+# (wrapped, key_version) -> 明文；實際上就是 routes/kms.py 在 kms_pool 裡呼叫 provider
+KMSUnwrap = Callable[[bytes, Optional[str]], Awaitable[bytes]]
+# () -> (PEM, key_version)
+PublicKeyLoader = Callable[[], Awaitable[Tuple[str, str]]]
+
+_OAEP = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+
+
+def _tenant_slug(tenant: Optional[str]) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", tenant or "default")[:64] or "default"
+
+
+def _aad(file_id: str, kek_id: str) -> bytes:
+    return f"{file_id}|{kek_id}".encode()
+
+
+def is_enveloped(metadata: Dict[str, str]) -> bool:
+    return bool(metadata.get("kek_id"))
+
+
+def rsa_wrap(pem: str, plaintext: bytes) -> bytes:
+    """用 KMS 公鑰在本機加密（RSA-OAEP-SHA256，跟前端包 DEK 的方式一樣）。"""
+    return serialization.load_pem_public_key(pem.encode()).encrypt(plaintext, _OAEP)
+
+
+class KEKRing:
+    def __init__(
+        self,
+        kms_unwrap: KMSUnwrap,
+        public_key: PublicKeyLoader,
+        rotation: int = KEK_ROTATION_SECONDS,
+        cache_ttl: float = KEK_CACHE_TTL,
+        max_entries: int = KEK_CACHE_MAX_ENTRIES,
+    ):
+        self._kms_unwrap = kms_unwrap
+        self._public_key = public_key
+        self.rotation = rotation
+        # 明文 KEK 跟 DEK 一樣：TTL + LRU、淘汰時歸零、並行 miss 只打一次 KMS
+        self._cache = DEKCache(ttl=cache_ttl, max_entries=max_entries)
+        self._current: Dict[str, Tuple[int, str]] = {}  # tenant -> (period, kek_id)
+        self._create_lock = asyncio.Lock()
+        self.created = 0
+
+    @staticmethod
+    def _cache_key(kek_id: str):
+        return kek_id, b""
+
+    # --- KEK ---
+    async def _create(self, storage: StorageBackend, tenant: str, period: int) -> str:
+        kek = AESGCM.generate_key(bit_length=256)
+        pem, key_version = await self._public_key()
+        wrapped = rsa_wrap(pem, kek)
+        stamp = time.strftime("%Y%m%d%H%M", time.gmtime(period * self.rotation))
+        kek_id = f"{tenant}-{stamp}-{os.urandom(4).hex()}"
+        await storage.put(
+            f"{KEK_PREFIX}{kek_id}.key",
+            wrapped,
+            metadata={"key_version": key_version, "tenant": tenant, "created": str(int(time.time()))},
+        )
+        self._cache.put(self._cache_key(kek_id), kek)
+        self.created += 1
+        return kek_id
+
+    async def current(self, storage: StorageBackend, tenant: Optional[str]) -> Tuple[str, bytes]:
+        """目前這個 tenant 用來包新 DEK 的 (kek_id, KEK)，週期到了就換一把新的。"""
+        slug = _tenant_slug(tenant)
+        period = int(time.time() // self.rotation)
+        entry = self._current.get(slug)
+        if entry is None or entry[0] != period:
+            async with self._create_lock:
+                entry = self._current.get(slug)
+                if entry is None or entry[0] != period:
+                    entry = (period, await self._create(storage, slug, period))
+                    self._current[slug] = entry
+        kek_id = entry[1]
+        return kek_id, await self.get(storage, kek_id)
+
+    async def get(self, storage: StorageBackend, kek_id: str) -> bytes:
+        async def load() -> bytes:
+            name = f"{KEK_PREFIX}{kek_id}.key"
+            stat, wrapped = await asyncio.gather(storage.stat(name), storage.get(name))
+            return await self._kms_unwrap(wrapped, stat.metadata.get("key_version") or None)
+
+        try:
+            return await self._cache.get_or_load(self._cache_key(kek_id), load)
+        except ObjectNotFound:
+            raise ObjectNotFound(f"KEK {kek_id} not found")
+
+    async def rotate(self, storage: StorageBackend, kek_id: str, metadata: Dict[str, str]) -> bool:
+        """把 KEK 重新包到 KMS 目前的 key version（已經是的話回傳 False）。KEK 本身不變，DEK 都不用動。"""
+        pem, key_version = await self._public_key()
+        if metadata.get("key_version") == key_version:
+            return False
+        kek = await self.get(storage, kek_id)
+        await storage.put(
+            f"{KEK_PREFIX}{kek_id}.key", rsa_wrap(pem, kek), metadata={**metadata, "key_version": key_version}
+        )
+        return True
+
+    # --- DEK ---
+    async def wrap_dek(
+        self, storage: StorageBackend, dek: bytes, file_id: str, tenant: Optional[str]
+    ) -> Tuple[bytes, Dict[str, str]]:
+        """回傳 (wrapped DEK, 要寫進 .key 物件的 metadata)。"""
+        kek_id, kek = await self.current(storage, tenant)
+        nonce = os.urandom(12)
+        wrapped = nonce + AESGCM(kek).encrypt(nonce, dek, _aad(file_id, kek_id))
+        return wrapped, {"kek_id": kek_id, "wrap": WRAP_ALG}
+
+    async def unwrap_dek(self, storage: StorageBackend, wrapped: bytes, file_id: str, kek_id: str) -> bytes:
+        kek = await self.get(storage, kek_id)
+        return AESGCM(kek).decrypt(wrapped[:12], wrapped[12:], _aad(file_id, kek_id))
+
+    def stats(self) -> dict:
+        return {
+            "rotation": self.rotation,
+            "tenants": len(self._current),
+            "created": self.created,
+            "cache": self._cache.stats(),
+        }
+
@@ -0,0 +1,195 @@
+# backend/kms/providers.py
+"""
+KMS provider 抽象層，由 KMS_PROVIDER 選擇：
+
+- gcp（預設）：Google Cloud KMS，需要 GCP_PROJECT_ID / GCP_LOCATION / GCP_KEY_RING / GCP_CRYPTO_KEY
+- local：本機替身，RSA 私鑰放在 LOCAL_KMS_DIR，演算法同前端（RSA-OAEP-SHA256，2048 bit），
+  可以注入延遲（LOCAL_KMS_LATENCY_MS ± LOCAL_KMS_JITTER_MS）與錯誤率（LOCAL_KMS_ERROR_RATE），
+  讓快取 / 批次的效果在離線環境也量得到
+
+兩者都是 blocking 呼叫，routes/kms.py 會丟到 kms_pool 執行。
+"""
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Dict, Optional
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from ..keyfile import load_or_create
+
+
+class KMSUnavailable(RuntimeError):
+    """KMS 呼叫失敗（local provider 注入的錯誤也用這個）。"""
+
+
+class KMSProvider(ABC):
+    @property
+    @abstractmethod
+    def key_version_name(self) -> str:
+        """預設（目前使用中）的 key version 完整名稱。"""
+
+    @abstractmethod
+    def get_public_key(self, key_version: Optional[str] = None) -> str:
+        """回傳 PEM 格式的公鑰。"""
+
+    @abstractmethod
+    def asymmetric_decrypt(self, ciphertext: bytes, key_version: Optional[str] = None) -> bytes: ...
+
+    def version_name(self, version: str) -> str:
+        """接受完整名稱或只有版本號（"2"），回傳完整的 key version 名稱。"""
+        return version if "/" in version else f"{self.crypto_key_name}/cryptoKeyVersions/{version}"
+
+
+class GCPKMSProvider(KMSProvider):
+    def __init__(self):
+        project_id = os.getenv("GCP_PROJECT_ID")
+        location_id = os.getenv("GCP_LOCATION", "asia-east1")
+        key_ring_id = os.getenv("GCP_KEY_RING")
+        crypto_key_id = os.getenv("GCP_CRYPTO_KEY")
+        key_version_id = os.getenv("GCP_KEY_VERSION", "1")
+        if not all([project_id, location_id, key_ring_id, crypto_key_id]):
+            raise RuntimeError("請先在 .env 裡正確設定 GCP_PROJECT_ID / GCP_LOCATION / GCP_KEY_RING / GCP_CRYPTO_KEY（或改用 KMS_PROVIDER=local）")
+
+        from google.api_core import exceptions as gcp_exceptions
+        from google.cloud import kms_v1
+        self.client = kms_v1.KeyManagementServiceClient()
+        self._api_error = gcp_exceptions.GoogleAPICallError
+        self._key_version_name = self.client.crypto_key_version_path(
+            project_id, location_id, key_ring_id, crypto_key_id, key_version_id
+        )
+        self.crypto_key_name = self.client.crypto_key_path(project_id, location_id, key_ring_id, crypto_key_id)
+
+    @property
+    def key_version_name(self) -> str:
+        return self._key_version_name
+
+    def _call(self, method, request: dict):
+        # 呼叫端只需要處理 KMSUnavailable，不必認得 google.api_core 的例外
+        try:
+            return method(request=request)
+        except self._api_error as e:
+            raise KMSUnavailable(str(e)) from e
+
+    def get_public_key(self, key_version: Optional[str] = None) -> str:
+        return self._call(self.client.get_public_key, {"name": key_version or self._key_version_name}).pem
+
+    def asymmetric_decrypt(self, ciphertext: bytes, key_version: Optional[str] = None) -> bytes:
+        response = self._call(
+            self.client.asymmetric_decrypt,
+            {"name": key_version or self._key_version_name, "ciphertext": ciphertext},
+        )
+        return response.plaintext
+
+
+class LocalKMSProvider(KMSProvider):
+    """
+    key version 名稱仿照 GCP 的格式：projects/local/.../cryptoKeys/<key>/cryptoKeyVersions/<n>，
+    私鑰存在 <directory>/<key>/<n>.pem，不存在時自動產生（之後的 rotation 只要放新的 <n>.pem）。
+    """
+
+    def __init__(
+        self,
+        directory: str = "local_kms",
+        key_id: str = "files",
+        version: str = "1",
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        key_size: int = 2048,
+    ):
+        self.directory = directory
+        self.key_id = key_id
+        self.version = version
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.key_size = key_size
+        self._keys: Dict[str, rsa.RSAPrivateKey] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @property
+    def crypto_key_name(self) -> str:
+        return f"projects/local/locations/local/keyRings/local/cryptoKeys/{self.key_id}"
+
+    @property
+    def key_version_name(self) -> str:
+        return f"{self.crypto_key_name}/cryptoKeyVersions/{self.version}"
+
+    def _version_of(self, key_version: Optional[str]) -> str:
+        name = key_version or self.key_version_name
+        prefix = self.crypto_key_name + "/cryptoKeyVersions/"
+        if not name.startswith(prefix) or not name[len(prefix):].isdigit():
+            raise KMSUnavailable(f"Unknown key version: {name}")
+        return name[len(prefix):]
+
+    def _private_key(self, version: str) -> rsa.RSAPrivateKey:
+        with self._lock:
+            key = self._keys.get(version)
+            if key is not None:
+                return key
+            path = os.path.join(self.directory, self.key_id, f"{version}.pem")
+            if version == self.version:
+                # 多個 worker 同時第一次啟動時大家拿到同一把（見 keyfile.py）
+                pem = load_or_create(path, self._generate_pem)
+            else:
+                try:
+                    with open(path, "rb") as f:
+                        pem = f.read()
+                except FileNotFoundError:
+                    raise KMSUnavailable(f"Key version {version} not found")
+            key = serialization.load_pem_private_key(pem, password=None)
+            self._keys[version] = key
+            return key
+
+    def _generate_pem(self) -> bytes:
+        return rsa.generate_private_key(public_exponent=65537, key_size=self.key_size).private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+
+    def _simulate(self) -> None:
+        self.calls += 1
+        if self.latency_ms or self.jitter_ms:
+            delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) if self.jitter_ms else self.latency_ms
+            time.sleep(delay / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            raise KMSUnavailable("Injected KMS error")
+
+    def get_public_key(self, key_version: Optional[str] = None) -> str:
+        self._simulate()
+        key = self._private_key(self._version_of(key_version))
+        return key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+
+    def asymmetric_decrypt(self, ciphertext: bytes, key_version: Optional[str] = None) -> bytes:
+        self._simulate()
+        key = self._private_key(self._version_of(key_version))
+        return key.decrypt(
+            ciphertext,
+            padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None),
+        )
+
+
+@lru_cache(maxsize=None)
+def get_kms_provider() -> KMSProvider:
+    kind = os.getenv("KMS_PROVIDER", "gcp").lower()
+    if kind == "gcp":
+        return GCPKMSProvider()
+    if kind == "local":
+        return LocalKMSProvider(
+            directory=os.getenv("LOCAL_KMS_DIR", "local_kms"),
+            key_id=os.getenv("LOCAL_KMS_KEY", "files"),
+            version=os.getenv("LOCAL_KMS_KEY_VERSION", "1"),
+            latency_ms=float(os.getenv("LOCAL_KMS_LATENCY_MS", "0")),
+            jitter_ms=float(os.getenv("LOCAL_KMS_JITTER_MS", "0")),
+            error_rate=float(os.getenv("LOCAL_KMS_ERROR_RATE", "0")),
+        )
+    raise RuntimeError(f"Unknown KMS_PROVIDER: {kind}")
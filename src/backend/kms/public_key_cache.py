@@ -0,0 +1,81 @@
+# backend/kms/public_key_cache.py
+"""
+KMS 公鑰快取：每個 key version 只跟 KMS 拿一次 PEM，之後每 refresh 秒才重新確認一次
+（provider 換了目前的 key version、或 KMS 端換了 key material 都會在下一次 refresh 生效）。
+
+ETag = sha256(key version + PEM)，/kms/public-key 用它回 304，前端也拿它判斷要不要重新 importKey。
+"""
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+PUBLIC_KEY_REFRESH = float(os.getenv("KMS_PUBLIC_KEY_REFRESH", "300"))
+
+# key_version -> PEM
+PublicKeyFetch = Callable[[str], Awaitable[str]]
+
+
+@dataclass
+class PublicKeyEntry:
+    key_version: str
+    pem: str
+    etag: str
+    fetched_at: float
+
+
+class PublicKeyCache:
+    def __init__(self, fetch: PublicKeyFetch, current_version: Callable[[], str], refresh: float = PUBLIC_KEY_REFRESH):
+        self._fetch = fetch
+        self._current_version = current_version
+        self.refresh = refresh
+        self._entries: Dict[str, PublicKeyEntry] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.fetches = 0
+
+    async def _load(self, key_version: str) -> PublicKeyEntry:
+        pending = self._pending.get(key_version)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key_version] = future
+        try:
+            pem = await self._fetch(key_version)
+            self.fetches += 1
+            etag = '"' + hashlib.sha256(f"{key_version}\n{pem}".encode()).hexdigest()[:32] + '"'
+            entry = PublicKeyEntry(key_version, pem, etag, time.monotonic())
+            self._entries[key_version] = entry
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            future.set_result(entry)
+            return entry
+        finally:
+            self._pending.pop(key_version, None)
+
+    async def get(self, key_version: Optional[str] = None) -> PublicKeyEntry:
+        """預設回傳目前的 key version；過了 refresh 才重新向 KMS 取一次。"""
+        key_version = key_version or self._current_version()
+        entry = self._entries.get(key_version)
+        if entry is not None and time.monotonic() - entry.fetched_at < self.refresh:
+            self.hits += 1
+            return entry
+        try:
+            return await self._load(key_version)
+        except Exception:
+            if entry is not None:
+                return entry  # KMS 暫時連不上就沿用舊的 PEM
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "versions": len(self._entries),
+            "refresh": self.refresh,
+            "hits": self.hits,
+            "fetches": self.fetches,
+        }
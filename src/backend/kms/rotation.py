@@ -0,0 +1,178 @@
+# backend/kms/rotation.py
+"""
+大量重新包裝（輪替 KMS key version 之後用），也拿來跑檔案格式的搬移。
+
+- 依名稱順序列出 storage 物件，只挑需要處理的（判斷只看 list 帶回來的 metadata，不打 KMS）
+- 同時處理的物件數上限 concurrency，另外用 SlidingWindowLimiter 把處理速度（KMS 呼叫）壓在每秒 rate 次以下
+- checkpoint 記「這個名稱之前的物件都已經處理完」（並行完成順序不一定，所以記的是低水位），
+  中斷後重跑會從那裡接著列；失敗的物件會讓低水位停在它前面，所以接著跑時一定會重試。
+  每個物件的處理本身是冪等的，重跑整批也安全
+- 每 progress_interval 秒回報一次進度
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Deque, List, Optional
+
+from ..ratelimit import SlidingWindowLimiter
+from ..storage.base import ObjectStat, StorageBackend
+
+
+@dataclass
+class RotationProgress:
+    target: str
+    after: str = ""             # checkpoint：名稱 <= after 的物件都處理完了
+    scanned: int = 0
+    processed: int = 0
+    skipped: int = 0
+    failed: int = 0
+    failures: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def per_second(self) -> float:
+        return self.processed / self.seconds if self.seconds else 0.0
+
+
+def load_checkpoint(path: str, target: str) -> RotationProgress:
+    """讀 checkpoint；不存在或是上一次不同目標版本的輪替就從頭開始。"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return RotationProgress(target=target)
+    if data.get("target") != target:
+        return RotationProgress(target=target)
+    return RotationProgress(**data)
+
+
+def save_checkpoint(path: str, progress: RotationProgress) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(asdict(progress), f)
+    os.replace(tmp, path)
+
+
+class _Watermark:
+    """
+    按列出順序追蹤完成狀態，算出「之前全部做完」的最後一個名稱。
+    處理失敗的物件會擋住水位：checkpoint 永遠停在第一個失敗的物件之前，接著跑時會重試它。
+    """
+
+    def __init__(self, after: str):
+        self.after = after
+        self._pending: Deque[list] = deque()  # [name, True 完成 / False 處理中 / None 失敗]
+        self._blocked = False
+
+    def add(self, name: str) -> list:
+        entry = [name, False]
+        if not self._blocked:  # 已經有失敗的物件時水位不會再前進，之後的不必追蹤
+            self._pending.append(entry)
+        return entry
+
+    def done(self, entry: list, ok: bool = True) -> None:
+        entry[1] = True if ok else None
+        self._blocked = self._blocked or not ok
+        while self._pending and self._pending[0][1] is True:
+            self.after = self._pending.popleft()[0]
+        if self._pending and self._pending[0][1] is None:
+            self._pending.clear()
+
+
+class RewrapJob:
+    def __init__(
+        self,
+        storage: StorageBackend,
+        target: str,
+        needs_work: Callable[[ObjectStat], bool],
+        process: Callable[[ObjectStat], Awaitable[bool]],
+        concurrency: int = 8,
+        rate: float = 50.0,
+        checkpoint_path: Optional[str] = None,
+        progress_interval: float = 10.0,
+        report: Callable[[RotationProgress], None] = print,
+    ):
+        self.storage = storage
+        self.needs_work = needs_work
+        self.process = process
+        self.concurrency = concurrency
+        self.checkpoint_path = checkpoint_path
+        self.progress_interval = progress_interval
+        self.report = report
+        self.progress = (
+            load_checkpoint(checkpoint_path, target) if checkpoint_path else RotationProgress(target=target)
+        )
+        # 上一次失敗的物件都在 checkpoint 之後，這次會重試，不再算進失敗數
+        self.progress.failed = 0
+        self.progress.failures = []
+        # 一秒的視窗最多 rate 次 KMS 呼叫（至少 1 次）
+        self._limiter = SlidingWindowLimiter(limit=max(1, int(rate)), window=1.0, max_keys=1)
+        self._last_report = 0.0
+
+    async def _throttle(self) -> None:
+        while wait := self._limiter.hit("kms"):
+            await asyncio.sleep(wait)
+
+    def _tick(self, started: float, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_report < self.progress_interval:
+            return
+        self._last_report = now
+        self.progress.seconds = now - started
+        if self.checkpoint_path:
+            save_checkpoint(self.checkpoint_path, self.progress)
+        self.report(self.progress)
+
+    async def run(self) -> RotationProgress:
+        progress = self.progress
+        elapsed = progress.seconds
+        started = time.monotonic() - elapsed
+        self._last_report = time.monotonic()
+        watermark = _Watermark(progress.after)
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+
+        async def one(obj: ObjectStat, entry: list) -> None:
+            ok = False
+            try:
+                await self._throttle()
+                done = await self.process(obj)
+                ok = True
+            except Exception as e:
+                progress.failed += 1
+                if len(progress.failures) < 1000:
+                    progress.failures.append(f"{obj.name}: {type(e).__name__}: {e}")
+            else:
+                if done:
+                    progress.processed += 1
+                else:
+                    progress.skipped += 1
+            finally:
+                watermark.done(entry, ok)
+                progress.after = watermark.after
+                slots.release()
+                self._tick(started)
+
+        async for obj in self.storage.list():
+            if obj.name <= progress.after:
+                continue
+            progress.scanned += 1
+            entry = watermark.add(obj.name)
+            if not self.needs_work(obj):
+                progress.skipped += 1
+                watermark.done(entry)
+                progress.after = watermark.after
+                self._tick(started)
+                continue
+            await slots.acquire()
+            task = asyncio.create_task(one(obj, entry))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        self._tick(started, force=True)
+        return progress
@@ -1,18 +1,37 @@
 # backend/main.py
 import os
+import asyncio
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from cryptography import x509
-from cryptography.x509.oid import NameOID
 
-from .routes import totp, webauthn, files, kms
+from .routes import totp, webauthn, files, uploads, kms, audit
+from .audit.logger import audit_writer
+from .certs.key_pool import start_shared_pool, stop_shared_pool
+from .qr_cache import qr_cache
+from .security import common_name, get_client_cert
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 啟動背景 audit writer，關閉時把 queue 內的紀錄全部寫完
+    await audit_writer.start()
+    # 憑證私鑰池在背景補充（開 worker process、讀磁碟上的 key，都丟到 thread 做）
+    await asyncio.to_thread(start_shared_pool)
+    try:
+        yield
+    finally:
+        await asyncio.to_thread(stop_shared_pool)
+        await audit_writer.stop()
+        qr_cache.shutdown()
 
 app = FastAPI(
     title="SimpleFinal API",
     description="整合 TOTP 二次驗證、WebAuthn、檔案上傳下載以及 KMS 公鑰流通的後端服務",
+    lifespan=lifespan,
 )
 
 # CORS 設定，允許前端訪問
@@ -31,28 +50,15 @@ app.add_middleware(
 app.include_router(totp.router, prefix="/2fa/totp", tags=["2FA-TOTP"])
 app.include_router(webauthn.router, prefix="/webauthn", tags=["FIDO2-WebAuthn"])
 app.include_router(files.router, prefix="/files", tags=["Files"])
+app.include_router(uploads.router, prefix="/files", tags=["Files"])
 app.include_router(kms.router, prefix="/kms", tags=["KMS"])
+app.include_router(audit.router, prefix="/audit", tags=["Audit"])
 
 # 健康檢查
 @app.get("/health", tags=["Health"])
 async def health_check():
     return {"status": "healthy"}
 
-# --- Mutual TLS 客戶端憑證驗證工具函式 ---
-def get_client_cert(request: Request) -> x509.Certificate:
-    """
-    從 TLS 連線中擷取 DER 格式的 client certificate，
-    驗證是否存在並回傳 x509.Certificate 物件。
-    """
-    ssl_obj = request.scope.get("ssl_object")
-    if not ssl_obj:
-        raise HTTPException(status_code=401, detail="TLS required")
-    der = ssl_obj.getpeercert(binary_form=True)
-    if not der:
-        raise HTTPException(status_code=401, detail="Client cert required")
-    cert = x509.load_der_x509_certificate(der)
-    return cert
-
 # --- 範例受保護路由 ---
 @app.get("/secure-endpoint", tags=["Secure"])
 async def secure_endpoint(
@@ -62,6 +68,5 @@ async def secure_endpoint(
     僅允許持有有效 client-cert 的請求進入，
     回傳憑證主體中的 Common Name。
     """
-    cn_attr = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
-    cn = cn_attr[0].value if cn_attr else None
-    return {"hello": cn} 
+    return {"hello": common_name(cert)}
+
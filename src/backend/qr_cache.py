@@ -0,0 +1,102 @@
+# backend/qr_cache.py
+"""
+TOTP QR code 的預先產生與快取。
+
+- 圖片以內容定址：key = sha256(格式 + otpauth URI)，同一把 secret 產生的圖永遠一樣，
+  這個 digest 同時拿來當 ETag。
+- 產圖是純 Python 的 CPU 工作，丟到 process pool（QR_RENDER_WORKERS）裡做，不卡 event loop。
+- 快取以總 bytes 為上限做 LRU（QR_CACHE_MAX_BYTES）；同一張圖同時被要多次只會算一次。
+"""
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+
+QR_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+QR_RENDER_WORKERS = int(os.getenv("QR_RENDER_WORKERS", "2"))
+QR_CACHE_MAX_BYTES = int(os.getenv("QR_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+
+def render_qr(uri: str, fmt: str = "png") -> bytes:
+    """在 worker process 裡執行，所以必須是模組層級的函式。"""
+    import qrcode
+    buf = BytesIO()
+    if fmt == "svg":
+        from qrcode.image.svg import SvgPathImage
+        qrcode.make(uri, image_factory=SvgPathImage).save(buf)
+    else:
+        qrcode.make(uri).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def qr_digest(uri: str, fmt: str) -> str:
+    return hashlib.sha256(f"{fmt}\n{uri}".encode()).hexdigest()
+
+
+class QRCache:
+    def __init__(self, max_bytes: int = QR_CACHE_MAX_BYTES, workers: int = QR_RENDER_WORKERS):
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._images: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.hits = 0
+        self.renders = 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _store(self, digest: str, image: bytes) -> None:
+        if len(image) > self.max_bytes:
+            return
+        self._images[digest] = image
+        self._size += len(image)
+        while self._size > self.max_bytes:
+            _, old = self._images.popitem(last=False)
+            self._size -= len(old)
+
+    async def get(self, uri: str, fmt: str = "png") -> Tuple[str, bytes]:
+        """回傳 (digest, 圖片 bytes)；沒快取時交給 process pool 產生。"""
+        digest = qr_digest(uri, fmt)
+        image = self._images.get(digest)
+        if image is not None:
+            self._images.move_to_end(digest)
+            self.hits += 1
+            return digest, image
+        pending = self._pending.get(digest)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = asyncio.ensure_future(loop.run_in_executor(self._executor(), render_qr, uri, fmt))
+            self._pending[digest] = pending
+            try:
+                image = await pending
+            finally:
+                self._pending.pop(digest, None)
+            self.renders += 1
+            self._store(digest, image)
+            return digest, image
+        return digest, await asyncio.shield(pending)
+
+    async def warm(self, uri: str) -> None:
+        """註冊時先把 PNG 算好，前端接著來拿就直接命中。"""
+        try:
+            await self.get(uri, "png")
+        except Exception:
+            pass
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {"entries": len(self._images), "bytes": self._size, "hits": self.hits, "renders": self.renders}
+
+
+qr_cache = QRCache()
@@ -0,0 +1,63 @@
+# backend/ratelimit.py
+"""
+滑動視窗限流（sliding window counter 近似法）。
+
+每個 key 只存兩個計數：上一個視窗與目前視窗，估計值 = prev * 剩餘比例 + cur，
+所以每次 hit 都是 O(1)，不用保存每次請求的時間戳。key 數量用 LRU 限制上限。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class SlidingWindowLimiter:
+    def __init__(self, limit: int, window: float, max_keys: int = 100000):
+        if limit <= 0 or window <= 0:
+            raise ValueError("limit and window must be positive")
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        # key -> [視窗編號, 上一個視窗的次數, 目前視窗的次數]
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, key: str, n: int) -> list:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [n, 0, 0]
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            if bucket[0] != n:
+                bucket[1] = bucket[2] if bucket[0] == n - 1 else 0
+                bucket[2] = 0
+                bucket[0] = n
+        return bucket
+
+    def hit(self, key: str, now: Optional[float] = None) -> float:
+        """
+        記一次嘗試。允許就回傳 0；超過上限時不計數，回傳建議的 Retry-After 秒數。
+        """
+        now = time.time() if now is None else now
+        n, elapsed = divmod(now, self.window)
+        with self._lock:
+            bucket = self._bucket(key, int(n))
+            prev, cur = bucket[1], bucket[2]
+            weight = 1.0 - elapsed / self.window
+            if prev * weight + cur < self.limit:
+                bucket[2] += 1
+                return 0.0
+        if cur >= self.limit:
+            return self.window - elapsed
+        # 等上一個視窗的權重降到讓估計值低於上限
+        return max(self.window * (1.0 - (self.limit - cur) / prev) - elapsed, 0.001)
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
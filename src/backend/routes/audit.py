@@ -0,0 +1,62 @@
+# backend/routes/audit.py
+import json
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from ..audit.index import get_index, INDEX_FIELDS
+from ..audit.logger import AUDIT_LOG_PATH
+from ..security import require_admin
+
+router = APIRouter()
+
+def _epoch(dt: Optional[datetime]) -> Optional[float]:
+    return dt.timestamp() if dt is not None else None
+
+@router.get(
+    "/query",
+    dependencies=[Depends(require_admin)],
+    summary="Query the audit log",
+    description=(
+        "Filter audit records by time range, user, action, file and IP using the segment index. "
+        "Results are streamed back as one JSON page; pass next_cursor to continue. "
+        "With count_by=<field> the matching records are counted per value instead. "
+        "Requires an admin mTLS client certificate: records include failed TOTP codes and client IPs."
+    )
+)
+async def audit_query(
+    since: Optional[datetime] = Query(None, description="Only records at or after this time (ISO 8601)"),
+    until: Optional[datetime] = Query(None, description="Only records before this time (ISO 8601)"),
+    user_id: Optional[str] = Query(None),
+    action: Optional[str] = Query(None, example="download"),
+    file_id: Optional[str] = Query(None),
+    ip: Optional[str] = Query(None),
+    count_by: Optional[str] = Query(None, description=f"Group and count by one of {', '.join(INDEX_FIELDS)}"),
+    cursor: int = Query(0, ge=0, description="next_cursor from the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    index = get_index(AUDIT_LOG_PATH)
+    filters = {"user_id": user_id, "action": action, "file_id": file_id, "ip": ip}
+    await asyncio.to_thread(index.refresh)
+
+    if count_by is not None:
+        try:
+            counts = await asyncio.to_thread(index.count_by, count_by, _epoch(since), _epoch(until), filters)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"count_by": count_by, "counts": counts}
+
+    records, next_cursor = await asyncio.to_thread(
+        index.query, _epoch(since), _epoch(until), filters, cursor, limit
+    )
+
+    def body():
+        yield '{"records":['
+        for i, record in enumerate(records):
+            yield ("," if i else "") + json.dumps(record, ensure_ascii=False, default=str)
+        yield '],"next_cursor":' + json.dumps(next_cursor) + "}"
+
+    return StreamingResponse(body(), media_type="application/json")
@@ -1,26 +1,54 @@
 import os
 import json
 import base64
-from typing import List
+import asyncio
+import io
+import re
+import time
+import zipfile
+from dataclasses import dataclass, replace
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request, status
-from google.cloud import storage
-from google.api_core import exceptions as gcp_exceptions
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Query, Request, status
 from fastapi.responses import StreamingResponse
-from io import BytesIO
 from urllib.parse import quote
 
 from pydantic import BaseModel, Field
-from ..encryption.aes import aes_decrypt  # Server only needs to decrypt
-from .kms import KEY_VERSION_NAME, client as kms_client  # Reuse KMS client and key version
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from ..encryption.aes import (  # Server only needs to decrypt
+    aes_decrypt, aes_decrypt_frame, parse_stream_header, frame_ciphertext_range, stream_plaintext_size,
+    STREAM_ALG, STREAM_HEADER_LEN,
+)
+from ..encryption.container import (
+    FileHeader, HEADER_DIGEST_KEY, HEADER_PREFETCH, header_digest, pack_header, read_header,
+)
+from .kms import (  # Reuse the KMS provider, KEK ring, public-key cache and the shared DEK cache
+    kek_ring, kms_decrypt, key_version_of, public_key_cache, unwrap_dek,
+)
+from ..kms.dek_cache import dek_cache
+from ..kms.envelope import is_enveloped, rsa_wrap
+from ..kms.providers import KMSUnavailable
 from ..audit.logger import log_event
+from ..storage.base import StorageBackend, ObjectChanged, ObjectNotFound, ObjectStat, StorageUnavailable, get_storage
+from ..catalog import FileCatalog, FileRecord, get_catalog
 
 router = APIRouter()
 
-# GCP Cloud Storage bucket name (defaults from env)
-BUCKET = os.getenv("GCS_BUCKET_NAME", "my-secure-files-bucket")
-client = storage.Client()
-bucket = client.bucket(BUCKET)
+# Chunk size used when streaming request bodies (never hold a whole file)
+CHUNK_SIZE = 1024 * 1024
+
+# How many files /download-batch prepares (metadata + DEK unwrap) at once
+BATCH_CONCURRENCY = int(os.getenv("DOWNLOAD_BATCH_CONCURRENCY", "16"))
+
+# Re-wrap uploaded DEKs under a data-KEK so downloads no longer call KMS per file
+ENVELOPE_ENCRYPTION = os.getenv("ENVELOPE_ENCRYPTION", "1") != "0"
+
+# What _seal_dek tolerates by keeping the RSA-wrapped DEK: KMS down / rejecting the
+# key (ValueError from RSA-OAEP), or the KEK object failing to load / store
+SEAL_ERRORS = (KMSUnavailable, ValueError, ObjectNotFound, StorageUnavailable, OSError)
+
+# How often a read follows an .enc object that is rewritten underneath it before giving up
+REPIN_ATTEMPTS = 3
 
 # Pydantic schemas
 class UploadOut(BaseModel):
@@ -29,31 +57,64 @@ class UploadOut(BaseModel):
 class FileItem(BaseModel):
     file_id: str = Field(..., description="Unique identifier for the stored file")
     filename: str = Field(..., description="Original filename uploaded by the user")
+    owner_id: Optional[str] = Field(None, description="User who uploaded the file")
+    size: Optional[int] = Field(None, description="Ciphertext size in bytes")
+    upload_time: Optional[float] = Field(None, description="Upload time (unix timestamp)")
 
 class ListOut(BaseModel):
     files: List[FileItem] = Field(..., description="List of stored encrypted files with metadata")
+    next_cursor: Optional[str] = Field(None, description="Pass as ?cursor= to fetch the next page")
 
 class DeleteOut(BaseModel):
     deleted: str = Field(..., description="ID of the deleted file")
 
+class DownloadBatchIn(BaseModel):
+    file_ids: List[str] = Field(
+        ..., min_length=1, max_length=1000,
+        description="IDs of the files to download together as one zip archive"
+    )
+
 # Upload endpoint
 @router.post(
     "/upload",
     response_model=UploadOut,
     status_code=status.HTTP_201_CREATED,
     summary="Upload encrypted file (front-end AES-GCM)",
-    description="Receive an already-encrypted file + metadata (iv, encrypted_dek) and store them in GCS."
+    description="Receive an already-encrypted file + metadata (iv, encrypted_dek) and store them in object storage as one object."
 )
 async def upload_file(
     request: Request,
     file: UploadFile = File(...),
-    metadata: str = Form(...)
+    metadata: str = Form(...),
+    storage: StorageBackend = Depends(get_storage),
+    catalog: FileCatalog = Depends(get_catalog),
 ):
     try:
         meta = json.loads(metadata)
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON in metadata")
+    iv, encrypted_dek = parse_upload_meta(meta)
 
+    file_id = os.urandom(16).hex()
+    await store_file(
+        storage, catalog, file_id, _iter_upload(file),
+        iv=iv,
+        encrypted_dek=encrypted_dek,
+        filename=meta.get("filename", file.filename),
+        alg=meta.get("algorithm", "AES-GCM"),
+        owner_id=meta.get("user_id"),
+        key_version=meta.get("key_version"),
+    )
+
+    log_event(
+        user_id=request.client.host,
+        action="upload",
+        metadata={"file_id": file_id, "filename": file.filename}
+    )
+    return {"file_id": file_id}
+
+def parse_upload_meta(meta: dict) -> Tuple[bytes, bytes]:
+    """Extract (iv, encrypted_dek) from the client-supplied upload metadata."""
     iv_field = meta.get("iv")
     if iv_field is None:
         raise HTTPException(status_code=400, detail="iv missing in metadata")
@@ -63,84 +124,478 @@ async def upload_file(
     if enc_dek_field is None:
         raise HTTPException(status_code=400, detail="encrypted_dek missing in metadata")
     encrypted_dek = base64.b64decode(enc_dek_field) if isinstance(enc_dek_field, str) else bytes(enc_dek_field)
+    return iv, encrypted_dek
 
-    file_id = os.urandom(16).hex()
-    ciphertext = await file.read()
+async def store_file(
+    storage: StorageBackend,
+    catalog: FileCatalog,
+    file_id: str,
+    body: AsyncIterator[bytes],
+    iv: bytes,
+    encrypted_dek: bytes,
+    filename: str,
+    alg: str,
+    owner_id: Optional[str],
+    key_version: Optional[str] = None,
+) -> ObjectStat:
+    """Write header + ciphertext as a single object and register the file in the catalog."""
+    key_blob, key_meta = await _seal_dek(storage, file_id, encrypted_dek, owner_id, key_version)
+    header = pack_header(FileHeader(
+        alg=alg, iv=iv, wrapped_dek=key_blob, filename=filename, owner=owner_id or "", **key_meta
+    ))
 
-    blob_cipher = bucket.blob(f"{file_id}.bin")
-    blob_cipher.upload_from_string(ciphertext)
-    blob_cipher.metadata = {
-        "iv": iv.hex(),
-        "alg": meta.get("algorithm", "AES-GCM"),
-        "filename": meta.get("filename", file.filename)
-    }
-    blob_cipher.patch()
+    # One object per file: the header (wrapped DEK, IV, alg, filename) is
+    # streamed in front of the ciphertext. The KEK id / key version is also
+    # set as metadata at creation time so the rewrap job can filter on a listing
+    stat = await storage.put(f"{file_id}.enc", _prefixed(header, body), metadata=_object_meta(header, key_meta))
+    stat = replace(stat, size=stat.size - len(header))
 
-    blob_key = bucket.blob(f"{file_id}.key")
-    blob_key.upload_from_string(encrypted_dek)
+    # Keep the catalog in sync so /list never has to scan the bucket
+    await catalog.upsert(FileRecord(
+        file_id=file_id,
+        filename=filename,
+        owner_id=owner_id,
+        wrapped_key=key_blob,
+        iv=iv,
+        alg=alg,
+        size=stat.size,
+    ))
+    return stat
 
-    log_event(
-        user_id=request.client.host,
-        action="upload",
-        metadata={"file_id": file_id, "filename": file.filename}
-    )
-    return {"file_id": file_id}
+def _object_meta(header: bytes, key_meta: Dict[str, str]) -> Dict[str, str]:
+    """Metadata of an .enc object: the key fields plus a digest of the header written in front."""
+    return {**key_meta, HEADER_DIGEST_KEY: header_digest(header)}
 
-# Download endpoint
-@router.get("/download/{file_id}")
-async def download_file(file_id: str, request: Request):
+async def _prefixed(prefix: bytes, body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    yield prefix
+    async for chunk in body:
+        yield chunk
+
+async def _seal_dek(
+    storage: StorageBackend,
+    file_id: str,
+    encrypted_dek: bytes,
+    owner_id: Optional[str],
+    key_version: Optional[str] = None,
+) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Unwrap the client's RSA-wrapped DEK once (one KMS call per upload) and
+    re-wrap it under the owner's current data-KEK. If KMS is unavailable the
+    RSA-wrapped DEK is stored as-is; `python -m backend.kms rewrap` migrates it later.
+    """
+    # The key version the client encrypted with (from /kms/public-key)
+    rsa_meta = {"key_version": key_version} if key_version else {}
+    try:
+        # Older clients don't send it: they used the current public key
+        rsa_meta["key_version"] = key_version or (await public_key_cache.get()).key_version
+        if not ENVELOPE_ENCRYPTION:
+            return encrypted_dek, rsa_meta
+        dek = await kms_decrypt(encrypted_dek, key_version_of(rsa_meta))
+        return await kek_ring.wrap_dek(storage, dek, file_id, owner_id)
+    except SEAL_ERRORS as e:
+        log_event(
+            user_id=owner_id or "system",
+            action="dek_rewrap_failed",
+            metadata={"file_id": file_id, "error": f"{type(e).__name__}: {e}"},
+        )
+        return encrypted_dek, rsa_meta
+
+def needs_rewrap(metadata: Dict[str, str], current_version: str) -> bool:
+    """Whether a <file_id>.key object (by its metadata) still has to be re-wrapped."""
+    if is_enveloped(metadata):
+        return False
+    return ENVELOPE_ENCRYPTION or key_version_of(metadata) != current_version
+
+async def _rewrap_dek(storage: StorageBackend, file_id: str, dek: bytes, owner_id: Optional[str], current):
+    if ENVELOPE_ENCRYPTION:
+        return await kek_ring.wrap_dek(storage, dek, file_id, owner_id)
+    return rsa_wrap(current.pem, dek), {"key_version": current.key_version}
+
+async def rewrap_file_key(storage: StorageBackend, catalog: FileCatalog, file_id: str) -> bool:
+    """
+    Re-wrap one file's RSA-wrapped DEK: under its owner's data-KEK, or with
+    ENVELOPE_ENCRYPTION=0 under the current KMS key version. False if nothing to do.
+    The object is rewritten in place (ciphertext copied behind the new header),
+    reading the source pinned to one generation and writing only if that
+    generation is still current; downloads running at the same time follow the
+    new header (see _read_ciphertext). The catalog row gets the new wrapped key
+    too. A file deleted or overwritten meanwhile is skipped (False), so the
+    rewrite never brings a deleted object back.
+    """
+    name = f"{file_id}.enc"
+    try:
+        stat = await storage.stat(name)
+    except ObjectNotFound:
+        return await _rewrap_legacy_key(storage, catalog, file_id)
+    current = await public_key_cache.get()
+    if not needs_rewrap(stat.metadata, current.key_version):
+        return False
+    header, offset, _ = await read_header(storage, name, generation=stat.generation)
+    dek = await kms_decrypt(header.wrapped_dek, key_version_of(header.key_metadata()))
+    wrapped, key_meta = await _rewrap_dek(storage, file_id, dek, header.owner or None, current)
+    raw_header = pack_header(replace(
+        header, wrapped_dek=wrapped, **{"kek_id": "", "wrap": "", "key_version": "", **key_meta}
+    ))
+    # Objects cannot be patched in place: rewrite it, streaming the ciphertext across
+    # (a concurrent rewrite makes the pinned read fail instead of mixing two versions)
+    body = storage.iter_range(name, offset, stat.size, generation=stat.generation)
     try:
-        # 1. Load blobs
-        blob_bin = bucket.blob(f"{file_id}.bin")
-        blob_key = bucket.blob(f"{file_id}.key")
+        await storage.put(
+            name, _prefixed(raw_header, body),
+            metadata=_object_meta(raw_header, key_meta), if_generation_match=stat.generation,
+        )
+    except (ObjectChanged, ObjectNotFound):
+        return False
+    await catalog.update_wrapped_key(file_id, wrapped)
+    dek_cache.invalidate(file_id)
+    return True
+
+async def _rewrap_legacy_key(storage: StorageBackend, catalog: FileCatalog, file_id: str) -> bool:
+    stat_key, stat_bin = await asyncio.gather(
+        storage.stat(f"{file_id}.key"),
+        storage.stat(f"{file_id}.bin"),
+        return_exceptions=True,
+    )
+    if isinstance(stat_key, BaseException):
+        raise stat_key
+    current = await public_key_cache.get()
+    if not needs_rewrap(stat_key.metadata, current.key_version):
+        return False
+    wrapped = _parse_wrapped_key(await storage.get(f"{file_id}.key"))
+    dek = await kms_decrypt(wrapped, key_version_of(stat_key.metadata))
+    owner_id = None if isinstance(stat_bin, BaseException) else stat_bin.metadata.get("owner") or None
+    key_blob, key_meta = await _rewrap_dek(storage, file_id, dek, owner_id, current)
+    try:
+        await storage.put(f"{file_id}.key", key_blob, metadata=key_meta, if_generation_match=stat_key.generation)
+    except ObjectChanged:
+        return False
+    await catalog.update_wrapped_key(file_id, key_blob)
+    dek_cache.invalidate(file_id)
+    return True
+
+async def migrate_legacy_file(storage: StorageBackend, file_id: str) -> bool:
+    """Convert a legacy <id>.bin + <id>.key pair into a single <id>.enc object (False if there is none)."""
+    stat_bin, stat_key, raw_wrapped = await asyncio.gather(
+        storage.stat(f"{file_id}.bin"),
+        storage.stat(f"{file_id}.key"),
+        storage.get(f"{file_id}.key"),
+        return_exceptions=True,
+    )
+    if isinstance(stat_bin, ObjectNotFound):
+        return False
+    for result in (stat_bin, stat_key, raw_wrapped):
+        if isinstance(result, BaseException):
+            raise result
+    meta = stat_bin.metadata
+    key_meta = {k: v for k, v in stat_key.metadata.items() if k in ("kek_id", "wrap", "key_version") and v}
+    wrapped = raw_wrapped if is_enveloped(key_meta) else _parse_wrapped_key(raw_wrapped)
+    header = pack_header(FileHeader(
+        alg=meta.get("alg", "AES-GCM"),
+        iv=bytes.fromhex(meta["iv"]),
+        wrapped_dek=wrapped,
+        filename=meta.get("filename", f"{file_id}.bin"),
+        owner=meta.get("owner", ""),
+        **key_meta,
+    ))
+    body = storage.iter_range(f"{file_id}.bin", 0, stat_bin.size, generation=stat_bin.generation)
+    await storage.put(f"{file_id}.enc", _prefixed(header, body), metadata=_object_meta(header, key_meta))
+    # Readers prefer <id>.enc, so the old pair can go once the new object exists
+    for suffix in ("bin", "key"):
         try:
-            blob_bin.reload()
-        except gcp_exceptions.NotFound:
-            raise HTTPException(status_code=404, detail="File not found")
+            await storage.delete(f"{file_id}.{suffix}")
+        except ObjectNotFound:
+            pass
+    return True
+
+async def _iter_upload(file: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await file.read(CHUNK_SIZE):
+        yield chunk
+
+def _parse_wrapped_key(raw_wrapped: bytes) -> bytes:
+    # Wrapped DEKs are stored raw (256 bytes for RSA-2048), older uploads as hex / base64
+    if len(raw_wrapped) != 256:
         try:
-            blob_key.reload()
-        except gcp_exceptions.NotFound:
-            raise HTTPException(status_code=404, detail="DEK not found")
-
-        # 2. Download wrapped DEK
-        raw_wrapped = blob_key.download_as_bytes()
-        if len(raw_wrapped) != 256:
-            try:
-                wrapped_key = bytes.fromhex(raw_wrapped.decode())
-            except Exception:
-                wrapped_key = base64.b64decode(raw_wrapped)
-        else:
-            wrapped_key = raw_wrapped
+            return bytes.fromhex(raw_wrapped.decode())
+        except Exception:
+            return base64.b64decode(raw_wrapped)
+    return raw_wrapped
 
-        # 3. Decrypt DEK
-        resp = kms_client.asymmetric_decrypt(
-            request={"name": KEY_VERSION_NAME, "ciphertext": wrapped_key}
-        )
-        dek = resp.plaintext
-
-        # 4. Fetch IV & ciphertext
-        meta = blob_bin.metadata or {}
-        iv_hex = meta.get("iv")
-        filename = meta.get("filename", f"{file_id}.bin")
-        if not iv_hex:
-            raise HTTPException(status_code=500, detail="IV metadata not found")
-        iv = bytes.fromhex(iv_hex)
-        ciphertext = blob_bin.download_as_bytes()
-
-        # 5. Decrypt content
-        plaintext = aes_decrypt(dek, ciphertext, iv)
+@dataclass
+class _StreamLayout:
+    header: bytes
+    frame_size: int
+    frame_count: int
+    plaintext_size: int
+
+async def _stream_layout(storage: StorageBackend, stored: "_StoredFile") -> Optional[_StreamLayout]:
+    """Read the frame header of an AES-GCM-STREAM file (None for legacy single-shot files)."""
+    if stored.alg != STREAM_ALG:
+        return None
+    # Usually already part of the bytes read together with the file header
+    lo = stored.offset
+    header = stored.head[lo:lo + STREAM_HEADER_LEN]
+    if len(header) < STREAM_HEADER_LEN:
+        header = await _read_ciphertext(storage, stored, 0, STREAM_HEADER_LEN)
+    frame_size, frame_count = parse_stream_header(header)
+    size = stream_plaintext_size(stored.stat.size - lo, frame_size, frame_count)
+    return _StreamLayout(header, frame_size, frame_count, size)
+
+async def _iter_plaintext(
+    storage: StorageBackend,
+    stored: "_StoredFile",
+    layout: Optional[_StreamLayout] = None,
+    start: int = 0,
+    end: Optional[int] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Decrypt a stored ciphertext object. Framed (AES-GCM-STREAM) objects are
+    fetched and decrypted one frame at a time with ranged reads, and only the
+    frames covering plaintext [start, end) are touched; legacy single-shot
+    AES-GCM objects still have to be read in full (and ignore the range).
+    """
+    if stored.alg != STREAM_ALG:
+        plaintext = aes_decrypt(stored.dek, await _read_ciphertext(storage, stored, 0), stored.iv)
         if isinstance(plaintext, str):
             plaintext = plaintext.encode('utf-8')
+        yield plaintext
+        return
+
+    layout = layout or await _stream_layout(storage, stored)
+    fs = layout.frame_size
+    end = layout.plaintext_size if end is None else end
+    aesgcm = AESGCM(stored.dek)
+    first = start // fs
+    for index in range(first, layout.frame_count):
+        frame_start = index * fs
+        if index > first and frame_start >= end:
+            break
+        lo, hi = frame_ciphertext_range(index, fs, stored.stat.size - stored.offset)
+        frame = await _read_ciphertext(storage, stored, lo, hi)
+        plaintext = aes_decrypt_frame(aesgcm, stored.iv, layout.header, index, frame)
+        if start > frame_start or end < frame_start + len(plaintext):
+            plaintext = plaintext[max(0, start - frame_start):end - frame_start]
+        yield plaintext
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single "bytes=" range into a half-open [start, end).
+    Returns None when the header is absent or unusable (serve the full body),
+    raises 416 when the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:  # suffix range: last N bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError
+            start, end = max(0, size - length), size
+        else:
+            start = int(first)
+            end = int(last) + 1 if last else size
+            if end <= start and last:
+                return None
+            end = min(end, size)
+    except ValueError:
+        return None
+    if start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
 
-        # 6. Log download
+async def _primed(body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Pull the first chunk before the response starts, so a wrong key / corrupt
+    header still surfaces as an HTTP error instead of a truncated 200.
+    """
+    first = await body.__anext__()
+
+    async def gen():
+        yield first
+        async for chunk in body:
+            yield chunk
+    return gen()
+
+@dataclass
+class _StoredFile:
+    file_id: str
+    stat: ObjectStat
+    wrapped_key: bytes
+    dek: bytes
+    iv: bytes
+    filename: str
+    alg: str
+    offset: int = 0    # where the ciphertext starts inside the object
+    head: bytes = b""  # bytes already read from the start of the object
+
+async def _read_ciphertext(storage: StorageBackend, stored: _StoredFile, lo: int, hi: Optional[int] = None) -> bytes:
+    """
+    Read ciphertext bytes [lo, hi) pinned to the generation the header came from.
+    A key rewrap rewrites the .enc object with a new header (often of another
+    length) in front of the same ciphertext: follow it by re-reading the header
+    of the new generation, then retry at the shifted offset.
+    """
+    for attempt in range(REPIN_ATTEMPTS):
+        try:
+            return await storage.get_range(
+                stored.stat.name,
+                stored.offset + lo,
+                None if hi is None else stored.offset + hi,
+                generation=stored.stat.generation,
+            )
+        except ObjectChanged:
+            # Legacy .bin objects are never rewritten in place
+            if attempt == REPIN_ATTEMPTS - 1 or not stored.stat.name.endswith(".enc"):
+                raise
+            await _repin(storage, stored)
+
+async def _pinned_header(storage: StorageBackend, stat: ObjectStat) -> Tuple[FileHeader, int, bytes, ObjectStat]:
+    """Read the header of exactly the generation `stat` describes (re-stat if that one is gone too)."""
+    for attempt in range(REPIN_ATTEMPTS):
+        try:
+            header, offset, head = await read_header(storage, stat.name, generation=stat.generation)
+            return header, offset, head, stat
+        except ObjectChanged:
+            if attempt == REPIN_ATTEMPTS - 1:
+                raise
+            stat = await storage.stat(stat.name)
+
+async def _repin(storage: StorageBackend, stored: _StoredFile) -> None:
+    _, offset, head, stat = await _pinned_header(storage, await storage.stat(stored.stat.name))
+    if stat.size - offset != stored.stat.size - stored.offset:
+        raise ObjectChanged(stat.name)
+    stored.stat, stored.offset, stored.head = stat, offset, head
+
+def _same_version(stat: ObjectStat, header: FileHeader, raw_header: bytes) -> bool:
+    """Whether a header read separately from `stat` belongs to the same object generation."""
+    digest = stat.metadata.get(HEADER_DIGEST_KEY)
+    if digest:
+        return digest == header_digest(raw_header)
+    # Objects written before the digest existed: a rewrap always changes the key fields
+    key_fields = {k: v for k, v in stat.metadata.items() if k in ("kek_id", "wrap", "key_version") and v}
+    return key_fields == header.key_metadata()
+
+async def _unwrap_file_dek(storage: StorageBackend, file_id: str, wrapped_key: bytes, key_meta: Dict[str, str]) -> bytes:
+    # Locally under the cached data-KEK, or via KMS for RSA-wrapped keys using
+    # the key version recorded with the file (served from the DEK cache for hot files)
+    if is_enveloped(key_meta):
+        return await kek_ring.unwrap_dek(storage, wrapped_key, file_id, key_meta["kek_id"])
+    return await unwrap_dek(wrapped_key, file_id=file_id, key_version=key_version_of(key_meta))
+
+async def _load_file(storage: StorageBackend, file_id: str) -> _StoredFile:
+    """
+    Read the file header with one ranged read (the size comes from a concurrent
+    stat) and unwrap the DEK. Falls back to legacy <id>.bin + <id>.key pairs.
+    If the object was rewritten between the two, the header is read again
+    pinned to the generation the stat saw.
+    """
+    name = f"{file_id}.enc"
+    head, stat = await asyncio.gather(
+        storage.get_range(name, 0, HEADER_PREFETCH),
+        storage.stat(name),
+        return_exceptions=True,
+    )
+    if isinstance(head, ObjectNotFound) or isinstance(stat, ObjectNotFound):
+        return await _load_legacy_file(storage, file_id)
+    for result in (head, stat):
+        if isinstance(result, BaseException):
+            raise result
+    try:
+        header, offset, head = await read_header(storage, name, head, generation=stat.generation)
+        consistent = _same_version(stat, header, head[:offset])
+    except ObjectChanged:
+        consistent = False
+    if not consistent:
+        header, offset, head, stat = await _pinned_header(storage, stat)
+    return _StoredFile(
+        file_id=file_id,
+        stat=stat,
+        wrapped_key=header.wrapped_dek,
+        dek=await _unwrap_file_dek(storage, file_id, header.wrapped_dek, header.key_metadata()),
+        iv=header.iv,
+        filename=header.filename or f"{file_id}.bin",
+        alg=header.alg,
+        offset=offset,
+        head=head,
+    )
+
+async def _load_legacy_file(storage: StorageBackend, file_id: str) -> _StoredFile:
+    """Fetch ciphertext metadata + wrapped DEK concurrently, then unwrap the DEK."""
+    # 1. Load object metadata and 2. the wrapped DEK (+ its KEK id) in parallel
+    stat_bin, stat_key, raw_wrapped = await asyncio.gather(
+        storage.stat(f"{file_id}.bin"),
+        storage.stat(f"{file_id}.key"),
+        storage.get(f"{file_id}.key"),
+        return_exceptions=True,
+    )
+    if isinstance(stat_bin, ObjectNotFound):
+        raise HTTPException(status_code=404, detail="File not found")
+    if isinstance(stat_key, ObjectNotFound) or isinstance(raw_wrapped, ObjectNotFound):
+        raise HTTPException(status_code=404, detail="DEK not found")
+    for result in (stat_bin, stat_key, raw_wrapped):
+        if isinstance(result, BaseException):
+            raise result
+
+    # 3. Decrypt DEK
+    if is_enveloped(stat_key.metadata):
+        wrapped_key = raw_wrapped
+    else:
+        wrapped_key = _parse_wrapped_key(raw_wrapped)
+    dek = await _unwrap_file_dek(storage, file_id, wrapped_key, stat_key.metadata)
+
+    # 4. Fetch IV
+    meta = stat_bin.metadata
+    iv_hex = meta.get("iv")
+    if not iv_hex:
+        raise HTTPException(status_code=500, detail="IV metadata not found")
+    return _StoredFile(
+        file_id=file_id,
+        stat=stat_bin,
+        wrapped_key=wrapped_key,
+        dek=dek,
+        iv=bytes.fromhex(iv_hex),
+        filename=meta.get("filename", f"{file_id}.bin"),
+        alg=meta.get("alg", "AES-GCM"),
+    )
+
+# Download endpoint
+@router.get("/download/{file_id}")
+async def download_file(
+    file_id: str,
+    request: Request,
+    storage: StorageBackend = Depends(get_storage),
+):
+    try:
+        stored = await _load_file(storage, file_id)
+        filename = stored.filename
+        wrapped_key = stored.wrapped_key
+
+        # 5. Work out the requested range (framed files only: legacy blobs
+        #    are one GCM message and cannot be decrypted partially)
+        layout = await _stream_layout(storage, stored)
+        etag = f'"{file_id}"'
+        byte_range = None
+        if layout is not None:
+            if_range = request.headers.get("if-range")
+            if if_range is None or if_range == etag:
+                byte_range = _parse_range(request.headers.get("range"), layout.plaintext_size)
+        start, end = byte_range or (0, None)
+
+        # 6. Decrypt content (only the frames covering the range)
+        body = await _primed(_iter_plaintext(storage, stored, layout=layout, start=start, end=end))
+
+        # 7. Log download
         log_event(
             user_id=request.client.host,
             action="download",
-            metadata={"file_id": file_id}
+            metadata={"file_id": file_id, "range": f"{start}-{end - 1}"} if byte_range else {"file_id": file_id}
         )
 
-        # 7. Prepare headers: Content-Disposition + encrypted DEK
-        buf = BytesIO(plaintext)
+        # 8. Prepare headers: Content-Disposition + encrypted DEK (+ range info)
         safe_name = quote(filename, safe='')
         disposition = f"attachment; filename*=UTF-8''{safe_name}"
         b64_wrapped = base64.b64encode(wrapped_key).decode('ascii')
@@ -148,9 +603,20 @@ async def download_file(file_id: str, request: Request):
             "Content-Disposition": disposition,
             "X-Encrypted-DEK": b64_wrapped
         }
+        status_code = status.HTTP_200_OK
+        if layout is not None:
+            headers["Accept-Ranges"] = "bytes"
+            headers["ETag"] = etag
+            if byte_range:
+                status_code = status.HTTP_206_PARTIAL_CONTENT
+                headers["Content-Range"] = f"bytes {start}-{end - 1}/{layout.plaintext_size}"
+                headers["Content-Length"] = str(end - start)
+            else:
+                headers["Content-Length"] = str(layout.plaintext_size)
 
         return StreamingResponse(
-            buf,
+            body,
+            status_code=status_code,
             media_type="application/octet-stream",
             headers=headers
         )
@@ -161,22 +627,140 @@ async def download_file(file_id: str, request: Request):
         print("❌ Decrypt failed:", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+class _ZipSink(io.RawIOBase):
+    """Write-only, non-seekable sink so zipfile emits a streamable archive we can drain."""
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buf += b
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+def _safe_name(name: str, file_id: str) -> str:
+    """
+    Reduce a client-supplied filename to a bare basename usable as a zip entry:
+    no directories, drive letters, "..", NUL or other control characters.
+    """
+    name = "".join(ch for ch in name or "" if ch >= " " and ch != "\x7f")
+    name = name.replace("\\", "/").rsplit("/", 1)[-1]
+    name = re.sub(r"^[A-Za-z]:", "", name).strip()
+    if not name.strip("."):
+        return f"{file_id}.bin"
+    return name
+
+def _unique_name(name: str, used: set) -> str:
+    candidate, n = name, 1
+    root, ext = os.path.splitext(name)
+    while candidate in used:
+        candidate = f"{root} ({n}){ext}"
+        n += 1
+    used.add(candidate)
+    return candidate
+
+async def _iter_zip(storage: StorageBackend, files: List[_StoredFile]) -> AsyncIterator[bytes]:
+    """Build the zip incrementally: each decrypted frame is written and flushed straight away."""
+    sink = _ZipSink()
+    used = set()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+        for stored in files:
+            # Filenames come from upload metadata: never let them escape the extraction directory
+            name = _unique_name(_safe_name(stored.filename, stored.file_id), used)
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            with zf.open(info, "w", force_zip64=True) as entry:
+                async for chunk in _iter_plaintext(storage, stored):
+                    entry.write(chunk)
+                    if data := sink.drain():
+                        yield data
+            if data := sink.drain():
+                yield data
+    if data := sink.drain():
+        yield data
+
+# Batch download endpoint
+@router.post(
+    "/download-batch",
+    summary="Download many files as one zip",
+    description="Fetch metadata and unwrap DEKs for all requested files concurrently, then stream them back as a single zip archive."
+)
+async def download_batch(
+    data: DownloadBatchIn,
+    request: Request,
+    storage: StorageBackend = Depends(get_storage),
+):
+    file_ids = list(dict.fromkeys(data.file_ids))
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def prepare(file_id: str) -> _StoredFile:
+        async with slots:
+            return await _load_file(storage, file_id)
+
+    # Metadata reads and KMS unwraps for all files run concurrently
+    # (KMS itself is bounded by the kms_pool worker count)
+    results = await asyncio.gather(*(prepare(fid) for fid in file_ids), return_exceptions=True)
+    missing = [
+        fid for fid, r in zip(file_ids, results)
+        if isinstance(r, HTTPException) and r.status_code == 404
+    ]
+    if missing:
+        raise HTTPException(status_code=404, detail={"missing": missing})
+    for fid, r in zip(file_ids, results):
+        if isinstance(r, HTTPException):
+            raise r
+        if isinstance(r, BaseException):
+            log_event(
+                user_id=request.client.host,
+                action="download_failed",
+                metadata={"file_id": fid, "batch": True, "error": f"{type(r).__name__}: {r}"},
+            )
+            raise HTTPException(status_code=500, detail=str(r))
+
+    log_event(
+        user_id=request.client.host,
+        action="download",
+        metadata={"file_ids": file_ids, "batch": True}
+    )
+    return StreamingResponse(
+        _iter_zip(storage, results),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="files.zip"'}
+    )
+
 # Delete endpoint
 @router.delete(
     "/delete/{file_id}",
     response_model=DeleteOut,
     status_code=status.HTTP_200_OK,
     summary="Delete stored file",
-    description="Remove both ciphertext and wrapped key from GCS and log the deletion."
+    description="Remove the file object (or a legacy ciphertext + wrapped key pair) from object storage and log the deletion."
 )
-def delete_file(file_id: str, request: Request):
+async def delete_file(
+    file_id: str,
+    request: Request,
+    storage: StorageBackend = Depends(get_storage),
+    catalog: FileCatalog = Depends(get_catalog),
+):
     deleted_id = file_id
-    for suffix in ("bin", "key"):
-        blob = bucket.blob(f"{file_id}.{suffix}")
+    for suffix in ("enc", "bin", "key"):
         try:
-            blob.delete()
-        except gcp_exceptions.NotFound:
+            await storage.delete(f"{file_id}.{suffix}")
+        except ObjectNotFound:
             continue
+    await catalog.delete(file_id)
+    dek_cache.invalidate(file_id)
     log_event(
         user_id=request.client.host,
         action="delete",
@@ -190,15 +774,21 @@ def delete_file(file_id: str, request: Request):
     response_model=ListOut,
     status_code=status.HTTP_200_OK,
     summary="List stored files",
-    description="List all encrypted .bin objects in the bucket, returning file_id and original filename."
+    description="List stored files from the file catalog, with owner filtering, filename prefix search and cursor-based pagination."
 )
-def list_files():
-    blobs = bucket.list_blobs()
-    items = []
-    for blob in blobs:
-        if not blob.name.endswith(".bin"):
-            continue
-        fid = blob.name[:-4]
-        md = blob.metadata or {}
-        items.append(FileItem(file_id=fid, filename=md.get("filename", f"{fid}.bin")))
-    return {"files": items}
+async def list_files(
+    owner: Optional[str] = Query(None, description="Only files uploaded by this user"),
+    prefix: Optional[str] = Query(None, description="Filename prefix to search for"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    catalog: FileCatalog = Depends(get_catalog),
+):
+    try:
+        records, next_cursor = await catalog.list(owner_id=owner, prefix=prefix, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    items = [
+        FileItem(file_id=r.file_id, filename=r.filename, owner_id=r.owner_id, size=r.size, upload_time=r.upload_time)
+        for r in records
+    ]
+    return {"files": items, "next_cursor": next_cursor}
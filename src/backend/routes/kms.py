@@ -1,40 +1,87 @@
-from fastapi import APIRouter, HTTPException
-from google.cloud import kms_v1
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import asyncio
 import base64
 import os
 
+from ..kms.dek_cache import dek_cache
+from ..kms.envelope import KEKRing
+from ..kms.public_key_cache import PublicKeyCache
+# KMS 後端由 KMS_PROVIDER 決定（gcp / local），第一次用到時才建立，
+# 所以沒有 GCP 設定也能啟動（local provider 見 kms/providers.py）
+from ..kms.providers import get_kms_provider
+
 router = APIRouter()
 
-# 替換成你實際的設定
-PROJECT_ID = os.getenv("GCP_PROJECT_ID")
-LOCATION_ID = os.getenv("GCP_LOCATION", "asia-east1")
-KEY_RING_ID = os.getenv("GCP_KEY_RING")
-CRYPTO_KEY_ID = os.getenv("GCP_CRYPTO_KEY")
-KEY_VERSION_ID = os.getenv("GCP_KEY_VERSION", "1")
 
-if not all([PROJECT_ID, LOCATION_ID, KEY_RING_ID, CRYPTO_KEY_ID]):
-    raise RuntimeError("請先在 .env 裡正確設定 GCP_PROJECT_ID / GCP_LOCATION / GCP_KEY_RING / GCP_CRYPTO_KEY")
+# --- 取得 RSA 公鑰（每個 key version 快取一份，用 ETag 讓瀏覽器 / 前端重新驗證）---
+@router.get("/public-key")
+async def get_public_key(request: Request):
+    try:
+        entry = await public_key_cache.get()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": f"public, max-age={int(public_key_cache.refresh)}",
+        "X-Key-Version": entry.key_version,
+    }
+    if entry.etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse({"pem": entry.pem, "key_version": entry.key_version}, headers=headers)
 
 
-client = kms_v1.KeyManagementServiceClient()
+# KMS 呼叫專用的 worker pool：同時打 KMS 的請求數量上限（批次下載時也不會瞬間打爆配額）
+KMS_MAX_CONCURRENCY = int(os.getenv("KMS_MAX_CONCURRENCY", "8"))
+kms_pool = ThreadPoolExecutor(max_workers=KMS_MAX_CONCURRENCY, thread_name_prefix="kms")
 
-KEY_VERSION_NAME = client.crypto_key_version_path(
-    PROJECT_ID, LOCATION_ID, KEY_RING_ID, CRYPTO_KEY_ID, KEY_VERSION_ID
-)
+# 在 key_version metadata 出現之前寫入的 .key 沒有紀錄版本；輪替 GCP_KEY_VERSION 之後
+# 要把舊的版本（完整名稱或版本號）設在這裡，否則會用目前的版本去解
+LEGACY_KEY_VERSION = os.getenv("KMS_LEGACY_KEY_VERSION")
 
-CRYPTO_KEY_NAME = client.crypto_key_path(
-    PROJECT_ID, LOCATION_ID, KEY_RING_ID, CRYPTO_KEY_ID
-)
 
-# --- 取得 RSA 公鑰 ---
-@router.get("/public-key")
-async def get_public_key():
-    try:
-        response = client.get_public_key(request={"name": KEY_VERSION_NAME})
-        return {"pem": response.pem}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+def key_version_of(metadata: Dict[str, str]) -> Optional[str]:
+    """某個 RSA 包裝物件該用哪個 key version 解開（None = provider 目前的版本）。"""
+    version = metadata.get("key_version") or LEGACY_KEY_VERSION
+    return get_kms_provider().version_name(version) if version else None
+
+# --- 直接呼叫 KMS 解密（不經過快取）---
+async def kms_decrypt(ciphertext: bytes, key_version: Optional[str] = None) -> bytes:
+    """KMS SDK 是 blocking 的，所以丟到 kms_pool 執行。"""
+    provider = get_kms_provider()
+    return await asyncio.get_running_loop().run_in_executor(
+        kms_pool, provider.asymmetric_decrypt, ciphertext, key_version
+    )
+
+
+# --- 解包 DEK（先查快取，miss 才打 KMS）---
+async def unwrap_dek(
+    wrapped_key: bytes, file_id: Optional[str] = None, key_version: Optional[str] = None
+) -> bytes:
+    """files（舊格式的 .key）與 /kms/decrypt 共用。"""
+    return await dek_cache.get_or_load(
+        dek_cache.make_key(file_id, wrapped_key), lambda: kms_decrypt(wrapped_key, key_version)
+    )
+
+
+async def _fetch_public_key(key_version: str) -> str:
+    provider = get_kms_provider()
+    return await asyncio.get_running_loop().run_in_executor(kms_pool, provider.get_public_key, key_version)
+
+
+public_key_cache = PublicKeyCache(_fetch_public_key, lambda: get_kms_provider().key_version_name)
+
+
+async def _current_public_key() -> Tuple[str, str]:
+    entry = await public_key_cache.get()
+    return entry.pem, entry.key_version
+
+
+# 檔案 DEK 改包在 data-KEK 底下，KMS 只負責解 KEK（見 kms/envelope.py）
+kek_ring = KEKRing(kms_decrypt, _current_public_key)
 
 
 # --- 解密由前端加密的 DEK ---
@@ -45,12 +92,21 @@ class EncryptedDEK(BaseModel):
 async def decrypt_wrapped_key(data: EncryptedDEK):
     try:
         ciphertext = base64.b64decode(data.wrapped_key)
-        response = client.asymmetric_decrypt(request={
-            "name": KEY_VERSION_NAME,
-            "ciphertext": ciphertext
-        })
+        plaintext = await unwrap_dek(ciphertext)
         # 將解密後的 key 回傳為 base64 字串
-        plaintext_key = base64.b64encode(response.plaintext).decode()
+        plaintext_key = base64.b64encode(plaintext).decode()
         return {"key": plaintext_key}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+# --- DEK 快取統計 ---
+@router.get("/dek-cache/stats")
+async def dek_cache_stats():
+    return dek_cache.stats()
+
+
+# --- data-KEK 統計 ---
+@router.get("/kek-ring/stats")
+async def kek_ring_stats():
+    return kek_ring.stats()
@@ -1,13 +1,28 @@
 # backend/routes/totp.py
+import os
+import math
+import asyncio
 import pyotp
-from fastapi import APIRouter, HTTPException, Depends, status, Request
+from fastapi import APIRouter, HTTPException, Depends, status, Request, Query, Response
 from pydantic import BaseModel, Field
 
 from .. import db
 from ..audit.logger import log_event
+from ..qr_cache import QR_FORMATS, qr_cache, qr_digest
+from ..ratelimit import SlidingWindowLimiter
+from ..totp_verifier import TotpReplay, totp_verifier
 
 router = APIRouter()
 
+# Verification attempts allowed per sliding window, per user and per client IP
+RATE_WINDOW = float(os.getenv("TOTP_RATE_WINDOW", "60"))
+user_limiter = SlidingWindowLimiter(int(os.getenv("TOTP_USER_LIMIT", "5")), RATE_WINDOW)
+ip_limiter = SlidingWindowLimiter(int(os.getenv("TOTP_IP_LIMIT", "30")), RATE_WINDOW)
+
+# The event loop only keeps weak references to tasks: hold fire-and-forget
+# QR warm-ups here until they finish so they are not garbage-collected mid-run
+_background_tasks = set()
+
 class RegisterIn(BaseModel):
     user_id: str = Field(..., example="user123", description="Unique identifier for the user")
 
@@ -38,9 +53,13 @@ async def totp_register(data: RegisterIn, request: Request):
     Logs the registration event with request metadata for auditing.
     """
     secret = pyotp.random_base32()
-    db.save_totp_secret(data.user_id, secret)
+    await asyncio.to_thread(db.save_totp_secret, data.user_id, secret)
     totp = pyotp.TOTP(secret)
     uri = totp.provisioning_uri(name=data.user_id, issuer_name="My Secure App")
+    # Pre-render the QR so the follow-up /register/qr request is a cache hit
+    task = asyncio.create_task(qr_cache.warm(uri))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
     log_event(
         user_id=data.user_id,
@@ -61,17 +80,42 @@ async def totp_verify(data: VerifyIn, request: Request):
     """
     Verify the user's TOTP code. If valid, enable TOTP for the user
     and log the event. If invalid, log the failure and return an error.
+    Rate limits are checked before any HMAC work, and a code whose
+    time-step was already accepted is rejected as a replay.
     """
+    ip = request.client.host
+    retry_after = ip_limiter.hit(ip) or user_limiter.hit(data.user_id)
+    if retry_after:
+        log_event(
+            user_id=data.user_id,
+            action="2fa_rate_limited",
+            metadata={"ip": ip}
+        )
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many verification attempts",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
     try:
-        secret = db.get_totp_secret(data.user_id)
+        ok = await asyncio.to_thread(totp_verifier.verify, data.user_id, data.code)
     except KeyError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="TOTP secret not found for this user"
         )
+    except TotpReplay:
+        log_event(
+            user_id=data.user_id,
+            action="2fa_verify_replay",
+            metadata={"ip": ip}
+        )
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="TOTP code already used"
+        )
 
-    totp = pyotp.TOTP(secret)
-    if not totp.verify(data.code):
+    if not ok:
         log_event(
             user_id=data.user_id,
             action="2fa_verify_failed",
@@ -82,7 +126,7 @@ async def totp_verify(data: VerifyIn, request: Request):
             detail="Invalid TOTP code"
         )
 
-    db.enable_totp(data.user_id)
+    await asyncio.to_thread(db.enable_totp, data.user_id)
     log_event(
         user_id=data.user_id,
         action="2fa_enable",
@@ -90,17 +134,30 @@ async def totp_verify(data: VerifyIn, request: Request):
     )
 
     return {"success": True}
-import qrcode
-from fastapi.responses import StreamingResponse
-from io import BytesIO
-
-@router.get("/register/qr/{user_id}")
-def totp_qr(user_id: str):
-    secret = db.get_totp_secret(user_id)
+@router.get(
+    "/register/qr/{user_id}",
+    summary="TOTP QR Code",
+    description="Return the provisioning URI as a QR image (PNG or SVG). Images are cached by content hash and revalidated with ETag."
+)
+async def totp_qr(
+    user_id: str,
+    request: Request,
+    format: str = Query("png", pattern="^(png|svg)$", description="Image format")
+):
+    try:
+        secret = await asyncio.to_thread(db.get_totp_secret, user_id)
+    except KeyError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="TOTP secret not found for this user"
+        )
     uri = pyotp.TOTP(secret).provisioning_uri(name=user_id, issuer_name="My Secure App")
 
-    img = qrcode.make(uri)
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-    return StreamingResponse(buf, media_type="image/png")
+    # The image embeds the secret: allow private revalidation only
+    headers = {"Cache-Control": "private, no-cache"}
+    etag = f'"{qr_digest(uri, format)}"'
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={**headers, "ETag": etag})
+
+    _, image = await qr_cache.get(uri, format)
+    return Response(content=image, media_type=QR_FORMATS[format], headers={**headers, "ETag": etag})
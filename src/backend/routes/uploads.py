@@ -0,0 +1,226 @@
+# backend/routes/uploads.py
+import os
+import json
+import time
+import base64
+from typing import AsyncIterator, List, Optional
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Path, Request, status
+from pydantic import BaseModel, Field
+
+from .files import parse_upload_meta, store_file
+from ..audit.logger import log_event
+from ..catalog import FileCatalog, get_catalog
+from ..storage.base import StorageBackend, ObjectNotFound, get_storage
+
+router = APIRouter()
+
+# Sessions untouched for this long are garbage-collected together with their parts
+SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+# Upper bound for one PUT part; parts are streamed so this only caps abuse, not memory
+MAX_PART_SIZE = int(os.getenv("UPLOAD_MAX_PART_SIZE", str(64 * 1024 * 1024)))
+MAX_PARTS = 10000
+GC_INTERVAL = 600
+
+SESSION_ID = Path(..., pattern="^[0-9a-f]{32}$", description="Upload session id from /upload/init")
+_last_gc = 0.0
+
+# Pydantic schemas
+class InitIn(BaseModel):
+    iv: str | List[int] = Field(..., description="Base IV (hex string or byte array)")
+    encrypted_dek: str = Field(..., description="RSA-OAEP wrapped DEK (base64)")
+    filename: str = Field(..., description="Original filename")
+    algorithm: str = Field("AES-GCM-STREAM", description="Ciphertext format of the concatenated parts")
+    user_id: Optional[str] = Field(None, description="Uploading user")
+    key_version: Optional[str] = Field(None, description="KMS key version the DEK was wrapped with (from /kms/public-key)")
+
+class InitOut(BaseModel):
+    session_id: str = Field(..., description="Id to use for part uploads and completion")
+    expires_at: float = Field(..., description="Unix time after which an idle session is discarded")
+    max_part_size: int = Field(..., description="Largest accepted part in bytes")
+
+class PartOut(BaseModel):
+    part: int
+    size: int
+
+class SessionOut(BaseModel):
+    session_id: str
+    parts: List[PartOut] = Field(..., description="Parts received so far (for resuming)")
+
+class CompleteIn(BaseModel):
+    parts: Optional[int] = Field(None, ge=1, description="Expected number of parts (0..parts-1)")
+
+class CompleteOut(BaseModel):
+    file_id: str
+    size: int
+
+def _prefix(session_id: str) -> str:
+    return f"uploads/{session_id}/"
+
+def _part_name(session_id: str, part: int) -> str:
+    return f"{_prefix(session_id)}part-{part:06d}"
+
+async def _load_session(storage: StorageBackend, session_id: str) -> dict:
+    try:
+        return json.loads(await storage.get(_prefix(session_id) + "session.json"))
+    except ObjectNotFound:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+
+async def _list_parts(storage: StorageBackend, session_id: str) -> List[PartOut]:
+    parts = []
+    async for obj in storage.list(prefix=_prefix(session_id) + "part-"):
+        parts.append(PartOut(part=int(obj.name.rsplit("-", 1)[1]), size=obj.size))
+    return sorted(parts, key=lambda p: p.part)
+
+async def _delete_prefix(storage: StorageBackend, prefix: str) -> None:
+    names = [obj.name async for obj in storage.list(prefix=prefix)]
+    for name in names:
+        try:
+            await storage.delete(name)
+        except ObjectNotFound:
+            pass
+
+async def gc_upload_sessions(storage: StorageBackend, max_age: int = SESSION_TTL) -> int:
+    """Remove sessions (and their parts) idle for longer than max_age seconds."""
+    cutoff = time.time() - max_age
+    latest = {}
+    async for obj in storage.list(prefix="uploads/"):
+        sid = obj.name.split("/")[1]
+        latest[sid] = max(latest.get(sid, 0.0), obj.updated or 0.0)
+    expired = [sid for sid, ts in latest.items() if ts < cutoff]
+    for sid in expired:
+        await _delete_prefix(storage, _prefix(sid))
+    return len(expired)
+
+def _maybe_gc(storage: StorageBackend, background: BackgroundTasks) -> None:
+    # GC lists the whole uploads/ prefix, so it runs after the response is sent
+    # instead of holding up the /upload/init that happened to trigger it
+    global _last_gc
+    if time.time() - _last_gc >= GC_INTERVAL:
+        _last_gc = time.time()
+        background.add_task(gc_upload_sessions, storage)
+
+@router.post(
+    "/upload/init",
+    response_model=InitOut,
+    status_code=status.HTTP_201_CREATED,
+    summary="Start a resumable upload",
+    description="Create an upload session holding the file metadata; ciphertext parts are PUT separately."
+)
+async def upload_init(
+    data: InitIn,
+    request: Request,
+    background: BackgroundTasks,
+    storage: StorageBackend = Depends(get_storage),
+):
+    _maybe_gc(storage, background)
+    meta = data.model_dump()
+    iv, encrypted_dek = parse_upload_meta(meta)
+    session_id = os.urandom(16).hex()
+    session = {
+        "iv": iv.hex(),
+        "encrypted_dek": base64.b64encode(encrypted_dek).decode("ascii"),
+        "filename": data.filename,
+        "algorithm": data.algorithm,
+        "user_id": data.user_id,
+        "key_version": data.key_version,
+        "client": request.client.host,
+        "created": time.time(),
+    }
+    await storage.put(_prefix(session_id) + "session.json", json.dumps(session).encode())
+    return {"session_id": session_id, "expires_at": session["created"] + SESSION_TTL, "max_part_size": MAX_PART_SIZE}
+
+@router.put(
+    "/upload/{session_id}/{part}",
+    response_model=PartOut,
+    summary="Upload one ciphertext part",
+    description="Store part N of the ciphertext. Re-sending a part overwrites it, so clients can retry or resume."
+)
+async def upload_part(
+    request: Request,
+    session_id: str = SESSION_ID,
+    part: int = Path(..., ge=0, lt=MAX_PARTS),
+    storage: StorageBackend = Depends(get_storage),
+):
+    await _load_session(storage, session_id)
+
+    async def body() -> AsyncIterator[bytes]:
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > MAX_PART_SIZE:
+                raise HTTPException(status_code=413, detail="Part too large")
+            yield chunk
+
+    stat = await storage.put(_part_name(session_id, part), body())
+    return {"part": part, "size": stat.size}
+
+@router.get(
+    "/upload/{session_id}",
+    response_model=SessionOut,
+    summary="Upload session status",
+    description="List the parts received so far, so an interrupted client knows what to resend."
+)
+async def upload_status(session_id: str = SESSION_ID, storage: StorageBackend = Depends(get_storage)):
+    await _load_session(storage, session_id)
+    return {"session_id": session_id, "parts": await _list_parts(storage, session_id)}
+
+@router.post(
+    "/upload/{session_id}/complete",
+    response_model=CompleteOut,
+    status_code=status.HTTP_201_CREATED,
+    summary="Finish a resumable upload",
+    description="Concatenate the parts in order into the final ciphertext object, store the wrapped DEK and drop the session."
+)
+async def upload_complete(
+    request: Request,
+    data: Optional[CompleteIn] = None,
+    session_id: str = SESSION_ID,
+    storage: StorageBackend = Depends(get_storage),
+    catalog: FileCatalog = Depends(get_catalog),
+):
+    session = await _load_session(storage, session_id)
+    parts = await _list_parts(storage, session_id)
+    expected = data.parts if data and data.parts else len(parts)
+    if not parts or [p.part for p in parts] != list(range(expected)):
+        have = {p.part for p in parts}
+        raise HTTPException(
+            status_code=409,
+            detail={"missing_parts": [n for n in range(expected) if n not in have][:100]}
+        )
+
+    async def concatenated() -> AsyncIterator[bytes]:
+        # One part chunk in memory at a time
+        for p in parts:
+            async for chunk in storage.iter_range(_part_name(session_id, p.part), 0, p.size):
+                yield chunk
+
+    file_id = os.urandom(16).hex()
+    stat_bin = await store_file(
+        storage, catalog, file_id, concatenated(),
+        iv=bytes.fromhex(session["iv"]),
+        encrypted_dek=base64.b64decode(session["encrypted_dek"]),
+        filename=session["filename"],
+        alg=session["algorithm"],
+        owner_id=session["user_id"],
+        key_version=session.get("key_version"),
+    )
+    await _delete_prefix(storage, _prefix(session_id))
+
+    log_event(
+        user_id=request.client.host,
+        action="upload",
+        metadata={"file_id": file_id, "filename": session["filename"], "parts": len(parts)}
+    )
+    return {"file_id": file_id, "size": stat_bin.size}
+
+@router.delete(
+    "/upload/{session_id}",
+    status_code=status.HTTP_200_OK,
+    summary="Abort a resumable upload",
+    description="Discard the session and every part uploaded so far."
+)
+async def upload_abort(session_id: str = SESSION_ID, storage: StorageBackend = Depends(get_storage)):
+    await _load_session(storage, session_id)
+    await _delete_prefix(storage, _prefix(session_id))
+    return {"aborted": session_id}
@@ -1,16 +1,16 @@
 # backend/routes/webauthn.py
 
 import base64
-from fastapi import APIRouter, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, Field
 from fido2.server import Fido2Server
 from fido2.webauthn import PublicKeyCredentialRpEntity
 
-# --- In-memory storage ---
-user_db = {}
-challenge_db = {}
+from ..webauthn_store import WebAuthnStore, get_webauthn_store
+from ..webauthn_verify import VerifyQueueFull, assertion_verifier
 
 # --- Router & Schemas ---
 router = APIRouter()
@@ -59,17 +59,23 @@ def b64encode(data: bytes) -> str:
     return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
 
 # --- Endpoints ---
+def _challenge_key(kind: str, username: str) -> str:
+    return f"{kind}:{username}"
+
 @router.post("/register/begin")
-async def register_begin(req: UsernameReq):
+async def register_begin(req: UsernameReq, store: WebAuthnStore = Depends(get_webauthn_store)):
+    # Existing credentials are excluded so the same authenticator is not registered twice
+    existing = await asyncio.to_thread(store.get_credentials, req.username)
     try:
         registration_data, state = fido2_server.register_begin(
             {"id": req.username.encode(), "name": req.username, "displayName": req.username},
+            credentials=existing,
             user_verification="preferred"
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    challenge_db[req.username] = state
+    await asyncio.to_thread(store.put_challenge, _challenge_key("register", req.username), state)
 
     payload = jsonable_encoder(
         registration_data,
@@ -78,25 +84,25 @@ async def register_begin(req: UsernameReq):
     return JSONResponse(content=payload)
 
 @router.post("/register/complete")
-async def register_complete(req: AttestationReq):
-    state = challenge_db.get(req.username)
+async def register_complete(req: AttestationReq, store: WebAuthnStore = Depends(get_webauthn_store)):
+    state = await asyncio.to_thread(store.pop_challenge, _challenge_key("register", req.username))
     if not state:
         raise HTTPException(status_code=400, detail="No challenge found for user")
     try:
         auth_data = fido2_server.register_complete(state, req.attestation)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    user_db[req.username] = auth_data.credential_data
+    await asyncio.to_thread(store.add_credential, req.username, auth_data.credential_data)
     return {"success": True}
 
 @router.post("/authenticate/begin")
-async def authenticate_begin(req: UsernameReq):
-    credentials = [user_db.get(req.username)]
-    if not credentials[0]:
+async def authenticate_begin(req: UsernameReq, store: WebAuthnStore = Depends(get_webauthn_store)):
+    credentials = await asyncio.to_thread(store.get_credentials, req.username)
+    if not credentials:
         raise HTTPException(status_code=404, detail="User not registered")
 
     auth_data, state = fido2_server.authenticate_begin(credentials)
-    challenge_db[req.username] = state
+    await asyncio.to_thread(store.put_challenge, _challenge_key("authenticate", req.username), state)
 
     payload = jsonable_encoder(
         auth_data,
@@ -105,13 +111,25 @@ async def authenticate_begin(req: UsernameReq):
     return JSONResponse(content=payload)
 
 @router.post("/authenticate/complete")
-async def authenticate_complete(req: AssertionReq):
-    state = challenge_db.get(req.username)
-    credentials = [user_db.get(req.username)]
-    if not state or not credentials[0]:
+async def authenticate_complete(req: AssertionReq, store: WebAuthnStore = Depends(get_webauthn_store)):
+    state = await asyncio.to_thread(store.pop_challenge, _challenge_key("authenticate", req.username))
+    credentials = await asyncio.to_thread(store.get_credentials, req.username)
+    if not state or not credentials:
         raise HTTPException(status_code=400, detail="Invalid authentication flow")
     try:
-        fido2_server.authenticate_complete(state, credentials, req.assertion)
+        # Signature check runs in the verifier's thread pool with cached public keys
+        await assertion_verifier.authenticate_complete(fido2_server, state, credentials, req.assertion)
+    except VerifyQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many pending verifications",
+            headers={"Retry-After": "1"}
+        )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return {"success": True}
\ No newline at end of file
+    return {"success": True}
+
+@router.get("/metrics")
+async def verify_metrics():
+    """Assertion verification queue, key cache and latency metrics."""
+    return assertion_verifier.stats()
\ No newline at end of file
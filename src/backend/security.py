@@ -0,0 +1,49 @@
+# backend/security.py
+"""
+路由共用的 mTLS dependency（原本寫在 main.py，搬出來讓各個 router 也能用）。
+
+    get_client_cert：持有有效 client certificate 才能進入
+    require_admin  ：另外要求憑證的 CN 在 MTLS_ADMIN_CNS 名單裡（逗號分隔，預設 admin）
+"""
+import os
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from fastapi import Depends, HTTPException, Request
+
+from .certs.mtls import CertRejected, RevocationUnavailable, get_verifier
+
+MTLS_ADMIN_CNS = frozenset(cn.strip() for cn in os.getenv("MTLS_ADMIN_CNS", "admin").split(",") if cn.strip())
+
+
+def get_client_cert(request: Request) -> x509.Certificate:
+    """
+    從 TLS 連線中擷取 DER 格式的 client certificate，
+    檢查 CA 簽章、有效期間與撤銷狀態後回傳 x509.Certificate 物件。
+    同一張憑證的解析與驗證結果會以指紋快取（見 certs/mtls.py）。
+    """
+    ssl_obj = request.scope.get("ssl_object")
+    if not ssl_obj:
+        raise HTTPException(status_code=401, detail="TLS required")
+    der = ssl_obj.getpeercert(binary_form=True)
+    if not der:
+        raise HTTPException(status_code=401, detail="Client cert required")
+    try:
+        return get_verifier().verify(der)
+    except CertRejected as e:
+        raise HTTPException(status_code=403 if e.revoked else 401, detail=e.reason)
+    except RevocationUnavailable:
+        raise HTTPException(status_code=503, detail="Certificate revocation status unavailable")
+    except FileNotFoundError:
+        raise HTTPException(status_code=503, detail="mTLS CA not configured")
+
+
+def common_name(cert: x509.Certificate):
+    cn_attr = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+    return cn_attr[0].value if cn_attr else None
+
+
+def require_admin(cert: x509.Certificate = Depends(get_client_cert)) -> x509.Certificate:
+    if common_name(cert) not in MTLS_ADMIN_CNS:
+        raise HTTPException(status_code=403, detail="Admin certificate required")
+    return cert
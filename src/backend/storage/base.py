@@ -0,0 +1,118 @@
+# backend/storage/base.py
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import AsyncIterable, AsyncIterator, Dict, Optional, Union
+
+Body = Union[bytes, AsyncIterable[bytes]]
+
+
+class ObjectNotFound(KeyError):
+    """指定的物件不存在（對應 GCS 的 NotFound）。"""
+
+
+class StorageUnavailable(OSError):
+    """backend 本身的錯誤（網路、權限、配額），各實作把 SDK 的例外轉成這個。"""
+
+
+class ObjectChanged(Exception):
+    """讀寫時指定的 generation 已經不是物件目前的版本（被覆寫或刪除過，對應 GCS 的 PreconditionFailed）。"""
+
+
+@dataclass
+class ObjectStat:
+    name: str
+    size: int
+    metadata: Dict[str, str] = field(default_factory=dict)
+    updated: Optional[float] = None  # unix timestamp
+    generation: Optional[str] = None  # 每次 put 都會變；傳給 get_range 可以把讀取固定在這一版
+
+
+class StorageBackend(ABC):
+    """
+    非同步的物件儲存介面，files 路由只透過它存取密文與 wrapped key。
+    所有 blocking I/O 都必須在實作內部移出 event loop。
+    """
+
+    @abstractmethod
+    async def put(
+        self,
+        name: str,
+        data: Body,
+        metadata: Optional[Dict[str, str]] = None,
+        if_generation_match: Optional[str] = None,
+    ) -> ObjectStat:
+        """
+        寫入整個物件；data 可以是 bytes 或 async chunk 串流，metadata 在建立時一起寫入。
+        有給 if_generation_match 時，只有物件目前還是那一版才寫入（"0" 表示物件必須不存在），
+        否則丟 ObjectChanged、不做任何修改（同 GCS 的 ifGenerationMatch）。
+        """
+
+    @abstractmethod
+    async def get_range(
+        self, name: str, start: int = 0, end: Optional[int] = None, generation: Optional[str] = None
+    ) -> bytes:
+        """
+        讀取 [start, end) 的內容，end 為 None 表示讀到結尾。
+        有給 generation（來自 stat）而物件已經被覆寫成別的版本時丟 ObjectChanged，
+        這樣分好幾次讀的內容保證來自同一版。
+        """
+
+    @abstractmethod
+    async def stat(self, name: str) -> ObjectStat:
+        ...
+
+    @abstractmethod
+    async def delete(self, name: str) -> None:
+        ...
+
+    @abstractmethod
+    def list(self, prefix: str = "") -> AsyncIterator[ObjectStat]:
+        """依名稱順序列出物件（async iterator）。"""
+
+    async def get(self, name: str) -> bytes:
+        return await self.get_range(name)
+
+    async def iter_range(
+        self,
+        name: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        chunk_size: int = 1024 * 1024,
+        generation: Optional[str] = None,
+    ) -> AsyncIterator[bytes]:
+        """用多次 get_range 分塊讀取，記憶體只需要一個 chunk；generation 的意思同 get_range。"""
+        if end is None:
+            end = (await self.stat(name)).size
+        while start < end:
+            stop = min(start + chunk_size, end)
+            yield await self.get_range(name, start, stop, generation=generation)
+            start = stop
+
+
+async def iter_body(data: Body) -> AsyncIterator[bytes]:
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        yield bytes(data)
+        return
+    async for chunk in data:
+        yield chunk
+
+
+@lru_cache(maxsize=None)
+def get_storage() -> StorageBackend:
+    """
+    依 STORAGE_BACKEND（gcs / local / memory）建立共用的 backend，
+    也可直接當作 FastAPI dependency 使用。
+    """
+    kind = os.getenv("STORAGE_BACKEND", "gcs").lower()
+    if kind == "gcs":
+        from .gcs import GCSStorage
+        return GCSStorage(os.getenv("GCS_BUCKET_NAME", "my-secure-files-bucket"))
+    if kind == "local":
+        from .local import LocalStorage
+        return LocalStorage(os.getenv("LOCAL_STORAGE_DIR", "storage"))
+    if kind == "memory":
+        from .memory import MemoryStorage
+        return MemoryStorage()
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {kind}")
@@ -0,0 +1,124 @@
+# backend/storage/gcs.py
+import asyncio
+from typing import AsyncIterator, Dict, Optional
+
+from google.cloud import storage
+from google.api_core import exceptions as gcp_exceptions
+
+from .base import Body, ObjectChanged, ObjectNotFound, ObjectStat, StorageBackend, StorageUnavailable, iter_body
+
+
+def _to_stat(blob) -> ObjectStat:
+    return ObjectStat(
+        name=blob.name,
+        size=blob.size or 0,
+        metadata=dict(blob.metadata or {}),
+        updated=blob.updated.timestamp() if blob.updated else None,
+        generation=str(blob.generation) if blob.generation else None,
+    )
+
+
+class GCSStorage(StorageBackend):
+    """Google Cloud Storage；SDK 是同步的，所以每個呼叫都丟到 thread 裡執行。"""
+
+    def __init__(self, bucket_name: str, client: Optional[storage.Client] = None, chunk_size: int = 1024 * 1024):
+        self.client = client or storage.Client()
+        self.bucket = self.client.bucket(bucket_name)
+        self.chunk_size = chunk_size
+
+    async def put(
+        self,
+        name: str,
+        data: Body,
+        metadata: Optional[Dict[str, str]] = None,
+        if_generation_match: Optional[str] = None,
+    ) -> ObjectStat:
+        try:
+            return await self._put(name, data, metadata, if_generation_match)
+        except gcp_exceptions.PreconditionFailed:
+            raise ObjectChanged(name)
+        except gcp_exceptions.GoogleAPICallError as e:
+            raise StorageUnavailable(str(e)) from e
+
+    async def _put(
+        self, name: str, data: Body, metadata: Optional[Dict[str, str]], if_generation_match: Optional[str]
+    ) -> ObjectStat:
+        blob = self.bucket.blob(name)
+        blob.metadata = metadata or None
+        precondition = {} if if_generation_match is None else {"if_generation_match": int(if_generation_match)}
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            # 上傳的回應就是新的 object resource，SDK 會寫回 blob，不必再 stat 一次
+            await asyncio.to_thread(blob.upload_from_string, bytes(data), **precondition)
+            return _to_stat(blob)
+        else:
+            # resumable upload：metadata 在 session 建立時就一起送出，不需要再 patch()
+            writer = await asyncio.to_thread(blob.open, "wb", chunk_size=self.chunk_size, **precondition)
+            size = 0
+            try:
+                async for chunk in iter_body(data):
+                    await asyncio.to_thread(writer.write, chunk)
+                    size += len(chunk)
+            except BaseException:
+                # 來源中斷時不能 close()：那會把目前為止的內容 finalize 成（截斷的）物件，
+                # 覆寫時還會蓋掉原本完整的那一版；改成取消 resumable session
+                try:
+                    await asyncio.to_thread(writer.terminate)
+                except Exception:
+                    pass  # 沒 finalize 的 session 放著也會自己過期
+                raise
+            await asyncio.to_thread(writer.close)
+            # BlobWriter 不會把完成時的 object resource 寫回 blob，generation / updated 只能留空；
+            # 大小與 metadata 都是自己送出去的，不必為了它們多打一次 stat
+            return ObjectStat(name=name, size=size, metadata=dict(metadata or {}))
+
+    async def get_range(
+        self, name: str, start: int = 0, end: Optional[int] = None, generation: Optional[str] = None
+    ) -> bytes:
+        if end is not None and end <= start:
+            return b""
+        blob = self.bucket.blob(name)
+        try:
+            # GCS 的 end 是 inclusive
+            return await asyncio.to_thread(
+                blob.download_as_bytes,
+                start=start,
+                end=None if end is None else end - 1,
+                if_generation_match=None if generation is None else int(generation),
+            )
+        except gcp_exceptions.NotFound:
+            raise ObjectNotFound(name)
+        except gcp_exceptions.PreconditionFailed:
+            raise ObjectChanged(name)
+        except gcp_exceptions.RequestRangeNotSatisfiable:
+            return b""  # start 超過檔尾（要放在 GoogleAPICallError 之前，它是子類別）
+        except gcp_exceptions.GoogleAPICallError as e:
+            raise StorageUnavailable(str(e)) from e
+
+    async def stat(self, name: str) -> ObjectStat:
+        try:
+            blob = await asyncio.to_thread(self.bucket.get_blob, name)
+        except gcp_exceptions.GoogleAPICallError as e:
+            raise StorageUnavailable(str(e)) from e
+        if blob is None:
+            raise ObjectNotFound(name)
+        return _to_stat(blob)
+
+    async def delete(self, name: str) -> None:
+        try:
+            await asyncio.to_thread(self.bucket.blob(name).delete)
+        except gcp_exceptions.NotFound:
+            raise ObjectNotFound(name)
+        except gcp_exceptions.GoogleAPICallError as e:
+            raise StorageUnavailable(str(e)) from e
+
+    async def list(self, prefix: str = "") -> AsyncIterator[ObjectStat]:
+        pages = self.client.list_blobs(self.bucket, prefix=prefix or None).pages
+
+        def next_page():
+            page = next(pages, None)
+            return None if page is None else list(page)
+
+        # 一次抓一頁，避免在 event loop 上做 HTTP 分頁
+        while (page := await asyncio.to_thread(next_page)) is not None:
+            for blob in page:
+                yield _to_stat(blob)
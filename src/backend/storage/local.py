@@ -0,0 +1,165 @@
+# backend/storage/local.py
+import asyncio
+import fcntl
+import json
+import mmap
+import os
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from .base import Body, ObjectChanged, ObjectNotFound, ObjectStat, StorageBackend, iter_body
+
+META_DIR = ".meta"
+LOCK_FILE = ".lock"
+
+
+def _generation(st: os.stat_result) -> str:
+    # put 一定是 os.replace 一個新檔上去，inode 會變；mtime 防 inode 被重複使用
+    return f"{st.st_ino}-{st.st_mtime_ns}"
+
+
+class LocalStorage(StorageBackend):
+    """
+    本機檔案系統 backend：物件存在 root/<name>，metadata 存在 root/.meta/<name>.json。
+    寫入先寫暫存檔再 os.replace，讀取用 mmap；所有檔案操作都在 thread 裡做。
+    generation 是檔案的 inode + mtime：讀取時檢查已開啟的那個檔，所以檢查跟讀到的內容一定是同一版。
+    寫入 / 刪除在 root/.meta/.lock 的 flock 底下做，if_generation_match 的檢查跟 os.replace 之間
+    不會被別的行程插隊。
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(os.path.join(self.root, META_DIR), exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, name))
+        if not path.startswith(self.root + os.sep) or name.startswith(META_DIR):
+            raise ValueError(f"Invalid object name: {name}")
+        return path
+
+    def _meta_path(self, name: str) -> str:
+        return os.path.join(self.root, META_DIR, name + ".json")
+
+    @contextmanager
+    def _locked(self):
+        # flock 綁在 open file description 上：同一個行程的不同 thread 各自 open 也會互斥
+        with open(os.path.join(self.root, META_DIR, LOCK_FILE), "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def _stat(self, name: str) -> ObjectStat:
+        path = self._path(name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            raise ObjectNotFound(name)
+        try:
+            with open(self._meta_path(name), "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            metadata = {}
+        return ObjectStat(
+            name=name, size=st.st_size, metadata=metadata, updated=st.st_mtime, generation=_generation(st)
+        )
+
+    async def put(
+        self,
+        name: str,
+        data: Body,
+        metadata: Optional[Dict[str, str]] = None,
+        if_generation_match: Optional[str] = None,
+    ) -> ObjectStat:
+        path = self._path(name)
+        tmp = f"{path}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+        await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+        f = await asyncio.to_thread(open, tmp, "wb")
+        try:
+            async for chunk in iter_body(data):
+                await asyncio.to_thread(f.write, chunk)
+            await asyncio.to_thread(f.close)
+            await asyncio.to_thread(self._commit, name, path, tmp, metadata or {}, if_generation_match)
+        except BaseException:
+            f.close()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return await asyncio.to_thread(self._stat, name)
+
+    def _commit(
+        self, name: str, path: str, tmp: str, metadata: Dict[str, str], if_generation_match: Optional[str]
+    ) -> None:
+        meta_path = self._meta_path(name)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        with self._locked():
+            if if_generation_match is not None:
+                try:
+                    current = _generation(os.stat(path))
+                except FileNotFoundError:
+                    current = "0"
+                if current != if_generation_match:
+                    raise ObjectChanged(name)
+            with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(metadata, f)
+            os.replace(meta_path + ".tmp", meta_path)
+            os.replace(tmp, path)
+
+    def _read(self, name: str, start: int, end: Optional[int], generation: Optional[str] = None) -> bytes:
+        try:
+            f = open(self._path(name), "rb")
+        except FileNotFoundError:
+            raise ObjectNotFound(name)
+        with f:
+            st = os.fstat(f.fileno())
+            if generation is not None and generation != _generation(st):
+                raise ObjectChanged(name)
+            size = st.st_size
+            end = size if end is None else min(end, size)
+            if start >= end:
+                return b""
+            # mmap 只把需要的 page 讀進來，大檔的 range read 不必 seek + 複製整段 buffer
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[start:end]
+
+    async def get_range(
+        self, name: str, start: int = 0, end: Optional[int] = None, generation: Optional[str] = None
+    ) -> bytes:
+        return await asyncio.to_thread(self._read, name, start, end, generation)
+
+    async def stat(self, name: str) -> ObjectStat:
+        return await asyncio.to_thread(self._stat, name)
+
+    def _delete(self, name: str) -> None:
+        path = self._path(name)
+        with self._locked():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                raise ObjectNotFound(name)
+            try:
+                os.remove(self._meta_path(name))
+            except FileNotFoundError:
+                pass
+
+    async def delete(self, name: str) -> None:
+        await asyncio.to_thread(self._delete, name)
+
+    def _names(self, prefix: str) -> List[str]:
+        names = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root:
+                dirnames[:] = [d for d in dirnames if d != META_DIR]
+            for fn in filenames:
+                if fn.endswith(".tmp"):
+                    continue
+                name = os.path.relpath(os.path.join(dirpath, fn), self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+    async def list(self, prefix: str = "") -> AsyncIterator[ObjectStat]:
+        for name in await asyncio.to_thread(self._names, prefix):
+            try:
+                yield await asyncio.to_thread(self._stat, name)
+            except ObjectNotFound:
+                continue
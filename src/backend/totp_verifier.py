@@ -0,0 +1,103 @@
+# backend/totp_verifier.py
+"""
+TOTP 驗證（RFC 6238，SHA-1 / 6 位數 / 30 秒）。
+
+- 每個 user 的 secret 只做一次 base32 解碼，並快取已經套上 key 的 HMAC 物件，
+  每個 time-step 只要 copy() 再 update 8 個 bytes。
+- 接受 [t - drift, t + drift] 的 time-step（TOTP_DRIFT_STEPS，預設 1）。
+- 通過後把 time-step 原子地記進 store（db.record_totp_step），同一個或更舊的 step 再送一次就視為重放。
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from . import db
+
+TOTP_DIGITS = 6
+TOTP_INTERVAL = 30
+TOTP_DRIFT_STEPS = int(os.getenv("TOTP_DRIFT_STEPS", "1"))
+TOTP_KEY_CACHE_SIZE = int(os.getenv("TOTP_KEY_CACHE_SIZE", "10000"))
+
+
+class TotpReplay(Exception):
+    """code 正確，但這個 time-step 已經用過了。"""
+
+
+def decode_secret(secret: str) -> bytes:
+    secret = secret.replace(" ", "").upper()
+    return base64.b32decode(secret + "=" * (-len(secret) % 8))
+
+
+def code_at(mac: "hmac.HMAC", step: int, digits: int = TOTP_DIGITS) -> str:
+    h = mac.copy()
+    h.update(step.to_bytes(8, "big"))
+    digest = h.digest()
+    offset = digest[-1] & 0x0F
+    value = int.from_bytes(digest[offset:offset + 4], "big") & 0x7FFFFFFF
+    return str(value % 10 ** digits).zfill(digits)
+
+
+class TotpVerifier:
+    def __init__(
+        self,
+        drift: int = TOTP_DRIFT_STEPS,
+        interval: int = TOTP_INTERVAL,
+        digits: int = TOTP_DIGITS,
+        max_keys: int = TOTP_KEY_CACHE_SIZE,
+    ):
+        self.drift = drift
+        self.interval = interval
+        self.digits = digits
+        self.max_keys = max_keys
+        # user_id -> (secret, 已套 key 的 HMAC 樣板)；secret 變了（重新註冊）就重建
+        self._keys: "OrderedDict[str, Tuple[str, hmac.HMAC]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _mac(self, user_id: str, secret: str) -> "hmac.HMAC":
+        with self._lock:
+            hit = self._keys.get(user_id)
+            if hit and hit[0] == secret:
+                self._keys.move_to_end(user_id)
+                return hit[1]
+        mac = hmac.new(decode_secret(secret), digestmod=hashlib.sha1)
+        with self._lock:
+            self._keys[user_id] = (secret, mac)
+            self._keys.move_to_end(user_id)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+        return mac
+
+    def match(self, user_id: str, secret: str, code: str, now: Optional[float] = None) -> Optional[int]:
+        """回傳符合的 time-step，沒有就回傳 None（整個視窗都會算完，不提早結束）。"""
+        mac = self._mac(user_id, secret)
+        step = int((time.time() if now is None else now) // self.interval)
+        matched = None
+        for s in range(max(step - self.drift, 0), step + self.drift + 1):
+            if hmac.compare_digest(code_at(mac, s, self.digits), code) and matched is None:
+                matched = s
+        return matched
+
+    def verify(self, user_id: str, code: str, now: Optional[float] = None) -> bool:
+        """
+        驗證 code 並記錄 time-step。找不到 secret 丟 KeyError，重放丟 TotpReplay。
+        會碰到資料庫，async 路由裡要用 asyncio.to_thread 呼叫。
+        """
+        secret = db.get_totp_secret(user_id)
+        step = self.match(user_id, secret, code, now)
+        if step is None:
+            return False
+        if not db.record_totp_step(user_id, step):
+            raise TotpReplay(user_id)
+        return True
+
+    def forget(self, user_id: str) -> None:
+        with self._lock:
+            self._keys.pop(user_id, None)
+
+
+totp_verifier = TotpVerifier()
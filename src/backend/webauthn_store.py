@@ -0,0 +1,364 @@
+# backend/webauthn_store.py
+"""
+WebAuthn 的 credential 與 challenge 儲存層（取代 routes/webauthn.py 裡的 user_db / challenge_db dict）。
+
+- credential：一個 user 可以有多把，以 credential_id 為主鍵、user_id 有索引，
+  authenticate_begin 一次查詢就拿到該 user 全部的 credential。
+- challenge：註冊 / 登入流程的 state，帶 TTL，只能取用一次（pop）；
+  過期的紀錄會定期清掉，所以放棄到一半的流程不會讓資料無限長大。
+- 後端跟 TOTP 一樣可選 WEBAUTHN_STORE=sqlite（預設）/ mysql / memory，
+  外面再包一層行程內快取。
+"""
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from fido2.webauthn import AttestedCredentialData
+
+from .db import connect_sqlite, mysql_pool
+
+CHALLENGE_TTL = float(os.getenv("WEBAUTHN_CHALLENGE_TTL", "300"))
+PURGE_INTERVAL = 60.0
+
+
+# --- credential ---
+class CredentialStore(ABC):
+    @abstractmethod
+    def add_credential(self, user_id: str, credential: AttestedCredentialData) -> None: ...
+
+    @abstractmethod
+    def get_credentials(self, user_id: str) -> List[AttestedCredentialData]:
+        """回傳這個 user 所有的 credential（沒有就是空 list）。"""
+
+    @abstractmethod
+    def get_credential(self, credential_id: bytes) -> Optional[Tuple[str, AttestedCredentialData]]:
+        """依 credential_id 查 (user_id, credential)。"""
+
+    @abstractmethod
+    def delete_credential(self, credential_id: bytes) -> bool: ...
+
+
+# --- challenge ---
+class ChallengeStore(ABC):
+    @abstractmethod
+    def put_challenge(self, key: str, state: dict, ttl: float = CHALLENGE_TTL) -> None: ...
+
+    @abstractmethod
+    def pop_challenge(self, key: str) -> Optional[dict]:
+        """取出並刪除；不存在或已過期回傳 None。多個 worker 同時 pop 只有一個拿得到。"""
+
+    @abstractmethod
+    def purge_expired(self) -> int: ...
+
+
+class WebAuthnStore(CredentialStore, ChallengeStore):
+    """routes/webauthn.py 用的完整介面。"""
+
+
+class MemoryCredentialStore(CredentialStore):
+    def __init__(self):
+        self._by_id: Dict[bytes, Tuple[str, AttestedCredentialData]] = {}
+        self._by_user: Dict[str, Dict[bytes, AttestedCredentialData]] = {}
+        self._lock = threading.Lock()
+
+    def add_credential(self, user_id: str, credential: AttestedCredentialData) -> None:
+        with self._lock:
+            self._by_id[credential.credential_id] = (user_id, credential)
+            self._by_user.setdefault(user_id, {})[credential.credential_id] = credential
+
+    def get_credentials(self, user_id: str) -> List[AttestedCredentialData]:
+        with self._lock:
+            return list(self._by_user.get(user_id, {}).values())
+
+    def get_credential(self, credential_id: bytes) -> Optional[Tuple[str, AttestedCredentialData]]:
+        with self._lock:
+            return self._by_id.get(credential_id)
+
+    def delete_credential(self, credential_id: bytes) -> bool:
+        with self._lock:
+            hit = self._by_id.pop(credential_id, None)
+            if hit:
+                self._by_user.get(hit[0], {}).pop(credential_id, None)
+            return hit is not None
+
+
+class MemoryChallengeStore(ChallengeStore):
+    """有上限的 TTL dict；也拿來當 CachedWebAuthnStore 的本地 challenge 快取。"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put_challenge(self, key: str, state: dict, ttl: float = CHALLENGE_TTL) -> None:
+        now = time.time()
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (state, now + ttl)
+            # 依插入順序淘汰：先清過期的，再把超過上限的最舊紀錄丟掉
+            while self._items:
+                oldest, (_, expires) = next(iter(self._items.items()))
+                if expires > now and len(self._items) <= self.max_entries:
+                    break
+                del self._items[oldest]
+
+    def pop_challenge(self, key: str) -> Optional[dict]:
+        with self._lock:
+            hit = self._items.pop(key, None)
+        if hit is None or hit[1] <= time.time():
+            return None
+        return hit[0]
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, expires) in self._items.items() if expires <= now]
+            for k in expired:
+                del self._items[k]
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class SqliteWebAuthnStore(WebAuthnStore):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS webauthn_credentials (
+        credential_id   BLOB PRIMARY KEY,
+        user_id         TEXT NOT NULL,
+        credential_data BLOB NOT NULL,
+        created_at      REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_webauthn_credentials_user ON webauthn_credentials (user_id);
+    CREATE TABLE IF NOT EXISTS webauthn_challenges (
+        challenge_key TEXT PRIMARY KEY,
+        state         TEXT NOT NULL,
+        expires_at    REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_webauthn_challenges_expires ON webauthn_challenges (expires_at);
+    """
+
+    def __init__(self, path: str = "webauthn.db"):
+        self._conn = connect_sqlite(path)
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        with self._lock:
+            self._conn.executescript(self.SCHEMA)
+
+    def add_credential(self, user_id: str, credential: AttestedCredentialData) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO webauthn_credentials (credential_id, user_id, credential_data, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (credential.credential_id, user_id, bytes(credential), time.time()),
+            )
+
+    def get_credentials(self, user_id: str) -> List[AttestedCredentialData]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT credential_data FROM webauthn_credentials WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        return [AttestedCredentialData(row[0]) for row in rows]
+
+    def get_credential(self, credential_id: bytes) -> Optional[Tuple[str, AttestedCredentialData]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT user_id, credential_data FROM webauthn_credentials WHERE credential_id = ?", (credential_id,)
+            ).fetchone()
+        return (row[0], AttestedCredentialData(row[1])) if row else None
+
+    def delete_credential(self, credential_id: bytes) -> bool:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM webauthn_credentials WHERE credential_id = ?", (credential_id,))
+        return cur.rowcount == 1
+
+    def put_challenge(self, key: str, state: dict, ttl: float = CHALLENGE_TTL) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO webauthn_challenges (challenge_key, state, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(state), now + ttl),
+            )
+        if now - self._last_purge >= PURGE_INTERVAL:
+            self.purge_expired()
+
+    def pop_challenge(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, expires_at FROM webauthn_challenges WHERE challenge_key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            # 以 DELETE 的 rowcount 判斷是誰取走的（其他 worker 可能同時 pop）
+            cur = self._conn.execute("DELETE FROM webauthn_challenges WHERE challenge_key = ?", (key,))
+        if cur.rowcount != 1 or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def purge_expired(self) -> int:
+        self._last_purge = time.time()
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM webauthn_challenges WHERE expires_at <= ?", (self._last_purge,))
+        return cur.rowcount
+
+
+class MySQLWebAuthnStore(WebAuthnStore):
+    """使用 webpage/schema.sql 裡的 webauthn_credentials / webauthn_challenges 表。"""
+
+    def __init__(self):
+        self._pool = mysql_pool("webauthn")
+        self._last_purge = 0.0
+
+    def _execute(self, sql: str, params: tuple, fetch: Optional[str] = None):
+        conn = self._pool.get_connection()
+        try:
+            cur = conn.cursor(prepared=True)
+            cur.execute(sql, params)
+            if fetch == "one":
+                result = cur.fetchone()
+            elif fetch == "all":
+                result = cur.fetchall()
+            else:
+                result = cur.rowcount
+                conn.commit()
+            cur.close()
+            return result
+        finally:
+            conn.close()  # 歸還連線池
+
+    def add_credential(self, user_id: str, credential: AttestedCredentialData) -> None:
+        self._execute(
+            "REPLACE INTO webauthn_credentials (credential_id, user_id, credential_data) VALUES (%s, %s, %s)",
+            (credential.credential_id, user_id, bytes(credential)),
+        )
+
+    def get_credentials(self, user_id: str) -> List[AttestedCredentialData]:
+        rows = self._execute(
+            "SELECT credential_data FROM webauthn_credentials WHERE user_id = %s", (user_id,), fetch="all"
+        )
+        return [AttestedCredentialData(bytes(row[0])) for row in rows]
+
+    def get_credential(self, credential_id: bytes) -> Optional[Tuple[str, AttestedCredentialData]]:
+        row = self._execute(
+            "SELECT user_id, credential_data FROM webauthn_credentials WHERE credential_id = %s",
+            (credential_id,), fetch="one",
+        )
+        return (str(row[0]), AttestedCredentialData(bytes(row[1]))) if row else None
+
+    def delete_credential(self, credential_id: bytes) -> bool:
+        return self._execute("DELETE FROM webauthn_credentials WHERE credential_id = %s", (credential_id,)) == 1
+
+    def put_challenge(self, key: str, state: dict, ttl: float = CHALLENGE_TTL) -> None:
+        now = time.time()
+        self._execute(
+            "REPLACE INTO webauthn_challenges (challenge_key, state, expires_at) VALUES (%s, %s, %s)",
+            (key, json.dumps(state), now + ttl),
+        )
+        if now - self._last_purge >= PURGE_INTERVAL:
+            self.purge_expired()
+
+    def pop_challenge(self, key: str) -> Optional[dict]:
+        row = self._execute(
+            "SELECT state, expires_at FROM webauthn_challenges WHERE challenge_key = %s", (key,), fetch="one"
+        )
+        if not row:
+            return None
+        if self._execute("DELETE FROM webauthn_challenges WHERE challenge_key = %s", (key,)) != 1:
+            return None
+        if float(row[1]) <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def purge_expired(self) -> int:
+        self._last_purge = time.time()
+        return self._execute("DELETE FROM webauthn_challenges WHERE expires_at <= %s", (self._last_purge,))
+
+
+class CachedWebAuthnStore(WebAuthnStore):
+    """
+    credential：per-user read-through cache（短 TTL），新增 / 刪除時讓本地失效。
+    challenge：write-through；同一個 worker 完成流程時直接用本地的 state，
+    但還是要到後端 DELETE 一次，確保只被取用一次。
+    """
+
+    def __init__(self, backend: WebAuthnStore, ttl: float = 30.0, max_entries: int = 10000):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._credentials: "OrderedDict[str, Tuple[List[AttestedCredentialData], float]]" = OrderedDict()
+        self._challenges = MemoryChallengeStore(max_entries)
+        self._lock = threading.Lock()
+
+    def _invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._credentials.pop(user_id, None)
+
+    def add_credential(self, user_id: str, credential: AttestedCredentialData) -> None:
+        self.backend.add_credential(user_id, credential)
+        self._invalidate(user_id)
+
+    def get_credentials(self, user_id: str) -> List[AttestedCredentialData]:
+        now = time.monotonic()
+        with self._lock:
+            hit = self._credentials.get(user_id)
+        if hit and hit[1] > now:
+            return list(hit[0])
+        credentials = self.backend.get_credentials(user_id)
+        with self._lock:
+            self._credentials[user_id] = (credentials, now + self.ttl)
+            self._credentials.move_to_end(user_id)
+            while len(self._credentials) > self.max_entries:
+                self._credentials.popitem(last=False)
+        return list(credentials)
+
+    def get_credential(self, credential_id: bytes) -> Optional[Tuple[str, AttestedCredentialData]]:
+        return self.backend.get_credential(credential_id)
+
+    def delete_credential(self, credential_id: bytes) -> bool:
+        hit = self.backend.get_credential(credential_id)
+        deleted = self.backend.delete_credential(credential_id)
+        if hit:
+            self._invalidate(hit[0])
+        return deleted
+
+    def put_challenge(self, key: str, state: dict, ttl: float = CHALLENGE_TTL) -> None:
+        self.backend.put_challenge(key, state, ttl)
+        self._challenges.put_challenge(key, state, ttl)
+
+    def pop_challenge(self, key: str) -> Optional[dict]:
+        local = self._challenges.pop_challenge(key)
+        if local is None:
+            return self.backend.pop_challenge(key)
+        return local if self.backend.pop_challenge(key) is not None else None
+
+    def purge_expired(self) -> int:
+        self._challenges.purge_expired()
+        return self.backend.purge_expired()
+
+
+class MemoryWebAuthnStore(MemoryCredentialStore, MemoryChallengeStore, WebAuthnStore):
+    """行程內版本（只給測試用）；兩個父類別共用同一把 lock。"""
+
+    def __init__(self):
+        MemoryCredentialStore.__init__(self)
+        MemoryChallengeStore.__init__(self)
+
+
+@lru_cache(maxsize=None)
+def get_webauthn_store() -> WebAuthnStore:
+    """FastAPI dependency：第一次用到時才建立共用的 store（import 路由不會產生資料庫檔）。"""
+    kind = os.getenv("WEBAUTHN_STORE", "sqlite").lower()
+    if kind == "memory":
+        return MemoryWebAuthnStore()
+    if kind == "sqlite":
+        backend: WebAuthnStore = SqliteWebAuthnStore(os.getenv("WEBAUTHN_DB_PATH", "webauthn.db"))
+    elif kind == "mysql":
+        backend = MySQLWebAuthnStore()
+    else:
+        raise RuntimeError(f"Unknown WEBAUTHN_STORE: {kind}")
+    return CachedWebAuthnStore(backend, ttl=float(os.getenv("WEBAUTHN_CACHE_TTL", "30")))
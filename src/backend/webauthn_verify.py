@@ -0,0 +1,185 @@
+# backend/webauthn_verify.py
+"""
+WebAuthn 登入時的簽章驗證。
+
+- 每個 credential_id 的 COSE 公鑰只轉成 cryptography 的 key 物件一次，之後從 LRU 快取拿
+  （fido2 的 CoseKey.verify 每次都會從座標重建 key）。
+- authenticate_complete 整段（解析 assertion + 檢查 challenge / origin + 驗簽）丟到
+  thread pool 執行；cryptography 驗簽時會放掉 GIL，所以吞吐量可以隨核心數成長。
+- 排隊中的請求數有上限（WEBAUTHN_VERIFY_QUEUE），滿了直接拒絕，不讓 event loop 後面無限堆積。
+- 記錄排隊時間與驗證時間（最近 N 筆的 p50 / p95 / max）。
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from fido2.cose import RS1, RS256, CoseKey
+from fido2.utils import bytes2int
+from fido2.webauthn import AttestedCredentialData
+
+WEBAUTHN_VERIFY_WORKERS = int(os.getenv("WEBAUTHN_VERIFY_WORKERS", str(os.cpu_count() or 4)))
+WEBAUTHN_VERIFY_QUEUE = int(os.getenv("WEBAUTHN_VERIFY_QUEUE", "256"))
+WEBAUTHN_KEY_CACHE_SIZE = int(os.getenv("WEBAUTHN_KEY_CACHE_SIZE", "10000"))
+
+# COSE 演算法 -> (crv, 曲線)：ES256 只能配 P-256、ES384 配 P-384、ES512 配 P-521
+_EC_ALGORITHMS = {-7: (1, ec.SECP256R1), -35: (2, ec.SECP384R1), -36: (3, ec.SECP521R1)}
+
+
+class VerifyQueueFull(Exception):
+    """排隊中的驗證已達上限。"""
+
+
+def load_verifier(cose: CoseKey) -> Callable[[bytes, bytes], None]:
+    """
+    把 COSE key 轉成 verify(message, signature)；失敗丟 InvalidSignature（跟 CoseKey.verify 一樣）。
+    不認得的演算法、或曲線跟演算法對不上，就退回 fido2 自己的實作（會照它的規則拒絕）。
+    """
+    hash_alg = getattr(cose, "_HASH_ALG", None)
+    kty = cose.get(1)
+    curve = _EC_ALGORITHMS.get(getattr(cose, "ALGORITHM", None))
+    if kty == 2 and curve and cose.get(-1) == curve[0] and hash_alg is not None:
+        key = ec.EllipticCurvePublicNumbers(bytes2int(cose[-2]), bytes2int(cose[-3]), curve[1]()).public_key()
+        return lambda message, signature: key.verify(signature, message, ec.ECDSA(hash_alg))
+    if kty == 1 and cose.get(-1) == 6:
+        key = ed25519.Ed25519PublicKey.from_public_bytes(cose[-2])
+        return lambda message, signature: key.verify(signature, message)
+    if isinstance(cose, (RS1, RS256)):
+        key = rsa.RSAPublicNumbers(bytes2int(cose[-2]), bytes2int(cose[-1])).public_key()
+        return lambda message, signature: key.verify(signature, message, padding.PKCS1v15(), hash_alg)
+    return cose.verify
+
+
+@dataclass(frozen=True)
+class _CachedKey:
+    """fido2 只用到 verify()。"""
+    verify: Callable[[bytes, bytes], None]
+
+
+@dataclass(frozen=True)
+class _Credential:
+    """給 Fido2Server.authenticate_complete 用的 credential（只需要 credential_id 與 public_key）。"""
+    credential_id: bytes
+    public_key: _CachedKey
+
+
+class PublicKeyCache:
+    def __init__(self, max_entries: int = WEBAUTHN_KEY_CACHE_SIZE):
+        self.max_entries = max_entries
+        # credential_id -> (AttestedCredentialData bytes, 已載入的 key)；資料變了就重建
+        self._entries: "OrderedDict[bytes, Tuple[bytes, _CachedKey]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, credential: AttestedCredentialData) -> _CachedKey:
+        raw = bytes(credential)
+        with self._lock:
+            hit = self._entries.get(credential.credential_id)
+            if hit and hit[0] == raw:
+                self._entries.move_to_end(credential.credential_id)
+                self.hits += 1
+                return hit[1]
+            self.misses += 1
+        key = _CachedKey(load_verifier(credential.public_key))
+        with self._lock:
+            self._entries[credential.credential_id] = (raw, key)
+            self._entries.move_to_end(credential.credential_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return key
+
+    def wrap(self, credentials: Sequence[AttestedCredentialData]) -> List[_Credential]:
+        return [_Credential(c.credential_id, self.get(c)) for c in credentials]
+
+
+class LatencyStats:
+    def __init__(self, window: int = 1024):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+        pick = lambda q: round(samples[min(int(q * len(samples)), len(samples) - 1)] * 1000, 3) if samples else None
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else None,
+            "p50_ms": pick(0.50),
+            "p95_ms": pick(0.95),
+            "max_ms": round(samples[-1] * 1000, 3) if samples else None,
+        }
+
+
+class AssertionVerifier:
+    def __init__(
+        self,
+        workers: int = WEBAUTHN_VERIFY_WORKERS,
+        max_queue: int = WEBAUTHN_VERIFY_QUEUE,
+        keys: Optional[PublicKeyCache] = None,
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.keys = keys or PublicKeyCache()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="webauthn-verify")
+        self._pending = 0
+        self.rejected = 0
+        self.failures = 0
+        self.wait = LatencyStats()
+        self.verify_time = LatencyStats()
+
+    def _run(self, submitted: float, fn: Callable[..., Any], args: tuple) -> Any:
+        started = time.perf_counter()
+        self.wait.add(started - submitted)
+        try:
+            return fn(*args)
+        finally:
+            self.verify_time.add(time.perf_counter() - started)
+
+    async def authenticate_complete(self, server, state: dict, credentials: Sequence[AttestedCredentialData], response: dict):
+        """
+        在 pool 裡執行 server.authenticate_complete，驗證失敗照樣丟 ValueError。
+        排隊數已滿時丟 VerifyQueueFull。
+        """
+        if self._pending >= self.max_queue:
+            self.rejected += 1
+            raise VerifyQueueFull()
+        self._pending += 1
+        try:
+            wrapped = self.keys.wrap(credentials)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._pool, self._run, time.perf_counter(), server.authenticate_complete, (state, wrapped, response)
+            )
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self._pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "key_cache": {"entries": len(self.keys._entries), "hits": self.keys.hits, "misses": self.keys.misses},
+            "queue_wait": self.wait.snapshot(),
+            "verify": self.verify_time.snapshot(),
+        }
+
+
+assertion_verifier = AssertionVerifier()
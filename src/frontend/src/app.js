@@ -13,6 +13,65 @@ function uint8ToB64(u8) {
   return btoa(String.fromCharCode(...u8));
 }
 
+/* ---------- 分段 AES-GCM（對應 backend/encryption/aes.py 的 STREAM 格式） ---------- */
+const FRAME_SIZE = 1024 * 1024;
+function streamHeader(frameSize, frameCount) {
+  // MAGIC "AGS1" | version 1 | frame_size (u32 BE) | frame_count (u64 BE)
+  const h = new Uint8Array(17);
+  const view = new DataView(h.buffer);
+  h.set([0x41, 0x47, 0x53, 0x31, 1]);
+  view.setUint32(5, frameSize);
+  view.setBigUint64(9, BigInt(frameCount));
+  return h;
+}
+function frameNonce(iv, index) {
+  const nonce = iv.slice();
+  for (let i = 11, n = index; i >= 0 && n > 0; i--, n = Math.floor(n / 256)) {
+    nonce[i] ^= n % 256;
+  }
+  return nonce;
+}
+async function encryptFramed(aesKey, iv, file) {
+  // 一次只讀一個 frame，避免整個檔案 + 密文同時放在記憶體
+  const frameCount = Math.max(1, Math.ceil(file.size / FRAME_SIZE));
+  const header = streamHeader(FRAME_SIZE, frameCount);
+  const parts = [header];
+  for (let i = 0; i < frameCount; i++) {
+    const chunk = await file.slice(i * FRAME_SIZE, (i + 1) * FRAME_SIZE).arrayBuffer();
+    parts.push(await crypto.subtle.encrypt(
+      { name: "AES-GCM", iv: frameNonce(iv, i), additionalData: header },
+      aesKey,
+      chunk
+    ));
+  }
+  return new Blob(parts);
+}
+
+/* ---------- KMS 公鑰（跨上傳共用同一個 CryptoKey） ---------- */
+const PUBLIC_KEY_TTL = 5 * 60 * 1000;
+let kmsPublicKey = null; // { pem, keyVersion, key, fetchedAt }
+async function getKmsPublicKey() {
+  if (kmsPublicKey && Date.now() - kmsPublicKey.fetchedAt < PUBLIC_KEY_TTL) return kmsPublicKey;
+  // 過期後再問一次：後端有 ETag / Cache-Control，瀏覽器會自己拿快取或用 304 重新驗證
+  const { pem, key_version } = await fetch(`${API}/kms/public-key`, { credentials: 'include' })
+    .then(r => { if (!r.ok) throw new Error("讀取公鑰失敗"); return r.json(); });
+  if (kmsPublicKey && kmsPublicKey.pem === pem) {
+    kmsPublicKey.fetchedAt = Date.now();
+    return kmsPublicKey;
+  }
+  const b64 = pem.split("\n").filter(l => l && !l.startsWith("-----")).join("");
+  const der = Uint8Array.from(atob(b64), c => c.charCodeAt(0)).buffer;
+  const key = await crypto.subtle.importKey(
+    "spki",
+    der,
+    { name: "RSA-OAEP", hash: "SHA-256" },
+    false,
+    ["encrypt"]
+  );
+  kmsPublicKey = { pem, keyVersion: key_version, key, fetchedAt: Date.now() };
+  return kmsPublicKey;
+}
+
 /* ---------- AES + RSA 上傳 ---------- */
 async function encryptAndUpload(file, userId) {
   const aesKey = await crypto.subtle.generateKey(
@@ -21,27 +80,12 @@ async function encryptAndUpload(file, userId) {
     ["encrypt"]
   );
   const iv = crypto.getRandomValues(new Uint8Array(12));
-  const ciphertext = await crypto.subtle.encrypt(
-    { name: "AES-GCM", iv },
-    aesKey,
-    await file.arrayBuffer()
-  );
+  const ciphertext = await encryptFramed(aesKey, iv, file);
   const rawKey = new Uint8Array(
     await crypto.subtle.exportKey("raw", aesKey)
   );
 
-  const { pem } = await fetch(`${API}/kms/public-key`, { credentials: 'include' })
-    .then(r => { if (!r.ok) throw new Error("讀取公鑰失敗"); return r.json(); });
-  const b64 = pem.split("\n").filter(l => l && !l.startsWith("-----")).join("");
-  const der = Uint8Array.from(atob(b64), c => c.charCodeAt(0)).buffer;
-
-  const rsaKey = await crypto.subtle.importKey(
-    "spki",
-    der,
-    { name: "RSA-OAEP", hash: "SHA-256" },
-    false,
-    ["encrypt"]
-  );
+  const { key: rsaKey, keyVersion } = await getKmsPublicKey();
   const encryptedDEK = new Uint8Array(
     await crypto.subtle.encrypt(
       { name: "RSA-OAEP" },
@@ -51,18 +95,22 @@ async function encryptAndUpload(file, userId) {
   );
   if (encryptedDEK.byteLength !== 256) throw new Error("RSA-OAEP encryptedDEK length !== 256");
 
+  const meta = {
+    iv: Array.from(iv),
+    encrypted_dek: uint8ToB64(encryptedDEK),
+    filename: file.name,
+    algorithm: "AES-GCM-STREAM",
+    user_id: userId,
+    key_version: keyVersion
+  };
+  if (ciphertext.size > RESUMABLE_THRESHOLD) {
+    await uploadResumable(ciphertext, meta);
+    return;
+  }
+
   const fd = new FormData();
-  fd.append("file", new Blob([ciphertext]), file.name);
-  fd.append(
-    "metadata",
-    JSON.stringify({
-      iv: Array.from(iv),
-      encrypted_dek: uint8ToB64(encryptedDEK),
-      filename: file.name,
-      algorithm: "AES-GCM",
-      user_id: userId
-    })
-  );
+  fd.append("file", ciphertext, file.name);
+  fd.append("metadata", JSON.stringify(meta));
   const res = await fetch(`${API}/files/upload`, {
     method: "POST",
     body: fd,
@@ -71,6 +119,49 @@ async function encryptAndUpload(file, userId) {
   if (!res.ok) throw new Error("上傳失敗：" + await res.text());
 }
 
+/* ---------- 大檔：分段上傳 session（可平行、可續傳） ---------- */
+const RESUMABLE_THRESHOLD = 32 * 1024 * 1024;
+const PART_SIZE = 8 * 1024 * 1024;
+const PART_CONCURRENCY = 4;
+async function uploadResumable(ciphertext, meta) {
+  const init = await fetch(`${API}/files/upload/init`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(meta),
+    credentials: 'include'
+  });
+  if (!init.ok) throw new Error("上傳失敗：" + await init.text());
+  const { session_id } = await init.json();
+
+  const total = Math.ceil(ciphertext.size / PART_SIZE);
+  let next = 0;
+  const worker = async () => {
+    while (next < total) {
+      const part = next++;
+      const body = ciphertext.slice(part * PART_SIZE, (part + 1) * PART_SIZE);
+      // 單一 part 失敗只重傳那一段
+      for (let attempt = 0; ; attempt++) {
+        const res = await fetch(`${API}/files/upload/${session_id}/${part}`, {
+          method: "PUT",
+          body,
+          credentials: 'include'
+        }).catch(() => null);
+        if (res && res.ok) break;
+        if (attempt >= 3) throw new Error(`上傳失敗：part ${part}`);
+      }
+    }
+  };
+  await Promise.all(Array.from({ length: PART_CONCURRENCY }, worker));
+
+  const res = await fetch(`${API}/files/upload/${session_id}/complete`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ parts: total }),
+    credentials: 'include'
+  });
+  if (!res.ok) throw new Error("上傳失敗：" + await res.text());
+}
+
 /* ---------- TOTP ---------- */
 async function registerTotp(userId) {
   const res = await fetch(`${API}/2fa/totp/register`, {
@@ -94,10 +185,20 @@ async function verifyTotp(userId, code) {
 }
 
 /* ---------- 檔案列表 / 刪除 ---------- */
+// /files/list 一次最多回 1000 筆，照 next_cursor 一頁一頁抓到最後
 async function fetchFileList() {
-  const res = await fetch(`${API}/files/list`, { credentials: 'include' });
-  if (!res.ok) throw new Error("抓取檔案列表失敗");
-  return res.json();
+  const files = [];
+  let cursor = null;
+  do {
+    const params = new URLSearchParams({ limit: "1000" });
+    if (cursor) params.set("cursor", cursor);
+    const res = await fetch(`${API}/files/list?${params}`, { credentials: 'include' });
+    if (!res.ok) throw new Error("抓取檔案列表失敗");
+    const page = await res.json();
+    files.push(...page.files);
+    cursor = page.next_cursor;
+  } while (cursor);
+  return { files };
 }
 async function downloadFile(fileId) {
   const res = await fetch(`${API}/files/download/${fileId}`, { credentials: 'include' });
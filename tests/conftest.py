@@ -0,0 +1,107 @@
+# tests/conftest.py
+"""
+pytest 共用設定：
+
+- 把 src/（backend 套件）跟 webpage/ 加進 sys.path
+- 在 import backend 之前先切到暫存目錄並設定環境變數，讓 audit.log、KEK 檔、
+  SQLite、local KMS 私鑰這些預設寫在工作目錄的檔案都不會落在 repo 裡
+- files 路由用的 app / client / 上傳 helper
+"""
+import asyncio
+import base64
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "webpage")]
+
+WORKDIR = tempfile.mkdtemp(prefix="backend-tests-")
+os.chdir(WORKDIR)
+for key, value in {
+    "KMS_PROVIDER": "local",
+    "LOCAL_KMS_DIR": os.path.join(WORKDIR, "local_kms"),
+    "STORAGE_BACKEND": "memory",
+    "FILE_CATALOG_PATH": os.path.join(WORKDIR, "files.db"),
+    "AUDIT_LOG_PATH": os.path.join(WORKDIR, "audit.log"),
+    "AUDIT_SIGNING_KEY": os.path.join(WORKDIR, "audit_signing_key.pem"),
+    "TOTP_KEK_FILE": os.path.join(WORKDIR, "totp_kek.bin"),
+    "TOTP_DB_PATH": os.path.join(WORKDIR, "totp.db"),
+    "WEBAUTHN_DB_PATH": os.path.join(WORKDIR, "webauthn.db"),
+    "KEY_POOL_DIR": os.path.join(WORKDIR, "key_pool"),
+    "KEY_POOL_KEK_FILE": os.path.join(WORKDIR, "key_pool_kek.bin"),
+    "DB_BACKEND": "sqlite",
+    "DB_SQLITE_PATH": os.path.join(WORKDIR, "secure_share.db"),
+    "PASSWORD_HASH": "scrypt",
+    "SCRYPT_LN": "10",
+}.items():
+    os.environ.setdefault(key, value)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def storage():
+    from backend.storage.memory import MemoryStorage
+    return MemoryStorage()
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    from backend.catalog import FileCatalog
+    cat = FileCatalog(str(tmp_path / "files.db"))
+    yield cat
+    cat.close()
+
+
+@pytest.fixture
+def files_client(storage, catalog):
+    """只掛 files / uploads 路由的 app，storage 跟 catalog 換成每個測試自己的。"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from backend.catalog import get_catalog
+    from backend.routes import files, uploads
+    from backend.storage.base import get_storage
+
+    app = FastAPI()
+    app.include_router(files.router, prefix="/files")
+    app.include_router(uploads.router, prefix="/files")
+    app.dependency_overrides[get_storage] = lambda: storage
+    app.dependency_overrides[get_catalog] = lambda: catalog
+    with TestClient(app) as client:
+        yield client
+
+
+def encrypt_for_upload(plaintext: bytes, frame_size: int = 1024):
+    """跟前端一樣：產生 DEK、分段加密、用 KMS 公鑰包 DEK。回傳 (ciphertext, metadata)。"""
+    from backend.encryption.aes import STREAM_ALG, aes_encrypt_stream
+    from backend.kms.envelope import rsa_wrap
+    from backend.routes.kms import public_key_cache
+
+    entry = run(public_key_cache.get())
+    dek, iv = os.urandom(32), os.urandom(12)
+    ciphertext = b"".join(aes_encrypt_stream(dek, iv, [plaintext], len(plaintext), frame_size))
+    meta = {
+        "iv": iv.hex(),
+        "encrypted_dek": base64.b64encode(rsa_wrap(entry.pem, dek)).decode(),
+        "algorithm": STREAM_ALG,
+        "key_version": entry.key_version,
+    }
+    return ciphertext, meta
+
+
+def upload(client, plaintext: bytes, filename: str = "a.txt", frame_size: int = 1024, **extra) -> str:
+    ciphertext, meta = encrypt_for_upload(plaintext, frame_size)
+    meta.update(filename=filename, **extra)
+    resp = client.post(
+        "/files/upload",
+        files={"file": (filename, ciphertext)},
+        data={"metadata": json.dumps(meta)},
+    )
+    assert resp.status_code == 201, resp.text
+    return resp.json()["file_id"]
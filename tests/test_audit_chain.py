@@ -0,0 +1,149 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from backend.audit import chain
+from backend.audit.__main__ import main as audit_cli
+from backend.audit.chain import (
+    load_signing_key, load_verify_key, merkle_root, read_checkpoints, verify_log,
+)
+from backend.audit.logger import AuditWriter, make_record
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "audit.log"), str(tmp_path / "signing.pem")
+
+
+def _writer(paths, **kw):
+    log, key = paths
+    return AuditWriter(path=log, signing_key_path=key, block_size=kw.pop("block_size", 4), **kw)
+
+
+def _log(writer, n, start=0):
+    for i in range(start, start + n):
+        writer._write_batch([make_record(f"u{i}", "download", {"file_id": f"f{i}"})])
+
+
+def _rewrite_line(log, index, mutate):
+    with open(log, "rb") as f:
+        lines = f.readlines()
+    record = json.loads(lines[index])
+    mutate(record)
+    lines[index] = json.dumps(record, sort_keys=True, separators=(",", ":")).encode() + b"\n"
+    with open(log, "wb") as f:
+        f.writelines(lines)
+
+
+def test_chain_blocks_and_checkpoints(paths):
+    log, key = paths
+    _log(_writer(paths), 10)
+    cps = read_checkpoints(log)
+    assert [cp["block"] for cp in cps] == [0, 1]
+    assert cps[1]["first_seq"] == 4 and cps[1]["prev_hash"] == cps[0]["last_hash"]
+
+    report = verify_log(log, load_verify_key(key), full=True)
+    assert report.ok and report.blocks_verified == 2 and report.tail_records == 2
+
+    # 只驗新的 block
+    again = verify_log(log, load_verify_key(key))
+    assert again.ok and again.blocks_verified == 0
+
+
+def test_writer_recovers_chain_after_restart(paths):
+    log, key = paths
+    _log(_writer(paths), 6)
+    _log(_writer(paths), 6, start=6)
+    report = verify_log(log, load_verify_key(key), full=True, workers=2)
+    assert report.ok and report.checkpoints == 3 and report.tail_records == 0
+
+
+def test_tampering_is_detected(paths):
+    log, key = paths
+    _log(_writer(paths), 10)
+    _rewrite_line(log, 1, lambda r: r.update(user_id="mallory"))
+    report = verify_log(log, load_verify_key(key), full=True)
+    assert not report.ok and any(e.startswith("block 0") for e in report.errors)
+
+
+def test_tampered_tail_is_detected(paths):
+    log, key = paths
+    _log(_writer(paths), 10)
+    _rewrite_line(log, 9, lambda r: r.update(action="delete"))
+    report = verify_log(log, load_verify_key(key), full=True)
+    assert report.errors == [report.errors[0]] and report.errors[0].startswith("tail: hash mismatch")
+
+
+def test_checkpoint_signed_by_other_key_rejected(paths, tmp_path):
+    log, _ = paths
+    _log(_writer(paths), 4)
+    other = load_signing_key(str(tmp_path / "other.pem")).public_key()
+    report = verify_log(log, other, full=True)
+    assert not report.ok and report.errors == ["checkpoint 0: bad signature"]
+
+
+def test_merkle_root():
+    h = ["%064x" % i for i in range(3)]
+    assert merkle_root([]) == chain.GENESIS_HASH
+    assert merkle_root(h) != merkle_root(h[:2])
+    assert merkle_root(h) != merkle_root([h[1], h[0], h[2]])
+
+
+def test_verify_key_is_never_generated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(FileNotFoundError):
+        load_verify_key(str(tmp_path / "audit_signing_key.pem"))
+    assert audit_cli(["verify", "--log", "audit.log", "--key", "audit_signing_key.pem"]) == 2
+    assert os.listdir(tmp_path) == []
+
+
+def test_verify_key_from_pub_path(paths):
+    log, key = paths
+    _log(_writer(paths), 4)
+    assert os.path.exists(key + ".pub")
+    assert verify_log(log, load_verify_key(key + ".pub"), full=True).ok
+
+
+def test_failed_write_does_not_advance_chain(paths, monkeypatch):
+    log, key = paths
+    writer = _writer(paths)
+    _log(writer, 2)
+    size = os.path.getsize(log)
+
+    def broken_fsync(fd):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as m:
+        m.setattr(os, "fsync", broken_fsync)
+        with pytest.raises(OSError):
+            writer._write_batch([make_record("u", "lost", {})])
+    assert os.path.getsize(log) == size
+    assert writer._chain.seq == 2
+
+    _log(writer, 6, start=2)
+    report = verify_log(log, load_verify_key(key), full=True)
+    assert report.ok, report.errors
+
+
+def _worker_writes(args):
+    log, key, worker = args
+    writer = AuditWriter(path=log, signing_key_path=key, block_size=4)
+    for i in range(15):
+        writer._write_batch([make_record(f"w{worker}", "download", {"i": i})])
+    return writer.written
+
+
+def test_writer_processes_share_one_chain(paths):
+    log, key = paths
+    load_signing_key(key)  # 先建好金鑰，各 process 讀同一把
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        written = pool.map(_worker_writes, [(log, key, w) for w in range(4)])
+    assert sum(written) == 60
+
+    report = verify_log(log, load_verify_key(key), full=True)
+    assert report.ok, report.errors
+    assert report.checkpoints == 15 and report.tail_records == 0
+    with open(log, "rb") as f:
+        assert [json.loads(line)["seq"] for line in f] == list(range(60))
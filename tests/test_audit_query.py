@@ -0,0 +1,111 @@
+import datetime
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.audit.index import AuditIndex
+from backend.audit.logger import AuditWriter, make_record
+from backend.routes import audit
+from backend.security import get_client_cert
+
+
+def _cert(cn: str) -> x509.Certificate:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+
+
+@pytest.fixture
+def log_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "audit.log")
+    monkeypatch.setattr(audit, "AUDIT_LOG_PATH", path)
+    return path
+
+
+def _client(cert=None) -> TestClient:
+    app = FastAPI()
+    app.include_router(audit.router, prefix="/audit")
+    if cert is not None:
+        app.dependency_overrides[get_client_cert] = lambda: cert
+    return TestClient(app)
+
+
+def _write(log_path, tmp_path, records):
+    writer = AuditWriter(path=log_path, signing_key_path=str(tmp_path / "signing.pem"))
+    writer._write_batch([make_record(*r) for r in records])
+
+
+def test_anonymous_request_rejected(log_path, tmp_path):
+    _write(log_path, tmp_path, [("alice", "2fa_verify_failed", {"code": "123456", "ip": "10.0.0.1"})])
+    resp = _client().get("/audit/query")
+    assert resp.status_code == 401
+    assert "123456" not in resp.text
+
+
+def test_non_admin_certificate_rejected(log_path):
+    assert _client(_cert("alice")).get("/audit/query").status_code == 403
+
+
+def test_admin_query_and_count(log_path, tmp_path):
+    _write(log_path, tmp_path, [
+        ("alice", "download", {"file_id": "f1"}),
+        ("bob", "2fa_verify_failed", {"ip": "10.0.0.1"}),
+        ("bob", "2fa_verify_failed", {"ip": "10.0.0.1"}),
+        ("carol", "2fa_verify_failed", {"ip": "10.0.0.2"}),
+    ])
+    client = _client(_cert("admin"))
+    resp = client.get("/audit/query", params={"action": "2fa_verify_failed", "limit": 2})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [r["user_id"] for r in body["records"]] == ["bob", "bob"]
+    rest = client.get("/audit/query", params={"action": "2fa_verify_failed", "cursor": body["next_cursor"]}).json()
+    assert [r["user_id"] for r in rest["records"]] == ["carol"] and rest["next_cursor"] is None
+
+    counts = client.get("/audit/query", params={"action": "2fa_verify_failed", "count_by": "ip"}).json()
+    assert counts["counts"] == {"10.0.0.1": 2, "10.0.0.2": 1}
+    assert client.get("/audit/query", params={"count_by": "filename"}).status_code == 400
+
+
+def test_missing_log_returns_empty(log_path):
+    client = _client(_cert("admin"))
+    resp = client.get("/audit/query")
+    assert resp.status_code == 200
+    assert resp.json() == {"records": [], "next_cursor": None}
+    assert client.get("/audit/query", params={"count_by": "action"}).json()["counts"] == {}
+
+
+def test_index_segments_and_time_filter(tmp_path):
+    path = str(tmp_path / "audit.log")
+    lines = [
+        '{"ts": "2024-01-01T00:00:00+00:00", "user_id": "u%d", "action": "a%d", "metadata": {}}\n' % (i, i % 2)
+        for i in range(10)
+    ]
+    lines.append("2024-01-02T00:00:00 | legacy | upload | {'file_id': 'old'}\n")
+    with open(path, "w") as f:
+        f.writelines(lines)
+    index = AuditIndex(path, segment_records=4)
+    index.refresh()
+    assert len(index._sealed) == 2
+    records, _ = index.query(filters={"action": "a1"}, limit=100)
+    assert [r["user_id"] for r in records] == ["u1", "u3", "u5", "u7", "u9"]
+    records, _ = index.query(filters={"file_id": "old"})
+    assert records[0]["user_id"] == "legacy"
+    since = datetime.datetime(2024, 1, 1, 12, tzinfo=datetime.timezone.utc).timestamp()
+    assert [r["user_id"] for r in index.query(since=since)[0]] == ["legacy"]
+
+    # 重新開啟時直接讀已封存的 segment，只掃尾巴
+    again = AuditIndex(path, segment_records=4)
+    again.refresh()
+    assert again.count_by("action") == {"a0": 5, "a1": 5, "upload": 1}
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+
+from backend.audit.chain import load_signing_key, load_verify_key, verify_log
+from backend.audit.logger import AuditWriter, make_record
+from conftest import run
+
+
+def _writer(tmp_path, **kw):
+    return AuditWriter(path=str(tmp_path / "audit.log"), signing_key_path=str(tmp_path / "signing.pem"),
+                       block_size=kw.pop("block_size", 64), **kw)
+
+
+def _actions(writer):
+    with open(writer.path, "rb") as f:
+        return [json.loads(line)["action"] for line in f]
+
+
+def test_events_are_written_in_batches_and_flushed_on_stop(tmp_path):
+    writer = _writer(tmp_path, batch_size=50)
+
+    async def scenario():
+        await writer.start()
+        for i in range(200):
+            writer.submit(make_record("u", f"a{i}"))
+        assert writer.stats()["queued"] == 200  # submit 不會等寫檔
+        await writer.stop()
+
+    run(scenario())
+    assert _actions(writer) == [f"a{i}" for i in range(200)]
+    assert writer.stats() == {"queued": 0, "written": 200, "dropped": 0, "overflowed": 0, "batches": 4}
+    assert verify_log(writer.path, load_verify_key(writer.signing_key_path), full=True).ok
+
+
+def test_submit_without_running_writer_is_synchronous(tmp_path):
+    writer = _writer(tmp_path)
+    writer.submit(make_record("u", "login"))
+    assert _actions(writer) == ["login"] and writer.batches == 1
+
+
+def test_submit_from_worker_thread(tmp_path):
+    writer = _writer(tmp_path)
+
+    async def scenario():
+        await writer.start()
+        await asyncio.gather(*(asyncio.to_thread(writer.submit, make_record("u", f"t{i}")) for i in range(20)))
+        await writer.stop()
+
+    run(scenario())
+    assert sorted(_actions(writer)) == sorted(f"t{i}" for i in range(20))
+
+
+@pytest.mark.parametrize("overflow, expected, dropped", [
+    ("drop_newest", ["a0", "a1"], 3),
+    ("drop_oldest", ["a3", "a4"], 3),
+    ("keep", ["a0", "a1", "a2", "a3", "a4"], 0),
+])
+def test_overflow_policies(tmp_path, monkeypatch, overflow, expected, dropped):
+    writer = _writer(tmp_path, queue_size=2, overflow=overflow)
+    loop_thread = threading.current_thread()
+    real_write = writer._write_batch
+
+    def write_off_loop(records):
+        assert threading.current_thread() is not loop_thread  # 不能在 event loop 上寫檔
+        real_write(records)
+
+    monkeypatch.setattr(writer, "_write_batch", write_off_loop)
+
+    async def scenario():
+        await writer.start()
+        # 中間沒有 await，背景 task 沒機會清 queue
+        for i in range(5):
+            writer.submit(make_record("u", f"a{i}"))
+        await writer.stop()
+
+    run(scenario())
+    assert _actions(writer) == expected
+    assert writer.dropped == dropped and writer.overflowed == (3 if overflow == "keep" else 0)
+
+
+def test_default_overflow_policy_does_not_block():
+    assert AuditWriter().overflow == "drop_oldest"
+
+
+@pytest.mark.parametrize("policy, fsyncs", [("batch", 4), ("never", 0)])
+def test_fsync_policy(tmp_path, monkeypatch, policy, fsyncs):
+    writer = _writer(tmp_path, fsync=policy, batch_size=2)
+    load_signing_key(writer.signing_key_path)  # 產生金鑰時的 fsync 不算
+    calls = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: (calls.append(fd), real_fsync(fd)))
+
+    async def scenario():
+        await writer.start()
+        for i in range(6):
+            writer.submit(make_record("u", f"a{i}"))
+        await asyncio.sleep(0.2)
+        await writer.stop()
+
+    run(scenario())
+    assert len(calls) == fsyncs  # batch：每批一次，加上 stop 關檔時一次
+
+
+def test_unknown_policies_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        _writer(tmp_path, fsync="sometimes")
+    with pytest.raises(ValueError):
+        _writer(tmp_path, overflow="block")
@@ -0,0 +1,111 @@
+import csv
+import datetime as dt
+import os
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+from backend.certs.__main__ import main as certs_cli
+from backend.certs.bulk import IssueJob, issue_batch, jobs_from_csr_dir, jobs_from_names
+
+
+@pytest.fixture
+def ca(tmp_path):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "Test CA")])
+    now = dt.datetime.now(dt.timezone.utc)
+    cert = (
+        x509.CertificateBuilder().subject_name(name).issuer_name(name)
+        .public_key(key.public_key()).serial_number(1)
+        .not_valid_before(now).not_valid_after(now + dt.timedelta(days=30))
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    key_path, cert_path = tmp_path / "ca.key.pem", tmp_path / "ca.cert.pem"
+    key_path.write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    return {"ca_key_path": str(key_path), "ca_cert_path": str(cert_path), "cert": cert}
+
+
+def _issue(ca, jobs, out, **kw):
+    return issue_batch(jobs, out_dir=str(out), workers=2,
+                       ca_key_path=ca["ca_key_path"], ca_cert_path=ca["ca_cert_path"], **kw)
+
+
+def _load(path):
+    return x509.load_pem_x509_certificate(open(path, "rb").read())
+
+
+def test_batch_writes_keys_certs_and_manifest(ca, tmp_path):
+    out = tmp_path / "devices"
+    report = _issue(ca, jobs_from_names(f"dev-{i}\n" for i in range(10)), out, p12_password="pw")
+    assert report.issued == 10 and report.failed == 0 and report.per_second > 0
+
+    with open(out / "manifest.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert sorted(r["name"] for r in rows) == [f"dev-{i}" for i in range(10)]
+    assert len({r["serial"] for r in rows}) == 10
+
+    cert = _load(out / "dev-3.cert.pem")
+    cert.verify_directly_issued_by(ca["cert"])
+    assert cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value == "dev-3"
+    eku = cert.extensions.get_extension_for_class(x509.ExtendedKeyUsage).value
+    assert list(eku) == [ExtendedKeyUsageOID.CLIENT_AUTH]
+    row = next(r for r in rows if r["name"] == "dev-3")
+    assert int(row["serial"], 16) == cert.serial_number
+
+    key = serialization.load_pem_private_key(open(out / "dev-3.key.pem", "rb").read(), None)
+    assert key.public_key().public_numbers() == cert.public_key().public_numbers()
+    assert os.stat(out / "dev-3.key.pem").st_mode & 0o777 == 0o600
+    bundle = pkcs12.load_pkcs12(open(out / "dev-3.p12", "rb").read(), b"pw")
+    assert bundle.cert.certificate == cert
+
+
+def test_bad_names_fail_without_stopping_the_batch(ca, tmp_path):
+    out = tmp_path / "devices"
+    report = _issue(ca, [IssueJob("ok"), IssueJob("../escape"), IssueJob(".hidden")], out)
+    assert report.issued == 1 and report.failed == 2
+    assert all("invalid device name" in e for e in report.errors)
+    assert sorted(os.listdir(out)) == ["manifest.csv", "ok.cert.pem", "ok.key.pem"]
+    assert not (tmp_path / "escape.cert.pem").exists()
+
+
+def test_csr_signing_and_server_certs(ca, tmp_path):
+    csr_dir = tmp_path / "csrs"
+    csr_dir.mkdir()
+    device_key = ec.generate_private_key(ec.SECP256R1())
+    csr = (
+        x509.CertificateSigningRequestBuilder()
+        .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "admin")]))
+        .sign(device_key, hashes.SHA256())
+    )
+    (csr_dir / "gw.csr.pem").write_bytes(csr.public_bytes(serialization.Encoding.PEM))
+    (csr_dir / "notes.txt").write_text("ignored")
+
+    jobs = jobs_from_csr_dir(str(csr_dir))
+    assert [j.name for j in jobs] == ["gw"]
+    out = tmp_path / "out"
+    assert _issue(ca, jobs, out, server=True).issued == 1
+
+    cert = _load(out / "gw.cert.pem")
+    assert cert.public_key().public_numbers() == device_key.public_key().public_numbers()
+    # CSR 自稱 admin 也沒用，CN 照檔名
+    assert cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value == "gw"
+    san = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+    assert san.get_values_for_type(x509.DNSName) == ["gw"]
+    assert not (out / "gw.key.pem").exists()  # 私鑰在裝置上，不會有 key 檔
+
+
+def test_cli_issue_batch(ca, tmp_path, capsys):
+    out = tmp_path / "cli"
+    code = certs_cli([
+        "issue-batch", "--count", "3", "--prefix", "node-", "--key-alg", "ed25519", "--workers", "1",
+        "--out", str(out), "--ca-key", ca["ca_key_path"], "--ca-cert", ca["ca_cert_path"],
+    ])
+    assert code == 0 and "issued=3 failed=0" in capsys.readouterr().out
+    assert (out / "node-000002.cert.pem").exists()
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from backend.catalog import FileRecord, reconcile
+from conftest import encrypt_for_upload, run, upload
+
+
+def _fill(catalog, n):
+    for i in range(n):
+        run(catalog.upsert(FileRecord(
+            file_id=f"id-{i:03d}",
+            filename=f"{'report' if i % 2 else 'photo'}-{i:03d}.txt",
+            owner_id="alice" if i % 3 else "bob",
+            size=i,
+        )))
+
+
+def _all_pages(catalog, **kw):
+    seen, cursor, pages = [], None, 0
+    while True:
+        records, cursor = run(catalog.list(cursor=cursor, **kw))
+        seen += records
+        pages += 1
+        if cursor is None:
+            return seen, pages
+
+
+def test_cursor_walks_every_record_once(catalog):
+    _fill(catalog, 25)
+    records, pages = _all_pages(catalog, limit=10)
+    assert [r.file_id for r in records] == [f"id-{i:03d}" for i in range(25)] and pages == 3
+
+    # 剛好整除時最後一頁不會多一個空頁
+    records, pages = _all_pages(catalog, limit=5)
+    assert len(records) == 25 and pages == 5
+
+
+def test_owner_and_prefix_filters_page_in_filename_order(catalog):
+    _fill(catalog, 30)
+    records, _ = _all_pages(catalog, owner_id="alice", prefix="report", limit=4)
+    expected = sorted(
+        f"report-{i:03d}.txt" for i in range(30) if i % 2 and i % 3
+    )
+    assert [r.filename for r in records] == expected
+    assert all(r.owner_id == "alice" for r in records)
+
+
+def test_bad_cursors_rejected(catalog):
+    _fill(catalog, 3)
+    _, cursor = run(catalog.list(limit=1))
+    with pytest.raises(ValueError):
+        run(catalog.list(cursor="not-base64!"))
+    with pytest.raises(ValueError):
+        run(catalog.list(cursor=cursor, prefix="photo"))  # 不同排序的 cursor
+
+
+def test_list_endpoint_pages_like_the_frontend(files_client):
+    ids = {upload(files_client, b"x", filename=f"f{i}.txt") for i in range(5)}
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        body = files_client.get("/files/list", params=params).json()
+        seen += [f["file_id"] for f in body["files"]]
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert sorted(seen) == sorted(ids) and len(seen) == 5
+    assert files_client.get("/files/list", params={"cursor": "bogus"}).status_code == 400
+    assert files_client.get("/files/list", params={"limit": 1001}).status_code == 422
+
+
+def test_reconcile_rebuilds_from_storage(files_client, storage, catalog):
+    file_id = upload(files_client, b"payload", filename="keep.txt", user_id="alice")
+    size = run(catalog.get(file_id)).size
+    run(catalog.delete(file_id))
+    run(catalog.upsert(FileRecord(file_id="ghost", filename="ghost.txt")))
+
+    assert run(reconcile(catalog, storage)) == {"indexed": 1, "removed": 1}
+    rec = run(catalog.get(file_id))
+    assert rec.filename == "keep.txt" and rec.owner_id == "alice" and rec.size == size
+    assert run(catalog.get("ghost")) is None
+
+
+def test_reconcile_keeps_files_uploaded_during_the_scan(files_client, storage, catalog):
+    upload(files_client, b"old")
+    ciphertext, meta = encrypt_for_upload(b"late")
+    real_list = storage.list
+    late = []
+
+    async def list_then_upload(prefix=""):
+        async for obj in real_list(prefix):
+            yield obj
+        # list 已經走完，這時候才上傳的檔案
+        resp = files_client.post(
+            "/files/upload",
+            files={"file": ("late.txt", ciphertext)},
+            data={"metadata": json.dumps({**meta, "filename": "late.txt"})},
+        )
+        late.append(resp.json()["file_id"])
+
+    storage.list = list_then_upload
+    assert run(reconcile(catalog, storage)) == {"indexed": 1, "removed": 0}
+    assert run(catalog.get(late[0])) is not None
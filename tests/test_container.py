@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+from backend.encryption.container import (
+    FileHeader, HEADER_DIGEST_KEY, HEADER_PREFETCH, header_digest, pack_header, parse_header, read_header,
+)
+from backend.routes import files
+from backend.storage.base import ObjectChanged
+from backend.storage.memory import MemoryStorage
+from conftest import run, upload
+
+
+def _header(**kw):
+    values = dict(alg="AES-GCM-STREAM", iv=os.urandom(12), wrapped_dek=os.urandom(256),
+                  key_version="1", filename="a.txt", owner="alice")
+    values.update(kw)
+    return FileHeader(**values)
+
+
+def test_pack_parse_round_trip():
+    header = _header(filename="報告.pdf")
+    raw = pack_header(header)
+    parsed, offset = parse_header(raw + b"ciphertext")
+    assert parsed == header and offset == len(raw)
+    assert parsed.key_metadata() == {"key_version": "1"}
+    assert _header(kek_id="k1", wrap="AESGCM").key_metadata() == {"kek_id": "k1", "wrap": "AESGCM"}
+
+
+@pytest.mark.parametrize("data", [b"EFH1", b"XXXX\x00\x00\x00\x20\x01", pack_header(_header())[:-1]])
+def test_bad_headers_rejected(data):
+    with pytest.raises(ValueError):
+        parse_header(data)
+
+
+def test_read_header_longer_than_prefetch():
+    storage = MemoryStorage()
+    header = _header(filename="x" * (HEADER_PREFETCH * 2))
+    raw = pack_header(header)
+    run(storage.put("f.enc", raw + b"body"))
+    parsed, offset, head = run(read_header(storage, "f.enc"))
+    assert parsed == header and head[offset:] == b"" and offset == len(raw)
+
+
+def test_pinned_read_rejects_rewritten_object():
+    storage = MemoryStorage()
+    stat = run(storage.put("f.enc", b"one"))
+    run(storage.put("f.enc", b"two"))
+    with pytest.raises(ObjectChanged):
+        run(storage.get_range("f.enc", 0, 3, generation=stat.generation))
+    with pytest.raises(ObjectChanged):
+        run(read_header(storage, "f.enc", generation=stat.generation))
+
+
+async def _rewrite_with_longer_header(storage, file_id):
+    """模擬 rewrap：同一份密文前面換一個長度不同的 header。"""
+    name = f"{file_id}.enc"
+    header, offset, _ = await read_header(storage, name)
+    body = (await storage.get(name))[offset:]
+    raw = pack_header(FileHeader(**{**header.__dict__, "owner": header.owner + "-" * 300}))
+    await storage.put(name, raw + body, metadata={**header.key_metadata(), HEADER_DIGEST_KEY: header_digest(raw)})
+
+
+def test_stored_metadata_has_header_digest(files_client, storage):
+    file_id = upload(files_client, b"hello")
+    stat = run(storage.stat(f"{file_id}.enc"))
+    _, offset, head = run(read_header(storage, stat.name))
+    assert stat.metadata[HEADER_DIGEST_KEY] == header_digest(head[:offset])
+
+
+def test_download_follows_rewrite_between_frames(files_client, storage):
+    plaintext = os.urandom(10_000)
+    file_id = upload(files_client, plaintext, frame_size=1024)
+
+    async def download():
+        stored = await files._load_file(storage, file_id)
+        chunks = []
+        async for chunk in files._iter_plaintext(storage, stored):
+            chunks.append(chunk)
+            if len(chunks) == 3:
+                await _rewrite_with_longer_header(storage, file_id)
+        return b"".join(chunks)
+
+    assert run(download()) == plaintext
+
+
+def test_load_file_detects_header_from_other_generation(files_client, storage):
+    plaintext = os.urandom(5000)
+    file_id = upload(files_client, plaintext)
+    name = f"{file_id}.enc"
+    stale = run(storage.get_range(name, 0, HEADER_PREFETCH))
+    run(_rewrite_with_longer_header(storage, file_id))
+
+    class Straddling(MemoryStorage):
+        """第一次（沒有指定 generation 的）header 讀取拿到覆寫前的內容。"""
+        def __init__(self, inner):
+            self._objects, self._generations = inner._objects, inner._generations
+            self.stale = stale
+
+        async def get_range(self, name, start=0, end=None, generation=None):
+            if generation is None and self.stale is not None:
+                data, self.stale = self.stale, None
+                return data[start:end]
+            return await super().get_range(name, start, end, generation)
+
+    straddling = Straddling(storage)
+
+    async def download():
+        stored = await files._load_file(straddling, file_id)
+        return b"".join([c async for c in files._iter_plaintext(straddling, stored)])
+
+    assert run(download()) == plaintext
+
+
+def test_rewrap_rewrites_object_and_download_still_works(files_client, storage, catalog, monkeypatch):
+    monkeypatch.setattr(files, "ENVELOPE_ENCRYPTION", False)
+    plaintext = os.urandom(3000)
+    file_id = upload(files_client, plaintext)
+    assert "kek_id" not in run(storage.stat(f"{file_id}.enc")).metadata
+
+    monkeypatch.setattr(files, "ENVELOPE_ENCRYPTION", True)
+    assert run(files.rewrap_file_key(storage, catalog, file_id))
+    stat = run(storage.stat(f"{file_id}.enc"))
+    header, offset, head = run(read_header(storage, stat.name))
+    assert header.kek_id and stat.metadata["kek_id"] == header.kek_id
+    assert stat.metadata[HEADER_DIGEST_KEY] == header_digest(head[:offset])
+    assert not run(files.rewrap_file_key(storage, catalog, file_id))
+
+    resp = files_client.get(f"/files/download/{file_id}", headers={"Range": "bytes=1000-1999"})
+    assert resp.status_code == 206 and resp.content == plaintext[1000:2000]
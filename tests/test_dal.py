@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+
+import pytest
+
+from dal import ConnectionPool, PoolTimeout, SQLiteDialect, UserRepository, create_pool
+
+
+@pytest.fixture
+def dialect(tmp_path):
+    return SQLiteDialect(str(tmp_path / "users.db"))
+
+
+def test_user_repository(dialect):
+    users = UserRepository(ConnectionPool(dialect, size=2))
+    assert users.get_password_hash("alice") is None
+    assert users.create_user("alice", "$hash1")
+    assert not users.create_user("alice", "$other")  # UNIQUE 約束
+    assert users.get_password_hash("alice") == "$hash1"
+    users.update_password_hash("alice", "$hash2")
+    assert users.get_password_hash("alice") == "$hash2"
+
+
+def test_connections_are_reused(dialect):
+    pool = ConnectionPool(dialect, size=2)
+    users = UserRepository(pool)
+    for i in range(10):
+        users.create_user(f"u{i}", "h")
+        users.get_password_hash(f"u{i}")
+    stats = pool.stats()
+    assert stats["created"] == 1 and stats["acquired"] == 20
+    assert stats["in_use"] == 0 and stats["idle"] == 1
+
+
+def test_exhausted_pool_times_out(dialect):
+    pool = ConnectionPool(dialect, size=1, timeout=0.05)
+    with pool.connection():
+        with pytest.raises(PoolTimeout):
+            with pool.connection():
+                pass
+    assert pool.stats()["timeouts"] == 1
+    with pool.connection():  # 還回去之後又借得到
+        pass
+
+
+def test_waiter_gets_connection_when_released(dialect):
+    pool = ConnectionPool(dialect, size=1, timeout=5)
+    got = threading.Event()
+
+    def borrow():
+        with pool.connection():
+            got.set()
+
+    with pool.connection():
+        thread = threading.Thread(target=borrow)
+        thread.start()
+        assert not got.wait(0.05)
+    thread.join(5)
+    assert got.is_set() and pool.stats()["wait_max_ms"] > 0
+
+
+class FlakyDialect(SQLiteDialect):
+    def __init__(self, path):
+        super().__init__(path)
+        self.broken = set()
+
+    def ping(self, conn):
+        if id(conn) in self.broken:
+            raise sqlite3.OperationalError("server has gone away")
+        super().ping(conn)
+
+
+def test_stale_connection_is_replaced(tmp_path):
+    dialect = FlakyDialect(str(tmp_path / "users.db"))
+    pool = ConnectionPool(dialect, size=1, ping_interval=0)
+    with pool.connection() as conn:
+        dialect.broken.add(id(conn))
+    with pool.connection() as fresh:
+        assert fresh is not conn
+        fresh.execute("SELECT 1")
+    assert pool.stats()["replaced"] == 1
+
+
+def test_failed_work_rolls_back(dialect):
+    pool = ConnectionPool(dialect, size=1)
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO users(username,password) VALUES('ghost','x')")
+            raise RuntimeError("boom")
+    assert UserRepository(pool).get_password_hash("ghost") is None
+    assert pool.stats()["idle"] == 1
+
+
+def test_health_and_backend_selection(monkeypatch, tmp_path):
+    monkeypatch.setenv("DB_BACKEND", "sqlite")
+    monkeypatch.setenv("DB_SQLITE_PATH", str(tmp_path / "app.db"))
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    pool = create_pool()
+    health = pool.health()
+    assert health["ok"] and health["backend"] == "sqlite" and health["size"] == 3
+    pool.close()
+    assert pool.stats()["idle"] == 0
+
+    monkeypatch.setenv("DB_BACKEND", "oracle")
+    with pytest.raises(RuntimeError):
+        create_pool()
+
+
+def test_read_only_borrow_does_not_keep_a_stale_snapshot(dialect):
+    with sqlite3.connect(dialect.path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")  # 讀取的 transaction 固定 snapshot，跟 MySQL REPEATABLE READ 一樣
+    pool = ConnectionPool(dialect, size=2)
+    users = UserRepository(pool)
+
+    with pool.connection() as reader:
+        reader.execute("BEGIN")
+        reader.execute("SELECT count(*) FROM users").fetchone()  # 只讀、沒有 commit 就還回去
+    assert not reader.in_transaction
+
+    # 另一條連線註冊了新帳號；之後再借到 reader 的查詢要看得到
+    with pool.connection() as first:
+        assert first is reader
+        with pool.connection() as writer:
+            writer.execute("INSERT INTO users(username,password) VALUES('bob','$h')")
+            writer.commit()
+    assert users.get_password_hash("bob") == "$h"
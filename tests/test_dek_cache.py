@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from backend.kms import dek_cache as dek_cache_module
+from backend.kms.dek_cache import DEKCache
+from conftest import run
+
+
+def test_hit_miss_and_key_includes_wrapped_key():
+    cache = DEKCache(ttl=60, max_entries=4)
+    key = cache.make_key("f1", b"wrapped-1")
+    assert cache.get(key) is None
+    cache.put(key, b"d" * 32)
+    assert cache.get(key) == b"d" * 32
+    assert cache.get(cache.make_key("f1", b"wrapped-2")) is None  # rewrap 後自動 miss
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_lru_eviction_zeroizes():
+    cache = DEKCache(ttl=60, max_entries=2)
+    keys = [cache.make_key(f"f{i}", b"w") for i in range(3)]
+    cache.put(keys[0], b"a" * 32)
+    buf = cache._entries[keys[0]][0]
+    cache.put(keys[1], b"b" * 32)
+    cache.get(keys[0])  # f0 變成最近使用
+    cache.put(keys[2], b"c" * 32)
+    assert cache.get(keys[1]) is None and cache.get(keys[0]) == b"a" * 32
+    assert cache.stats()["evictions"] == 1
+
+    cache.clear()
+    assert buf == bytearray(32)
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dek_cache_module.time, "monotonic", lambda: now[0])
+    cache = DEKCache(ttl=10, max_entries=4)
+    key = cache.make_key("f", b"w")
+    cache.put(key, b"x" * 32)
+    buf = cache._entries[key][0]
+    now[0] += 9.9
+    assert cache.get(key) == b"x" * 32
+    now[0] += 0.2
+    assert cache.get(key) is None and buf == bytearray(32)
+    assert cache.stats()["expirations"] == 1
+
+
+@pytest.mark.parametrize("ttl, entries", [(0, 10), (10, 0)])
+def test_disabled_cache_stores_nothing(ttl, entries):
+    cache = DEKCache(ttl=ttl, max_entries=entries)
+    cache.put(cache.make_key("f", b"w"), b"x")
+    assert cache.stats()["entries"] == 0
+
+
+def test_concurrent_misses_share_one_load():
+    cache = DEKCache()
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return b"k" * 32
+
+    async def many():
+        key = cache.make_key("f", b"w")
+        return await asyncio.gather(*(cache.get_or_load(key, loader) for _ in range(10)))
+
+    assert run(many()) == [b"k" * 32] * 10 and calls == 1
+
+
+def test_failed_load_is_not_cached_and_reaches_all_waiters():
+    cache = DEKCache()
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("KMS down")
+
+    async def many():
+        key = cache.make_key("f", b"w")
+        return await asyncio.gather(*(cache.get_or_load(key, loader) for _ in range(3)), return_exceptions=True)
+
+    results = run(many())
+    assert all(isinstance(r, RuntimeError) for r in results) and calls == 1
+    assert cache.stats()["entries"] == 0 and not cache._inflight
+
+
+def test_invalidate_only_that_file():
+    cache = DEKCache()
+    for file_id, wrapped in (("a", b"1"), ("a", b"2"), ("b", b"1")):
+        cache.put(cache.make_key(file_id, wrapped), b"x" * 32)
+    assert cache.invalidate("a") == 2
+    assert cache.stats()["entries"] == 1
+
+
+def test_downloads_hit_the_cache(files_client, monkeypatch):
+    from backend.kms.dek_cache import dek_cache
+    from backend.routes import files, kms
+    from conftest import upload
+
+    monkeypatch.setattr(files, "ENVELOPE_ENCRYPTION", False)  # RSA 包的 DEK 才會經過 KMS
+    file_id = upload(files_client, b"cached")
+    calls = []
+    real = kms.kms_decrypt
+
+    async def counting(*args):
+        calls.append(args)
+        return await real(*args)
+
+    monkeypatch.setattr(kms, "kms_decrypt", counting)
+    dek_cache.invalidate(file_id)
+    for _ in range(3):
+        assert files_client.get(f"/files/download/{file_id}").content == b"cached"
+    assert len(calls) == 1
@@ -0,0 +1,76 @@
+import io
+import zipfile
+
+import pytest
+
+from backend.routes import files
+from backend.routes.files import _safe_name, _unique_name
+from conftest import upload
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("report.pdf", "report.pdf"),
+    ("../../evil.sh", "evil.sh"),
+    ("/etc/passwd", "passwd"),
+    ("..\\..\\windows\\win.ini", "win.ini"),
+    ("C:evil.exe", "evil.exe"),
+    ("C:\\Users\\x\\notes.txt", "notes.txt"),
+    ("a\x00b\x1f\x7fc.txt", "abc.txt"),
+    ("..", "f1.bin"),
+    ("dir/..", "f1.bin"),
+    ("", "f1.bin"),
+    ("\x00\x01", "f1.bin"),
+    ("..hidden", "..hidden"),
+])
+def test_safe_name(name, expected):
+    assert _safe_name(name, "f1") == expected
+
+
+def test_unique_name_after_sanitizing():
+    used = set()
+    names = [_unique_name(_safe_name(n, "x"), used) for n in ("a/x.txt", "b/x.txt", "x.txt")]
+    assert names == ["x.txt", "x (1).txt", "x (2).txt"]
+
+
+def test_batch_zip_has_no_path_traversal(files_client):
+    contents = {
+        "../../evil.sh": b"#!/bin/sh\necho pwned\n",
+        "/etc/passwd": b"root:x:0:0\n",
+        "ok.txt": b"hello" * 1000,
+    }
+    ids = {upload(files_client, data, filename=name): data for name, data in contents.items()}
+
+    resp = files_client.post("/files/download-batch", json={"file_ids": list(ids)})
+    assert resp.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(resp.content)) as zf:
+        names = zf.namelist()
+        assert sorted(names) == ["evil.sh", "ok.txt", "passwd"]
+        for name in names:
+            assert "/" not in name and "\\" not in name and ".." not in name
+        assert zf.read("evil.sh") == contents["../../evil.sh"]
+        assert zf.read("passwd") == contents["/etc/passwd"]
+        assert zf.read("ok.txt") == contents["ok.txt"]
+
+
+def test_batch_missing_file_is_404(files_client):
+    file_id = upload(files_client, b"data")
+    resp = files_client.post("/files/download-batch", json={"file_ids": [file_id, "0" * 32]})
+    assert resp.status_code == 404
+    assert resp.json()["detail"] == {"missing": ["0" * 32]}
+
+
+def test_batch_failure_is_audited(files_client, monkeypatch, capsys):
+    file_id = upload(files_client, b"data")
+    recorded = []
+
+    async def broken(storage, fid):
+        raise ValueError("bad header")
+
+    monkeypatch.setattr(files, "_load_file", broken)
+    monkeypatch.setattr(files, "log_event", lambda **kw: recorded.append(kw))
+    resp = files_client.post("/files/download-batch", json={"file_ids": [file_id]})
+    assert resp.status_code == 500
+    assert [(r["action"], r["metadata"]["file_id"], r["metadata"]["error"]) for r in recorded] == [
+        ("download_failed", file_id, "ValueError: bad header")
+    ]
+    assert capsys.readouterr().out == ""
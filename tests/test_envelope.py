@@ -0,0 +1,175 @@
+import base64
+import os
+
+import pytest
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from backend.catalog import reconcile
+from backend.encryption.container import read_header
+from backend.kms.envelope import KEK_PREFIX, KEKRing, is_enveloped, rsa_wrap
+from backend.kms.providers import KMSUnavailable
+from backend.routes import files
+from backend.storage.memory import MemoryStorage
+from conftest import encrypt_for_upload, run, upload
+
+_OAEP = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+
+
+class _FakeKMS:
+    def __init__(self):
+        self.keys = {"1": rsa.generate_private_key(public_exponent=65537, key_size=2048)}
+        self.version = "1"
+        self.unwraps = 0
+
+    async def public_key(self):
+        pem = self.keys[self.version].public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+        return pem, self.version
+
+    async def unwrap(self, wrapped, key_version):
+        self.unwraps += 1
+        return self.keys[key_version or self.version].decrypt(wrapped, _OAEP)
+
+
+@pytest.fixture
+def kms():
+    return _FakeKMS()
+
+
+def test_wrap_unwrap_binds_file_and_kek(kms):
+    storage = MemoryStorage()
+    ring = KEKRing(kms.unwrap, kms.public_key)
+    dek = os.urandom(32)
+    wrapped, meta = run(ring.wrap_dek(storage, dek, "f1", "alice"))
+    assert is_enveloped(meta) and meta["kek_id"].startswith("alice-")
+    assert run(ring.unwrap_dek(storage, wrapped, "f1", meta["kek_id"])) == dek
+    with pytest.raises(InvalidTag):
+        run(ring.unwrap_dek(storage, wrapped, "f2", meta["kek_id"]))
+    assert kms.unwraps == 0  # 剛建立的 KEK 已經在快取裡
+
+    # 另一個行程（沒有快取）只為 KEK 打一次 KMS
+    other = KEKRing(kms.unwrap, kms.public_key)
+    for _ in range(3):
+        assert run(other.unwrap_dek(storage, wrapped, "f1", meta["kek_id"])) == dek
+    assert kms.unwraps == 1
+
+
+def test_tenants_get_separate_keks_and_slugs(kms):
+    storage = MemoryStorage()
+    ring = KEKRing(kms.unwrap, kms.public_key)
+    _, a = run(ring.wrap_dek(storage, b"k" * 32, "f1", "alice"))
+    _, a2 = run(ring.wrap_dek(storage, b"k" * 32, "f2", "alice"))
+    _, b = run(ring.wrap_dek(storage, b"k" * 32, "f3", "../bob"))
+    assert a == a2 and a["kek_id"] != b["kek_id"]
+    assert b["kek_id"].startswith(".._bob-") and ring.created == 2
+
+
+def test_rotate_rewraps_kek_only_once(kms):
+    storage = MemoryStorage()
+    ring = KEKRing(kms.unwrap, kms.public_key)
+    dek = os.urandom(32)
+    wrapped, meta = run(ring.wrap_dek(storage, dek, "f1", None))
+    name = f"{KEK_PREFIX}{meta['kek_id']}.key"
+
+    kms.keys["2"] = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    kms.version = "2"
+    stat = run(storage.stat(name))
+    assert run(ring.rotate(storage, meta["kek_id"], stat.metadata))
+    assert not run(ring.rotate(storage, meta["kek_id"], run(storage.stat(name)).metadata))
+
+    fresh = KEKRing(kms.unwrap, kms.public_key)
+    assert run(fresh.unwrap_dek(storage, wrapped, "f1", meta["kek_id"])) == dek
+
+
+def test_missing_kek_is_object_not_found(kms):
+    ring = KEKRing(kms.unwrap, kms.public_key)
+    with pytest.raises(KeyError, match="KEK nope not found"):
+        run(ring.get(MemoryStorage(), "nope"))
+
+
+# --- files：上傳時的 seal 與 rewrap ---
+@pytest.fixture
+def events(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(files, "log_event", lambda **kw: recorded.append(kw))
+    return recorded
+
+
+def test_seal_keeps_rsa_key_when_kms_fails(storage, events, monkeypatch):
+    async def down(*args):
+        raise KMSUnavailable("quota exceeded")
+
+    monkeypatch.setattr(files, "kms_decrypt", down)
+    _, meta = encrypt_for_upload(b"x")
+    rsa_wrapped = base64.b64decode(meta["encrypted_dek"])
+    blob, key_meta = run(files._seal_dek(storage, "f1", rsa_wrapped, "alice", meta["key_version"]))
+    assert blob == rsa_wrapped and key_meta == {"key_version": meta["key_version"]}
+    assert events == [{
+        "user_id": "alice",
+        "action": "dek_rewrap_failed",
+        "metadata": {"file_id": "f1", "error": "KMSUnavailable: quota exceeded"},
+    }]
+
+
+def test_seal_does_not_swallow_programming_errors(storage, events, monkeypatch):
+    async def broken(*args):
+        raise TypeError("bug")
+
+    monkeypatch.setattr(files, "kms_decrypt", broken)
+    with pytest.raises(TypeError):
+        run(files._seal_dek(storage, "f1", b"x" * 256, None, "1"))
+    assert events == []
+
+
+def test_rewrap_updates_catalog(files_client, storage, catalog, monkeypatch):
+    monkeypatch.setattr(files, "ENVELOPE_ENCRYPTION", False)
+    file_id = upload(files_client, b"payload")
+    before = run(catalog.get(file_id)).wrapped_key
+
+    monkeypatch.setattr(files, "ENVELOPE_ENCRYPTION", True)
+    assert run(files.rewrap_file_key(storage, catalog, file_id))
+    header, _, _ = run(read_header(storage, f"{file_id}.enc"))
+    after = run(catalog.get(file_id)).wrapped_key
+    assert after == header.wrapped_dek and after != before
+
+
+def test_rewrap_skips_file_deleted_meanwhile(files_client, storage, catalog, monkeypatch):
+    monkeypatch.setattr(files, "ENVELOPE_ENCRYPTION", False)
+    file_id = upload(files_client, b"payload" * 1000)
+    monkeypatch.setattr(files, "ENVELOPE_ENCRYPTION", True)
+    real_iter_range = storage.iter_range
+
+    async def read_then_delete(*args, **kwargs):
+        async for chunk in real_iter_range(*args, **kwargs):
+            yield chunk
+        # 密文已經整份讀完、還沒寫回去的時候，使用者刪掉了檔案
+        assert files_client.delete(f"/files/delete/{file_id}").status_code == 200
+
+    monkeypatch.setattr(storage, "iter_range", read_then_delete)
+    assert not run(files.rewrap_file_key(storage, catalog, file_id))
+    with pytest.raises(KeyError):
+        run(storage.stat(f"{file_id}.enc"))
+    run(reconcile(catalog, storage))
+    assert run(catalog.get(file_id)) is None
+
+
+def test_legacy_rewrap_updates_key_object_and_catalog(storage, catalog, monkeypatch):
+    from backend.catalog import FileRecord
+    from backend.routes.kms import public_key_cache
+
+    entry = run(public_key_cache.get())
+    dek, iv = os.urandom(32), os.urandom(12)
+    run(storage.put("old.bin", b"ciphertext", metadata={"iv": iv.hex(), "owner": "carol"}))
+    run(storage.put("old.key", rsa_wrap(entry.pem, dek).hex().encode(), metadata={"key_version": entry.key_version}))
+    run(catalog.upsert(FileRecord(file_id="old", filename="old.txt", owner_id="carol", wrapped_key=b"stale")))
+
+    monkeypatch.setattr(files, "ENVELOPE_ENCRYPTION", True)
+    assert run(files.rewrap_file_key(storage, catalog, "old"))
+    key_stat = run(storage.stat("old.key"))
+    wrapped = run(storage.get("old.key"))
+    assert key_stat.metadata["kek_id"].startswith("carol-")
+    assert run(catalog.get("old")).wrapped_key == wrapped
+    assert run(files.kek_ring.unwrap_dek(storage, wrapped, "old", key_stat.metadata["kek_id"])) == dek
@@ -0,0 +1,116 @@
+import os
+import time
+from functools import lru_cache
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+from backend.certs.key_pool import KeyPool, load_pool_kek
+
+KEK = b"k" * 32
+
+
+def _pool(tmp_path, **kw):
+    options = dict(directory=str(tmp_path / "pool"), size=4, low_watermark=2,
+                   algorithms=("ec-p256",), workers=2, kek=KEK)
+    options.update(kw)
+    return KeyPool(**options)
+
+
+def _files(tmp_path):
+    return sorted(os.listdir(tmp_path / "pool" / "ec-p256"))
+
+
+def test_fill_take_and_reload(tmp_path):
+    with _pool(tmp_path) as pool:
+        pool.fill(timeout=30)
+        assert pool.stats()["available"] == {"ec-p256": 4}
+        assert pool.stats()["inflight"] == {"ec-p256": 0}
+    assert len(_files(tmp_path)) == 4
+
+    # 沒有 start：只用磁碟上現成的 key，不開 worker
+    pool = _pool(tmp_path)
+    pool.load()
+    key = pool.take("ec-p256")
+    assert isinstance(key, ec.EllipticCurvePrivateKey)
+    assert pool.hits == 1 and pool._pool is None
+    assert len(_files(tmp_path)) == 3
+
+    other = _pool(tmp_path)
+    other.load()
+    assert other.stats()["available"] == {"ec-p256": 3}
+
+
+def test_empty_pool_generates_inline(tmp_path):
+    pool = _pool(tmp_path)
+    pool.load()
+    assert isinstance(pool.take("ec-p256"), ec.EllipticCurvePrivateKey)
+    assert isinstance(pool.take("ed25519"), ed25519.Ed25519PrivateKey)
+    assert pool.misses == 2 and pool.hits == 0
+
+
+def test_wrong_kek_files_are_skipped(tmp_path):
+    with _pool(tmp_path) as pool:
+        pool.fill(timeout=30)
+    other = _pool(tmp_path, kek=b"x" * 32)
+    other.load()
+    assert other.stats()["available"] == {"ec-p256": 0}
+
+
+def test_stop_only_waits_for_running_work(tmp_path):
+    pool = _pool(tmp_path, size=100000, algorithms=("rsa2048",), workers=1)
+    pool.start()
+    assert pool.stats()["inflight"]["rsa2048"] <= 1
+    started = time.monotonic()
+    pool.stop()
+    assert time.monotonic() - started < 10
+    assert pool.stats()["inflight"]["rsa2048"] == 0
+
+
+def test_unknown_algorithm_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        _pool(tmp_path, algorithms=("dsa",))
+
+
+def test_pool_kek_size_check(monkeypatch):
+    monkeypatch.setenv("KEY_POOL_KEK", "AAAA")
+    with pytest.raises(RuntimeError):
+        load_pool_kek()
+
+
+def _wait_for(predicate, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_take_below_watermark_refills_in_background(tmp_path):
+    with _pool(tmp_path) as pool:
+        pool.fill(timeout=30)
+        generated = pool.generated
+        pool.take("ec-p256")
+        assert pool.stats()["inflight"]["ec-p256"] == 0  # 還在 watermark 以上，不補
+        pool.take("ec-p256")
+        pool.take("ec-p256")  # 剩 1 把 < 2
+        assert _wait_for(lambda: pool.stats()["available"]["ec-p256"] == 4)
+        assert pool.generated == generated + 3 and pool.misses == 0
+
+
+def test_service_lifespan_starts_and_stops_shared_pool(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from backend import main
+    from backend.certs import key_pool
+
+    shared = lru_cache(maxsize=None)(lambda: _pool(tmp_path))
+    monkeypatch.setattr(key_pool, "get_key_pool", shared)
+    with TestClient(main.app):
+        assert shared()._pool is not None
+        assert _wait_for(lambda: shared().stats()["available"]["ec-p256"] == 4)
+    assert shared()._pool is None
+
+    # KEY_POOL_BACKGROUND=0：只用磁碟上現成的 key
+    monkeypatch.setattr(key_pool, "KEY_POOL_BACKGROUND", False)
+    shared.cache_clear()
+    with TestClient(main.app):
+        assert shared()._pool is None
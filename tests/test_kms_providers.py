@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+from google.api_core import exceptions as gcp_exceptions
+
+from backend.kms import providers
+from backend.kms.envelope import rsa_wrap
+from backend.kms.providers import GCPKMSProvider, KMSUnavailable, LocalKMSProvider
+
+
+def _local(tmp_path, **kw):
+    return LocalKMSProvider(directory=str(tmp_path / "kms"), key_size=1024, **kw)
+
+
+def test_local_round_trip_and_key_persistence(tmp_path):
+    kms = _local(tmp_path)
+    pem = kms.get_public_key()
+    assert kms.asymmetric_decrypt(rsa_wrap(pem, b"dek")) == b"dek"
+    path = tmp_path / "kms" / "files" / "1.pem"
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    # 另一個行程（重新啟動）讀到同一把
+    assert _local(tmp_path).get_public_key() == pem
+    assert kms.version_name("1") == kms.key_version_name
+    assert kms.version_name(kms.key_version_name) == kms.key_version_name
+
+
+def test_rotation_and_unknown_versions(tmp_path):
+    v1 = _local(tmp_path)
+    old = rsa_wrap(v1.get_public_key(), b"old")
+    v2 = _local(tmp_path, version="2")
+    new = rsa_wrap(v2.get_public_key(), b"new")
+
+    assert v2.asymmetric_decrypt(old, v2.version_name("1")) == b"old"
+    assert v2.asymmetric_decrypt(new) == b"new"
+    with pytest.raises(KMSUnavailable):
+        v1.get_public_key(v1.version_name("3"))  # 只有目前的版本會自動產生
+    with pytest.raises(KMSUnavailable):
+        v1.get_public_key("projects/other/locations/x/keyRings/y/cryptoKeys/z/cryptoKeyVersions/1")
+    assert not (tmp_path / "kms" / "files" / "3.pem").exists()
+
+
+def _first_start(directory):
+    return LocalKMSProvider(directory=directory, key_size=1024).get_public_key()
+
+
+def test_concurrent_first_start_agrees_on_one_key(tmp_path):
+    directory = str(tmp_path / "kms")
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        keys = pool.map(_first_start, [directory] * 8)
+    assert len(set(keys)) == 1
+    assert os.listdir(os.path.join(directory, "files")) == ["1.pem"]
+
+
+def test_injected_latency_and_errors(tmp_path):
+    slow = _local(tmp_path, latency_ms=30)
+    started = time.monotonic()
+    slow.get_public_key()
+    assert time.monotonic() - started >= 0.03 and slow.calls == 1
+
+    broken = _local(tmp_path, error_rate=1.0)
+    with pytest.raises(KMSUnavailable, match="Injected"):
+        broken.get_public_key()
+
+
+def test_gcp_errors_surface_as_kms_unavailable():
+    gcp = object.__new__(GCPKMSProvider)
+    gcp._api_error = gcp_exceptions.GoogleAPICallError
+
+    def unavailable(request):
+        raise gcp_exceptions.ServiceUnavailable("backend down")
+
+    with pytest.raises(KMSUnavailable):
+        gcp._call(unavailable, {"name": "x"})
+    assert gcp._call(lambda request: request["name"], {"name": "x"}) == "x"
+
+
+def test_provider_selection(monkeypatch, tmp_path):
+    providers.get_kms_provider.cache_clear()
+    try:
+        monkeypatch.setenv("KMS_PROVIDER", "local")
+        monkeypatch.setenv("LOCAL_KMS_DIR", str(tmp_path / "kms"))
+        monkeypatch.setenv("LOCAL_KMS_KEY_VERSION", "4")
+        provider = providers.get_kms_provider()
+        assert isinstance(provider, LocalKMSProvider) and provider.key_version_name.endswith("/4")
+
+        providers.get_kms_provider.cache_clear()
+        monkeypatch.setenv("KMS_PROVIDER", "gcp")
+        monkeypatch.delenv("GCP_PROJECT_ID", raising=False)
+        with pytest.raises(RuntimeError):
+            providers.get_kms_provider()
+
+        providers.get_kms_provider.cache_clear()
+        monkeypatch.setenv("KMS_PROVIDER", "vault")
+        with pytest.raises(RuntimeError):
+            providers.get_kms_provider()
+    finally:
+        providers.get_kms_provider.cache_clear()
@@ -0,0 +1,166 @@
+import datetime as dt
+import os
+from types import SimpleNamespace
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+from fastapi import HTTPException
+
+from backend import security
+from backend.certs.mtls import CertRejected, ClientCertVerifier, RevocationUnavailable
+
+NOW = dt.datetime.now(dt.timezone.utc)
+
+
+def _name(cn):
+    return x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn)])
+
+
+def _ca(cn="Test CA"):
+    key = ec.generate_private_key(ec.SECP256R1())
+    cert = (
+        x509.CertificateBuilder().subject_name(_name(cn)).issuer_name(_name(cn))
+        .public_key(key.public_key()).serial_number(1)
+        .not_valid_before(NOW - dt.timedelta(days=1)).not_valid_after(NOW + dt.timedelta(days=30))
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    return cert, key
+
+
+def _client(ca, serial, cn="alice", eku=ExtendedKeyUsageOID.CLIENT_AUTH, not_after=None):
+    ca_cert, ca_key = ca
+    key = ec.generate_private_key(ec.SECP256R1())
+    cert = (
+        x509.CertificateBuilder().subject_name(_name(cn)).issuer_name(ca_cert.subject)
+        .public_key(key.public_key()).serial_number(serial)
+        .not_valid_before(NOW - dt.timedelta(days=1))
+        .not_valid_after(not_after or NOW + dt.timedelta(days=7))
+        .add_extension(x509.ExtendedKeyUsage([eku]), critical=False)
+        .sign(ca_key, hashes.SHA256())
+    )
+    return cert.public_bytes(serialization.Encoding.DER)
+
+
+def _write_crl(path, ca, serials, next_update=None, pem=True):
+    ca_cert, ca_key = ca
+    builder = (
+        x509.CertificateRevocationListBuilder().issuer_name(ca_cert.subject)
+        .last_update(NOW - dt.timedelta(hours=1))
+        .next_update(next_update or NOW + dt.timedelta(days=1))
+    )
+    for serial in serials:
+        builder = builder.add_revoked_certificate(
+            x509.RevokedCertificateBuilder().serial_number(serial).revocation_date(NOW).build()
+        )
+    crl = builder.sign(ca_key, hashes.SHA256())
+    encoding = serialization.Encoding.PEM if pem else serialization.Encoding.DER
+    with open(path, "wb") as f:
+        f.write(crl.public_bytes(encoding))
+    # 同一秒內改兩次檔案時 mtime 可能一樣，強制讓重新載入看得到
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+
+@pytest.fixture
+def ca():
+    return _ca()
+
+
+@pytest.fixture
+def verifier(ca, tmp_path):
+    v = ClientCertVerifier(ca[0], crl_path=str(tmp_path / "ca.crl.pem"))
+    v.revocations.check_interval = 0
+    return v
+
+
+def test_valid_cert_is_cached(ca, verifier):
+    der = _client(ca, 10)
+    assert verifier.verify(der).serial_number == 10
+    assert verifier.verify(der).serial_number == 10
+    assert verifier.hits == 1 and verifier.misses == 1
+
+
+@pytest.mark.parametrize("make, reason", [
+    (lambda ca: b"junk", "Malformed client certificate"),
+    (lambda ca: _client(_ca("Other CA"), 10), "Client certificate not issued by trusted CA"),
+    (lambda ca: _client(ca, 10, not_after=NOW - dt.timedelta(minutes=1)), "Client certificate expired"),
+    (lambda ca: _client(ca, 10, eku=ExtendedKeyUsageOID.SERVER_AUTH),
+     "Certificate not valid for client authentication"),
+])
+def test_invalid_certs_rejected(ca, verifier, make, reason):
+    with pytest.raises(CertRejected) as e:
+        verifier.verify(make(ca))
+    assert e.value.reason == reason and not e.value.revoked
+
+
+def test_revocation_reloads_and_survives_missing_file(ca, verifier, tmp_path):
+    crl = str(tmp_path / "ca.crl.pem")
+    der = _client(ca, 11)
+    verifier.verify(der)  # 還沒有 CRL 檔
+
+    _write_crl(crl, ca, [11], pem=False)
+    with pytest.raises(CertRejected) as e:
+        verifier.verify(der)
+    assert e.value.revoked
+
+    os.unlink(crl)
+    with pytest.raises(CertRejected):
+        verifier.verify(der)
+    assert verifier.stats()["revoked_serials"] == 1
+
+
+def test_bad_reload_keeps_previous_set(ca, verifier, tmp_path):
+    crl = str(tmp_path / "ca.crl.pem")
+    _write_crl(crl, ca, [12])
+    with pytest.raises(CertRejected):
+        verifier.verify(_client(ca, 12))
+    _write_crl(crl, _ca(), [])  # 別的 CA 簽的
+    with pytest.raises(CertRejected):
+        verifier.verify(_client(ca, 12))
+    assert verifier.revocations.error and verifier.revocations.reloads == 1
+
+
+def test_unloadable_crl_fails_closed(ca, verifier, tmp_path):
+    crl = str(tmp_path / "ca.crl.pem")
+    with open(crl, "wb") as f:
+        f.write(b"-----BEGIN X509 CRL-----\ntruncated")
+    with pytest.raises(RevocationUnavailable):
+        verifier.verify(_client(ca, 13))
+    _write_crl(crl, ca, [])
+    assert verifier.verify(_client(ca, 13)).serial_number == 13
+
+
+def test_expired_crl_fails_closed(ca, verifier, tmp_path):
+    crl = str(tmp_path / "ca.crl.pem")
+    _write_crl(crl, ca, [], next_update=NOW - dt.timedelta(minutes=1))
+    with pytest.raises(RevocationUnavailable):
+        verifier.verify(_client(ca, 14))
+
+    # 檔案被刪掉也不會回到「沒有 CRL」
+    os.unlink(crl)
+    with pytest.raises(RevocationUnavailable):
+        verifier.verify(_client(ca, 14))
+
+
+def test_get_client_cert_maps_errors(monkeypatch, ca, verifier, tmp_path):
+    monkeypatch.setattr(security, "get_verifier", lambda: verifier)
+
+    def request(der):
+        ssl = SimpleNamespace(getpeercert=lambda binary_form: der)
+        return SimpleNamespace(scope={"ssl_object": ssl})
+
+    def status(der):
+        with pytest.raises(HTTPException) as e:
+            security.get_client_cert(request(der))
+        return e.value.status_code
+
+    assert status(b"junk") == 401
+    assert security.common_name(security.get_client_cert(request(_client(ca, 15)))) == "alice"
+    _write_crl(str(tmp_path / "ca.crl.pem"), ca, [15])
+    assert status(_client(ca, 15)) == 403
+    _write_crl(str(tmp_path / "ca.crl.pem"), ca, [], next_update=NOW - dt.timedelta(seconds=1))
+    assert status(_client(ca, 16)) == 503
@@ -0,0 +1,96 @@
+import hashlib
+import threading
+
+import pytest
+
+from passwords import HasherBusy, PasswordHasher, ScryptScheme
+
+
+@pytest.fixture
+def hasher():
+    return PasswordHasher(scheme=ScryptScheme(ln=10), workers=2)
+
+
+def test_hash_and_verify(hasher):
+    encoded = hasher.hash("s3cret")
+    assert encoded.startswith("$scrypt$ln=10,r=8,p=1$")
+    assert hasher.hash("s3cret") != encoded  # 每次都有新的鹽
+    assert hasher.verify("s3cret", encoded) == (True, False)
+    assert hasher.verify("wrong", encoded) == (False, False)
+
+
+def test_stale_parameters_and_legacy_hashes_need_rehash(hasher):
+    old = PasswordHasher(scheme=ScryptScheme(ln=9), workers=1).hash("pw")
+    assert hasher.verify("pw", old) == (True, True)
+    legacy = hashlib.sha256(b"pw").hexdigest()
+    assert hasher.verify("pw", legacy) == (True, True)
+    assert hasher.verify("nope", legacy)[0] is False
+
+
+@pytest.mark.parametrize("encoded", [None, "", "plaintext", "$scrypt$ln=10$broken"])
+def test_unknown_or_missing_hash_fails(hasher, encoded):
+    assert hasher.verify("pw", encoded) == (False, False)
+
+
+def test_admission_limit_rejects_instead_of_queueing():
+    hasher = PasswordHasher(scheme=ScryptScheme(ln=10), workers=1, max_pending=1, admit_timeout=0.01)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+
+    worker = threading.Thread(target=hasher._submit, args=(slow,))
+    worker.start()
+    started.wait(5)
+    with pytest.raises(HasherBusy):
+        hasher.hash("pw")
+    assert hasher.rejected == 1
+    release.set()
+    worker.join()
+    assert hasher.verify("pw", hasher.hash("pw"))[0]
+
+
+@pytest.fixture
+def web():
+    import app as webapp
+    webapp.app.config["TESTING"] = True
+    with webapp.app.test_client() as client:
+        yield webapp, client
+
+
+def _login(client, user, pwd):
+    return client.post("/", data={"username": user, "password": pwd})
+
+
+def test_login_rehash_busy_still_logs_in(web, monkeypatch):
+    webapp, client = web
+    legacy = hashlib.sha256(b"pw").hexdigest()
+    assert webapp.users.create_user("legacy-busy", legacy)
+
+    def busy(password):
+        raise HasherBusy()
+
+    monkeypatch.setattr(webapp.hasher, "hash", busy)
+    resp = _login(client, "legacy-busy", "pw")
+    assert resp.status_code == 302 and resp.headers["Location"].endswith("/verify")
+    assert webapp.users.get_password_hash("legacy-busy") == legacy
+
+
+def test_login_upgrades_legacy_hash(web):
+    webapp, client = web
+    assert webapp.users.create_user("legacy-ok", hashlib.sha256(b"pw").hexdigest())
+    assert _login(client, "legacy-ok", "pw").status_code == 302
+    assert webapp.users.get_password_hash("legacy-ok").startswith("$scrypt$")
+    assert _login(client, "legacy-ok", "wrong").status_code == 200
+
+
+def test_login_verify_busy_is_503(web, monkeypatch):
+    webapp, client = web
+
+    def busy(password, encoded):
+        raise HasherBusy()
+
+    monkeypatch.setattr(webapp.hasher, "verify", busy)
+    assert _login(client, "anyone", "pw").status_code == 503
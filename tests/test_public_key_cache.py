@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.kms.providers import KMSUnavailable
+from backend.kms.public_key_cache import PublicKeyCache
+from backend.routes import kms
+from conftest import run
+
+
+class FakeKMS:
+    def __init__(self):
+        self.version = "v1"
+        self.pems = {"v1": "PEM-1", "v2": "PEM-2"}
+        self.calls = []
+        self.down = False
+
+    async def fetch(self, key_version):
+        self.calls.append(key_version)
+        await asyncio.sleep(0.01)
+        if self.down:
+            raise KMSUnavailable("down")
+        return self.pems[key_version]
+
+
+def _cache(fake, refresh=300):
+    return PublicKeyCache(fake.fetch, lambda: fake.version, refresh=refresh)
+
+
+def test_current_version_is_fetched_once_and_coalesced():
+    fake = FakeKMS()
+    cache = _cache(fake)
+
+    async def scenario():
+        entries = await asyncio.gather(*(cache.get() for _ in range(10)))
+        return entries + [await cache.get()]
+
+    entries = run(scenario())
+    assert fake.calls == ["v1"] and {e.pem for e in entries} == {"PEM-1"}
+    assert cache.stats() == {"versions": 1, "refresh": 300, "hits": 1, "fetches": 1}
+
+
+def test_version_switch_and_etag():
+    fake = FakeKMS()
+    cache = _cache(fake)
+    first = run(cache.get())
+    fake.version = "v2"
+    second = run(cache.get())
+    assert second.key_version == "v2" and second.etag != first.etag
+    assert run(cache.get("v1")) is first  # 舊版本仍在快取裡
+
+    fake.pems["v1"] = "PEM-1-rotated"
+    refreshed = run(_cache(fake).get("v1"))
+    assert refreshed.etag != first.etag  # 同一個版本換了 key material 也會換 ETag
+
+
+def test_refresh_and_stale_fallback():
+    fake = FakeKMS()
+    cache = _cache(fake, refresh=0)
+    entry = run(cache.get())
+    run(cache.get())
+    assert fake.calls == ["v1", "v1"]
+
+    fake.down = True
+    assert run(cache.get()).pem == entry.pem  # KMS 連不上時沿用舊的
+    fake.version = "v2"
+    with pytest.raises(KMSUnavailable):
+        run(cache.get())  # 從來沒拿到過的版本只能失敗
+
+
+def test_failed_fetch_is_not_cached():
+    fake = FakeKMS()
+    fake.down = True
+    cache = _cache(fake)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get() for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(r, KMSUnavailable) for r in run(scenario()))
+    assert fake.calls == ["v1"]
+    fake.down = False
+    assert run(cache.get()).pem == "PEM-1"
+
+
+@pytest.fixture
+def kms_client(monkeypatch):
+    fake = FakeKMS()
+    monkeypatch.setattr(kms, "public_key_cache", _cache(fake))
+    app = FastAPI()
+    app.include_router(kms.router, prefix="/kms")
+    with TestClient(app) as client:
+        yield client, fake
+
+
+def test_public_key_route_revalidates_with_etag(kms_client):
+    client, fake = kms_client
+    resp = client.get("/kms/public-key")
+    assert resp.status_code == 200 and resp.json() == {"pem": "PEM-1", "key_version": "v1"}
+    etag = resp.headers["etag"]
+    assert resp.headers["x-key-version"] == "v1" and resp.headers["cache-control"] == "public, max-age=300"
+
+    cached = client.get("/kms/public-key", headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b"" and cached.headers["etag"] == etag
+
+    fake.version = "v2"
+    rotated = client.get("/kms/public-key", headers={"If-None-Match": etag})
+    assert rotated.status_code == 200 and rotated.json()["pem"] == "PEM-2"
+
+
+def test_public_key_route_reports_kms_failure(kms_client):
+    client, fake = kms_client
+    fake.down = True
+    assert client.get("/kms/public-key").status_code == 500
@@ -0,0 +1,78 @@
+import asyncio
+import gc
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from backend import qr_cache as qr
+from backend.routes import totp
+from conftest import run
+
+URI = "otpauth://totp/My%20Secure%20App:alice?secret=JBSWY3DPEHPK3PXP&issuer=My%20Secure%20App"
+
+
+@pytest.fixture
+def cache():
+    c = qr.QRCache(max_bytes=1 << 20)
+    pool = ThreadPoolExecutor(max_workers=2)
+    c._executor = lambda: pool
+    yield c
+    pool.shutdown()
+
+
+def test_concurrent_requests_render_once(cache):
+    async def many():
+        return await asyncio.gather(*(cache.get(URI) for _ in range(5)))
+
+    results = run(many())
+    assert len({digest for digest, _ in results}) == 1
+    assert results[0][1].startswith(b"\x89PNG") and cache.renders == 1
+    assert run(cache.get(URI))[0] == qr.qr_digest(URI, "png") and cache.hits == 1
+
+
+def test_svg_and_png_cached_separately(cache):
+    png = run(cache.get(URI, "png"))
+    svg = run(cache.get(URI, "svg"))
+    assert png[0] != svg[0] and b"<svg" in svg[1] and cache.renders == 2
+
+
+def test_lru_is_bounded_by_bytes(cache):
+    size = len(run(cache.get(URI + "0"))[1])
+    cache.max_bytes = size * 2 + size // 2
+    for i in range(1, 4):
+        run(cache.get(URI + str(i)))
+    assert cache.stats()["entries"] == 2 and cache.stats()["bytes"] <= cache.max_bytes
+    renders = cache.renders
+    run(cache.get(URI + "0"))  # 最舊的已被淘汰
+    assert cache.renders == renders + 1
+
+
+def test_warm_swallows_render_errors(cache, monkeypatch):
+    monkeypatch.setattr(qr, "render_qr", lambda uri, fmt: 1 / 0)
+    run(cache.warm(URI))
+    assert cache.stats()["entries"] == 0
+
+
+def test_register_keeps_warm_task_until_done(monkeypatch):
+    started, finished = [], []
+
+    async def warm(uri):
+        started.append(uri)
+        await asyncio.sleep(0.01)
+        finished.append(uri)
+
+    monkeypatch.setattr(totp.qr_cache, "warm", warm)
+    monkeypatch.setattr(totp, "log_event", lambda **kw: None)
+    request = SimpleNamespace(client=SimpleNamespace(host="127.0.0.1"), headers={})
+
+    async def register():
+        out = await totp.totp_register(totp.RegisterIn(user_id="qr-user"), request)
+        assert len(totp._background_tasks) == 1
+        gc.collect()  # 沒有別的參照時 task 也不會被回收
+        await asyncio.sleep(0.05)
+        return out
+
+    out = run(register())
+    assert started == finished == [out["otpauth_uri"]]
+    assert totp._background_tasks == set()
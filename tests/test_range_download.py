@@ -0,0 +1,110 @@
+import os
+
+import pytest
+from fastapi import HTTPException
+
+from backend.routes.files import _parse_range
+from conftest import upload
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("bytes=0-99", (0, 100)),
+    ("bytes=100-", (100, 1000)),
+    ("bytes=-100", (900, 1000)),
+    ("bytes=-5000", (0, 1000)),
+    ("bytes=990-5000", (990, 1000)),
+    ("bytes=999-999", (999, 1000)),
+    ("bytes=5-4", None),          # 反向的範圍忽略，回整個檔案
+    ("bytes=0-1,5-6", None),      # 不支援多段
+    ("bytes=abc-", None),
+    ("bytes=-0", None),
+    ("items=0-1", None),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=2000-3000"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(HTTPException) as e:
+        _parse_range(header, 1000)
+    assert e.value.status_code == 416 and e.value.headers["Content-Range"] == "bytes */1000"
+
+
+@pytest.fixture
+def stored(files_client):
+    plaintext = os.urandom(10 * 1024 + 123)
+    return plaintext, upload(files_client, plaintext, frame_size=1024)
+
+
+@pytest.mark.parametrize("start, end", [
+    (0, 0), (0, 1023), (1023, 1024), (1000, 5000), (5120, 5120), (10 * 1024, 10 * 1024 + 122),
+])
+def test_ranges_decrypt_only_what_was_asked(files_client, stored, start, end):
+    plaintext, file_id = stored
+    resp = files_client.get(f"/files/download/{file_id}", headers={"Range": f"bytes={start}-{end}"})
+    assert resp.status_code == 206
+    assert resp.content == plaintext[start:end + 1]
+    assert resp.headers["content-range"] == f"bytes {start}-{end}/{len(plaintext)}"
+    assert resp.headers["content-length"] == str(end - start + 1)
+
+
+def test_suffix_range_and_headers(files_client, stored):
+    plaintext, file_id = stored
+    resp = files_client.get(f"/files/download/{file_id}", headers={"Range": "bytes=-10"})
+    assert resp.status_code == 206 and resp.content == plaintext[-10:]
+    assert resp.headers["accept-ranges"] == "bytes" and resp.headers["etag"] == f'"{file_id}"'
+
+
+def test_if_range_mismatch_returns_full_body(files_client, stored):
+    plaintext, file_id = stored
+    resp = files_client.get(
+        f"/files/download/{file_id}", headers={"Range": "bytes=0-9", "If-Range": '"other"'}
+    )
+    assert resp.status_code == 200 and resp.content == plaintext
+    resp = files_client.get(
+        f"/files/download/{file_id}", headers={"Range": "bytes=0-9", "If-Range": f'"{file_id}"'}
+    )
+    assert resp.status_code == 206 and resp.content == plaintext[:10]
+
+
+def test_range_past_end_is_416(files_client, stored):
+    plaintext, file_id = stored
+    resp = files_client.get(f"/files/download/{file_id}", headers={"Range": f"bytes={len(plaintext)}-"})
+    assert resp.status_code == 416
+    assert resp.headers["content-range"] == f"bytes */{len(plaintext)}"
+
+
+def test_resume_by_concatenating_ranges(files_client, stored):
+    plaintext, file_id = stored
+    got, pos = b"", 0
+    while pos < len(plaintext):
+        resp = files_client.get(f"/files/download/{file_id}", headers={"Range": f"bytes={pos}-{pos + 2999}"})
+        got += resp.content
+        pos += len(resp.content)
+    assert got == plaintext
+
+
+def test_empty_file(files_client):
+    file_id = upload(files_client, b"")
+    resp = files_client.get(f"/files/download/{file_id}")
+    assert resp.status_code == 200 and resp.content == b"" and resp.headers["content-length"] == "0"
+    assert files_client.get(f"/files/download/{file_id}", headers={"Range": "bytes=0-"}).status_code == 416
+
+
+def test_small_range_reads_one_frame(files_client, storage, stored, monkeypatch):
+    plaintext, file_id = stored
+    reads = []
+    real = storage.get_range
+
+    async def spy(name, start=0, end=None, generation=None):
+        reads.append((start, end))
+        return await real(name, start, end, generation)
+
+    monkeypatch.setattr(storage, "get_range", spy)
+    resp = files_client.get(f"/files/download/{file_id}", headers={"Range": "bytes=5000-5010"})
+    assert resp.content == plaintext[5000:5011]
+    frame_reads = [r for r in reads if r[0] > 0]  # 第一個是 header 的 prefetch
+    assert len(frame_reads) == 1 and frame_reads[0][1] - frame_reads[0][0] == 1024 + 16
@@ -0,0 +1,110 @@
+import os
+import time
+
+from backend.routes import uploads
+from conftest import encrypt_for_upload, run
+
+
+def _init(client, ciphertext_meta, filename="big.bin"):
+    meta = {k: v for k, v in ciphertext_meta.items() if k in ("iv", "encrypted_dek", "key_version")}
+    resp = client.post("/files/upload/init", json={**meta, "filename": filename, "user_id": "alice"})
+    assert resp.status_code == 201, resp.text
+    return resp.json()["session_id"]
+
+
+def _parts(data, n):
+    size = -(-len(data) // n)
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+async def _names(storage, prefix):
+    return [obj.name async for obj in storage.list(prefix=prefix)]
+
+
+def test_out_of_order_parts_with_retry_and_resume(files_client, storage, catalog):
+    plaintext = os.urandom(20_000)
+    ciphertext, meta = encrypt_for_upload(plaintext, frame_size=1024)
+    sid = _init(files_client, meta)
+    parts = _parts(ciphertext, 4)
+
+    for n in (2, 0, 3):
+        resp = files_client.put(f"/files/upload/{sid}/{n}", content=parts[n])
+        assert resp.json() == {"part": n, "size": len(parts[n])}
+    # 重送的 part 直接覆寫
+    files_client.put(f"/files/upload/{sid}/0", content=b"garbage")
+    files_client.put(f"/files/upload/{sid}/0", content=parts[0])
+
+    status = files_client.get(f"/files/upload/{sid}").json()
+    assert [p["part"] for p in status["parts"]] == [0, 2, 3]
+
+    missing = files_client.post(f"/files/upload/{sid}/complete", json={"parts": 4})
+    assert missing.status_code == 409 and missing.json()["detail"] == {"missing_parts": [1]}
+
+    files_client.put(f"/files/upload/{sid}/1", content=parts[1])
+    done = files_client.post(f"/files/upload/{sid}/complete", json={"parts": 4})
+    assert done.status_code == 201 and done.json()["size"] == len(ciphertext)
+    file_id = done.json()["file_id"]
+
+    assert files_client.get(f"/files/download/{file_id}").content == plaintext
+    assert run(catalog.get(file_id)).filename == "big.bin"
+    assert files_client.get(f"/files/upload/{sid}").status_code == 404
+    assert run(_names(storage, "uploads/")) == []
+
+
+def test_complete_without_count_requires_contiguous_parts(files_client):
+    _, meta = encrypt_for_upload(b"x")
+    sid = _init(files_client, meta)
+    assert files_client.post(f"/files/upload/{sid}/complete").status_code == 409  # 一個 part 都沒有
+    files_client.put(f"/files/upload/{sid}/1", content=b"x")
+    resp = files_client.post(f"/files/upload/{sid}/complete")
+    assert resp.status_code == 409 and resp.json()["detail"] == {"missing_parts": [0]}
+
+
+def test_part_size_limit(files_client, monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_PART_SIZE", 10)
+    _, meta = encrypt_for_upload(b"x")
+    sid = _init(files_client, meta)
+    assert files_client.put(f"/files/upload/{sid}/0", content=b"x" * 11).status_code == 413
+    assert files_client.get(f"/files/upload/{sid}").json()["parts"] == []
+
+
+def test_invalid_session_ids_and_abort(files_client, storage):
+    assert files_client.get("/files/upload/" + "0" * 32).status_code == 404
+    assert files_client.get("/files/upload/not-a-session").status_code == 422
+    assert files_client.put("/files/upload/" + "0" * 32 + "/0", content=b"x").status_code == 404
+    assert files_client.post("/files/upload/init", json={"filename": "a"}).status_code == 422
+
+    _, meta = encrypt_for_upload(b"x")
+    sid = _init(files_client, meta)
+    files_client.put(f"/files/upload/{sid}/0", content=b"x")
+    assert files_client.delete(f"/files/upload/{sid}").json() == {"aborted": sid}
+    assert run(_names(storage, f"uploads/{sid}/")) == []
+
+
+def test_gc_removes_only_idle_sessions(files_client, storage, monkeypatch):
+    _, meta = encrypt_for_upload(b"x")
+    old, fresh = _init(files_client, meta), _init(files_client, meta)
+    files_client.put(f"/files/upload/{old}/0", content=b"x")
+
+    real_time = time.time()
+    monkeypatch.setattr(time, "time", lambda: real_time + 100)  # storage 的 updated 也跟著走
+    files_client.put(f"/files/upload/{fresh}/0", content=b"x")
+
+    assert run(uploads.gc_upload_sessions(storage, max_age=50)) == 1
+    assert files_client.get(f"/files/upload/{old}").status_code == 404
+    assert [p["part"] for p in files_client.get(f"/files/upload/{fresh}").json()["parts"]] == [0]
+    assert run(uploads.gc_upload_sessions(storage, max_age=50)) == 0
+
+
+def test_init_runs_gc_after_the_response(files_client, storage, monkeypatch):
+    seen = []
+
+    async def fake_gc(storage):
+        seen.append(await _names(storage, "uploads/"))  # handler 已經把 session 寫完才輪到 GC
+
+    monkeypatch.setattr(uploads, "gc_upload_sessions", fake_gc)
+    monkeypatch.setattr(uploads, "_last_gc", 0.0)
+    _, meta = encrypt_for_upload(b"x")
+    sid = _init(files_client, meta)
+    _init(files_client, meta)  # 還在 GC_INTERVAL 內，不會再排一次
+    assert seen == [[f"uploads/{sid}/session.json"]]
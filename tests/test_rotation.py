@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+from backend.kms.rotation import RewrapJob, _Watermark, load_checkpoint
+from conftest import run
+
+
+def _storage_with(storage, n):
+    for i in range(n):
+        run(storage.put(f"obj-{i:02d}", b"x", metadata={"v": "1"}))
+    return storage
+
+
+def _job(storage, process, checkpoint, **kw):
+    return RewrapJob(
+        storage, "v2",
+        needs_work=lambda obj: obj.metadata.get("v") != "2",
+        process=process,
+        concurrency=kw.pop("concurrency", 4),
+        rate=1000,
+        checkpoint_path=checkpoint,
+        report=lambda p: None,
+        **kw,
+    )
+
+
+def test_watermark_stops_at_first_failure():
+    wm = _Watermark("")
+    a, b, c, d = (wm.add(n) for n in "abcd")
+    wm.done(b)
+    assert wm.after == ""
+    wm.done(a)
+    assert wm.after == "b"
+    wm.done(c, ok=False)
+    wm.done(d)
+    assert wm.after == "b"
+    wm.done(wm.add("e"))
+    assert wm.after == "b"
+
+
+def test_failed_objects_are_retried_on_resume(storage, tmp_path):
+    _storage_with(storage, 8)
+    checkpoint = str(tmp_path / "rewrap.json")
+    broken = {"obj-03", "obj-06"}
+
+    async def process(obj):
+        if obj.name in broken:
+            raise RuntimeError("key version 2 missing")
+        await storage.put(obj.name, b"x", metadata={"v": "2"})
+        return True
+
+    first = run(_job(storage, process, checkpoint).run())
+    assert first.failed == 2 and first.processed == 6
+    assert first.after < "obj-03"
+    assert json.load(open(checkpoint))["after"] == first.after
+
+    broken.clear()
+    second = run(_job(storage, process, checkpoint).run())
+    assert second.failed == 0 and second.failures == []
+    assert second.processed == 8  # 累計：上一次的 6 個加上重試成功的 2 個
+    assert all(run(storage.stat(f"obj-{i:02d}")).metadata["v"] == "2" for i in range(8))
+
+
+def test_checkpoint_skips_done_prefix_and_ignores_other_target(storage, tmp_path):
+    _storage_with(storage, 5)
+    checkpoint = str(tmp_path / "rewrap.json")
+    seen = []
+
+    async def process(obj):
+        seen.append(obj.name)
+        return True
+
+    with open(checkpoint, "w") as f:
+        json.dump({"target": "v2", "after": "obj-02", "scanned": 3, "processed": 3}, f)
+    progress = run(_job(storage, process, checkpoint).run())
+    assert sorted(seen) == ["obj-03", "obj-04"]
+    assert progress.processed == 5 and progress.after == "obj-04"
+
+    assert load_checkpoint(checkpoint, "v3").after == ""
+    assert load_checkpoint(str(tmp_path / "missing.json"), "v2").after == ""
+
+
+def test_concurrency_is_bounded(storage, tmp_path):
+    _storage_with(storage, 20)
+    running = peak = 0
+
+    async def process(obj):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return False
+
+    progress = run(_job(storage, process, None, concurrency=3).run())
+    assert peak <= 3 and progress.skipped == 20 and progress.after == "obj-19"
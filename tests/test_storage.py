@@ -0,0 +1,211 @@
+import pytest
+from google.api_core import exceptions as gcp_exceptions
+
+from backend.storage.base import ObjectChanged, ObjectNotFound, StorageUnavailable
+from backend.storage.gcs import GCSStorage
+from backend.storage.local import LocalStorage
+from backend.storage.memory import MemoryStorage
+from conftest import run
+
+
+@pytest.fixture(params=["memory", "local"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStorage()
+    return LocalStorage(str(tmp_path / "objects"))
+
+
+async def _chunks(*parts, fail=False):
+    for part in parts:
+        yield part
+    if fail:
+        raise ConnectionError("client went away")
+
+
+async def _collect_list(it):
+    return [chunk async for chunk in it]
+
+
+def test_put_get_stat(backend):
+    stat = run(backend.put("a/b.bin", _chunks(b"hello ", b"world"), metadata={"k": "v"}))
+    assert stat.size == 11 and stat.metadata == {"k": "v"}
+    assert run(backend.get("a/b.bin")) == b"hello world"
+    assert run(backend.get_range("a/b.bin", 6)) == b"world"
+    assert run(backend.get_range("a/b.bin", 2, 5)) == b"llo"
+    assert run(backend.get_range("a/b.bin", 20, 30)) == b""
+    assert run(backend.stat("a/b.bin")).metadata == {"k": "v"}
+
+
+def test_iter_range(backend):
+    run(backend.put("x", bytes(range(256)) * 10))
+    chunks = run(_collect_list(backend.iter_range("x", 100, 1000, chunk_size=256)))
+    assert [len(c) for c in chunks] == [256, 256, 256, 132]
+    assert b"".join(chunks) == (bytes(range(256)) * 10)[100:1000]
+
+
+def test_list_sorted_with_prefix_and_metadata(backend):
+    for name in ("b", "a", "uploads/s/part-000001", "uploads/s/part-000000"):
+        run(backend.put(name, b"x", metadata={"name": name}))
+    names = [o.name for o in run(_collect_list(backend.list()))]
+    assert names == sorted(names)
+    parts = run(_collect_list(backend.list(prefix="uploads/s/")))
+    assert [o.name for o in parts] == ["uploads/s/part-000000", "uploads/s/part-000001"]
+    assert parts[0].metadata == {"name": "uploads/s/part-000000"}
+
+
+def test_missing_objects(backend):
+    with pytest.raises(ObjectNotFound):
+        run(backend.get("nope"))
+    with pytest.raises(ObjectNotFound):
+        run(backend.stat("nope"))
+    with pytest.raises(ObjectNotFound):
+        run(backend.delete("nope"))
+
+
+def test_failed_put_keeps_previous_object(backend):
+    run(backend.put("f", b"original", metadata={"v": "1"}))
+    with pytest.raises(ConnectionError):
+        run(backend.put("f", _chunks(b"trunc", fail=True), metadata={"v": "2"}))
+    assert run(backend.get("f")) == b"original"
+    assert run(backend.stat("f")).metadata == {"v": "1"}
+
+
+def test_generation_pins_reads(backend):
+    first = run(backend.put("g", b"version one"))
+    assert run(backend.get_range("g", 0, 7, generation=first.generation)) == b"version"
+    second = run(backend.put("g", b"version two"))
+    assert second.generation != first.generation
+    with pytest.raises(ObjectChanged):
+        run(backend.get_range("g", 0, 7, generation=first.generation))
+    with pytest.raises(ObjectChanged):
+        run(_collect_list(backend.iter_range("g", generation=first.generation)))
+    assert run(backend.get_range("g", 8, generation=second.generation)) == b"two"
+
+
+def test_conditional_put(backend):
+    with pytest.raises(ObjectChanged):
+        run(backend.put("c", b"x", if_generation_match="1"))  # 不存在的物件
+    first = run(backend.put("c", b"one", if_generation_match="0"))
+    with pytest.raises(ObjectChanged):
+        run(backend.put("c", b"again", if_generation_match="0"))
+    second = run(backend.put("c", b"two", metadata={"v": "2"}, if_generation_match=first.generation))
+    with pytest.raises(ObjectChanged):
+        run(backend.put("c", b"stale", metadata={"v": "stale"}, if_generation_match=first.generation))
+    assert run(backend.get("c")) == b"two" and run(backend.stat("c")).metadata == {"v": "2"}
+
+    run(backend.delete("c"))
+    with pytest.raises(ObjectChanged):
+        run(backend.put("c", b"revived", if_generation_match=second.generation))
+    with pytest.raises(ObjectNotFound):
+        run(backend.stat("c"))
+
+
+def test_local_rejects_escaping_names(tmp_path):
+    storage = LocalStorage(str(tmp_path / "objects"))
+    for name in ("../outside", ".meta/x.json"):
+        with pytest.raises(ValueError):
+            run(storage.put(name, b"x"))
+
+
+# --- GCS：只測 put 對 resumable session 的處理與 get_range 的錯誤對應，client 用假的 ---
+class _FakeWriter:
+    def __init__(self):
+        self.written = []
+        self.closed = False
+        self.terminated = False
+
+    def write(self, b):
+        self.written.append(b)
+
+    def close(self):
+        self.closed = True
+
+    def terminate(self):
+        self.terminated = True
+
+
+class _FakeBlob:
+    def __init__(self, name, bucket):
+        self.name, self.bucket = name, bucket
+        self.metadata = None
+        self.size = 0
+        self.updated = None
+        self.generation = 1
+
+    def download_as_bytes(self, start=None, end=None, if_generation_match=None):
+        raise self.bucket.download_error
+
+    def upload_from_string(self, data):
+        # 跟 SDK 一樣把回應的 object resource 寫回 blob
+        self.size, self.generation = len(data), 7
+
+    def open(self, mode, chunk_size=None):
+        assert mode == "wb"
+        self.bucket.writer = _FakeWriter()
+        return self.bucket.writer
+
+
+class _FakeBucket:
+    def __init__(self):
+        self.writer = None
+        self.download_error = None
+        self.stats = 0
+
+    def blob(self, name):
+        return _FakeBlob(name, self)
+
+    def get_blob(self, name):
+        self.stats += 1
+        return _FakeBlob(name, self)
+
+
+class _FakeClient:
+    def __init__(self):
+        self.fake_bucket = _FakeBucket()
+
+    def bucket(self, name):
+        return self.fake_bucket
+
+
+def test_gcs_put_finalizes_only_on_success():
+    client = _FakeClient()
+    storage = GCSStorage("bucket", client=client)
+    run(storage.put("ok", _chunks(b"a", b"b")))
+    writer = client.fake_bucket.writer
+    assert writer.written == [b"a", b"b"] and writer.closed and not writer.terminated
+
+
+def test_gcs_put_returns_stat_without_extra_round_trip():
+    client = _FakeClient()
+    storage = GCSStorage("bucket", client=client)
+    stat = run(storage.put("small", b"abc", metadata={"k": "v"}))
+    assert (stat.size, stat.generation, stat.metadata) == (3, "7", {"k": "v"})
+    stat = run(storage.put("big", _chunks(b"ab", b"cde"), metadata={"k": "v"}))
+    assert (stat.size, stat.metadata) == (5, {"k": "v"})
+    assert client.fake_bucket.stats == 0
+
+
+def test_gcs_put_cancels_session_when_body_fails():
+    client = _FakeClient()
+    storage = GCSStorage("bucket", client=client)
+    with pytest.raises(ConnectionError):
+        run(storage.put("bad", _chunks(b"a", fail=True)))
+    writer = client.fake_bucket.writer
+    assert writer.terminated and not writer.closed
+
+
+@pytest.mark.parametrize("error, expected", [
+    (gcp_exceptions.RequestRangeNotSatisfiable("past EOF"), b""),
+    (gcp_exceptions.NotFound("gone"), ObjectNotFound),
+    (gcp_exceptions.PreconditionFailed("overwritten"), ObjectChanged),
+    (gcp_exceptions.ServiceUnavailable("backend down"), StorageUnavailable),
+])
+def test_gcs_get_range_errors(error, expected):
+    client = _FakeClient()
+    client.fake_bucket.download_error = error
+    storage = GCSStorage("bucket", client=client)
+    if isinstance(expected, bytes):
+        assert run(storage.get_range("x", 100)) == expected
+    else:
+        with pytest.raises(expected):
+            run(storage.get_range("x", 100))
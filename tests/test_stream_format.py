@@ -0,0 +1,132 @@
+import base64
+import json
+import os
+import random
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from backend.encryption.aes import (
+    STREAM_HEADER_LEN, TAG_LEN, aes_decrypt_stream, aes_encrypt, aes_encrypt_stream, build_stream_header,
+    frame_ciphertext_range, frame_count_for, frame_nonce, parse_stream_header, stream_plaintext_size,
+)
+from conftest import upload
+
+FS = 64
+
+
+def _split(data, rng):
+    """把 bytes 切成隨機長度的 chunks（含空 chunk），模擬網路上收到的樣子。"""
+    out, i = [], 0
+    while i < len(data):
+        n = rng.randint(0, 3 * FS)
+        out.append(data[i:i + n])
+        i += n
+    return out
+
+
+def _encrypt(plaintext, key=b"k" * 32, iv=b"i" * 12):
+    return b"".join(aes_encrypt_stream(key, iv, [plaintext], len(plaintext), FS))
+
+
+@pytest.mark.parametrize("size", [0, 1, FS - 1, FS, FS + 1, 3 * FS, 5 * FS + 7])
+def test_round_trip_with_any_chunking(size):
+    rng = random.Random(size)
+    key, iv, plaintext = os.urandom(32), os.urandom(12), os.urandom(size)
+    ciphertext = b"".join(aes_encrypt_stream(key, iv, _split(plaintext, rng), size, FS))
+    frames = frame_count_for(size, FS)
+    assert len(ciphertext) == STREAM_HEADER_LEN + size + frames * TAG_LEN
+    assert parse_stream_header(ciphertext) == (FS, frames)
+    assert stream_plaintext_size(len(ciphertext), FS, frames) == size
+    assert b"".join(aes_decrypt_stream(key, iv, _split(ciphertext, rng) or [b""])) == plaintext
+
+
+def test_frame_ranges_cover_ciphertext():
+    ciphertext = _encrypt(os.urandom(3 * FS + 10))
+    _, count = parse_stream_header(ciphertext)
+    ranges = [frame_ciphertext_range(i, FS, len(ciphertext)) for i in range(count)]
+    assert ranges[0][0] == STREAM_HEADER_LEN and ranges[-1][1] == len(ciphertext)
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert ranges[-1][1] - ranges[-1][0] == 10 + TAG_LEN
+
+
+def test_nonces_are_distinct_per_frame():
+    iv = os.urandom(12)
+    assert len({frame_nonce(iv, i) for i in range(1000)}) == 1000
+    with pytest.raises(ValueError):
+        frame_nonce(b"short", 0)
+
+
+def test_swapped_frames_fail_authentication():
+    plaintext = os.urandom(2 * FS)
+    ct = _encrypt(plaintext)
+    a, b = (ct[slice(*frame_ciphertext_range(i, FS, len(ct)))] for i in range(2))
+    with pytest.raises(InvalidTag):
+        list(aes_decrypt_stream(b"k" * 32, b"i" * 12, [ct[:STREAM_HEADER_LEN] + b + a]))
+
+
+@pytest.mark.parametrize("cut", [1, TAG_LEN, FS + TAG_LEN])
+def test_truncation_is_detected(cut):
+    ct = _encrypt(os.urandom(3 * FS))
+    with pytest.raises((ValueError, InvalidTag)):
+        list(aes_decrypt_stream(b"k" * 32, b"i" * 12, [ct[:-cut]]))
+
+
+def test_header_tampering_is_detected():
+    ct = bytearray(_encrypt(os.urandom(2 * FS)))
+    ct[:STREAM_HEADER_LEN] = build_stream_header(FS, 3)
+    with pytest.raises(InvalidTag):  # header 是每個 frame 的 AAD
+        list(aes_decrypt_stream(b"k" * 32, b"i" * 12, [bytes(ct)]))
+    with pytest.raises(ValueError):
+        stream_plaintext_size(len(ct), FS, 3)
+    with pytest.raises(ValueError):
+        parse_stream_header(b"XXXX" + bytes(ct[4:]))
+
+
+def test_wrong_total_size_rejected():
+    with pytest.raises(ValueError):
+        b"".join(aes_encrypt_stream(b"k" * 32, b"i" * 12, [b"abc"], 4, FS))
+
+
+def test_stream_upload_download(files_client):
+    plaintext = os.urandom(5000)
+    file_id = upload(files_client, plaintext, filename="report.pdf", frame_size=1024)
+    resp = files_client.get(f"/files/download/{file_id}")
+    assert resp.status_code == 200 and resp.content == plaintext
+    assert resp.headers["content-length"] == "5000"
+    assert "report.pdf" in resp.headers["content-disposition"]
+    assert base64.b64decode(resp.headers["x-encrypted-dek"])
+
+
+def test_legacy_single_shot_upload_download(files_client):
+    from backend.kms.envelope import rsa_wrap
+    from backend.routes.kms import public_key_cache
+    from conftest import run
+
+    entry = run(public_key_cache.get())
+    dek, plaintext = os.urandom(32), b"legacy body"
+    ciphertext, iv = aes_encrypt(dek, plaintext)
+    meta = {
+        "iv": iv.hex(),
+        "encrypted_dek": base64.b64encode(rsa_wrap(entry.pem, dek)).decode(),
+        "filename": "old.txt",
+    }
+    resp = files_client.post("/files/upload", files={"file": ("old.txt", ciphertext)},
+                             data={"metadata": json.dumps(meta)})
+    file_id = resp.json()["file_id"]
+    download = files_client.get(f"/files/download/{file_id}", headers={"Range": "bytes=0-3"})
+    assert download.status_code == 200 and download.content == plaintext  # 單段 GCM 不支援 Range
+    assert "accept-ranges" not in download.headers
+
+
+def test_upload_rejects_bad_metadata(files_client):
+    def post(metadata):
+        return files_client.post("/files/upload", files={"file": ("a", b"x")}, data={"metadata": metadata})
+
+    assert post("{not json").status_code == 400
+    assert post(json.dumps({"encrypted_dek": "AA=="})).status_code == 400
+    assert post(json.dumps({"iv": "00" * 12})).status_code == 400
+
+
+def test_download_unknown_file_is_404(files_client):
+    assert files_client.get("/files/download/" + "0" * 32).status_code == 404
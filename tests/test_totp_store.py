@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from backend import db
+from backend.keyfile import load_or_create
+
+
+def _race(path):
+    return load_or_create(path, lambda: os.urandom(32))
+
+
+def test_load_or_create_concurrent_processes_agree(tmp_path):
+    path = str(tmp_path / "kek.bin")
+    with multiprocessing.get_context("fork").Pool(8) as pool:
+        keys = pool.map(_race, [path] * 32)
+    assert len(set(keys)) == 1 and len(keys[0]) == 32
+    assert open(path, "rb").read() == keys[0]
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert [n for n in os.listdir(tmp_path) if n != "kek.bin"] == []
+
+
+def test_load_or_create_loser_reads_winner(tmp_path):
+    path = str(tmp_path / "kek.bin")
+
+    def generate():
+        # 產生 key 的同時別的行程先寫好了
+        with open(path, "wb") as f:
+            f.write(b"w" * 32)
+        return b"l" * 32
+
+    assert load_or_create(path, generate) == b"w" * 32
+    assert load_or_create(path, lambda: pytest.fail("should not generate")) == b"w" * 32
+
+
+@pytest.fixture
+def kek(monkeypatch):
+    monkeypatch.setenv("TOTP_KEK", "")
+    db._load_kek.cache_clear()
+    yield
+    db._load_kek.cache_clear()
+
+
+def test_kek_from_env_and_size_check(monkeypatch, kek):
+    monkeypatch.setenv("TOTP_KEK", "AAAA")
+    with pytest.raises(RuntimeError):
+        db._load_kek()
+
+
+def test_secret_sealed_with_user_as_aad(kek):
+    blob = db.seal_secret("alice", "JBSWY3DPEHPK3PXP")
+    assert b"JBSWY3DPEHPK3PXP" not in blob
+    assert db.open_secret("alice", blob) == "JBSWY3DPEHPK3PXP"
+    with pytest.raises(InvalidTag):
+        db.open_secret("mallory", blob)
+
+
+def test_sqlite_store(tmp_path, kek):
+    store = db.SqliteTotpStore(str(tmp_path / "totp.db"))
+    with pytest.raises(KeyError):
+        store.get_totp_entry("alice")
+    with pytest.raises(KeyError):
+        store.enable_totp("alice")
+    store.save_totp_secret("alice", "SECRET")
+    assert store.get_totp_entry("alice") == ("SECRET", False)
+    store.enable_totp("alice")
+    assert store.is_totp_enabled("alice") and not store.is_totp_enabled("bob")
+
+    assert store.record_totp_step("alice", 10)
+    assert not store.record_totp_step("alice", 10)
+    assert not store.record_totp_step("alice", 9)
+    assert store.record_totp_step("alice", 11)
+
+    # 另一個連線（另一個 worker）看到同樣的資料
+    other = db.SqliteTotpStore(str(tmp_path / "totp.db"))
+    assert other.get_totp_entry("alice") == ("SECRET", True)
+    assert not other.record_totp_step("alice", 11)
+
+
+def test_cached_store_invalidates_on_write(tmp_path, kek):
+    backend = db.SqliteTotpStore(str(tmp_path / "totp.db"))
+    store = db.CachedTotpStore(backend, ttl=60)
+    store.save_totp_secret("alice", "ONE")
+    assert store.get_totp_secret("alice") == "ONE"
+    backend.save_totp_secret("alice", "TWO")
+    assert store.get_totp_secret("alice") == "ONE"  # TTL 內讀快取
+    store.save_totp_secret("alice", "THREE")
+    assert store.get_totp_secret("alice") == "THREE"
+    assert store.record_totp_step("alice", 1) and not store.record_totp_step("alice", 1)
@@ -0,0 +1,114 @@
+import pyotp
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend import db
+from backend.ratelimit import SlidingWindowLimiter
+from backend.routes import totp
+from backend.totp_verifier import TotpReplay, TotpVerifier
+
+SECRET = "JBSWY3DPEHPK3PXP"
+NOW = 1_700_000_010.0
+
+
+def test_limiter_blocks_and_reports_retry_after():
+    limiter = SlidingWindowLimiter(3, 60)
+    start = 6000.0  # 視窗起點
+    assert [limiter.hit("k", start + i) for i in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.hit("k", start + 10) == pytest.approx(50)
+    assert limiter.hit("other", start + 10) == 0.0  # 各 key 分開算
+
+    # 下一個視窗開頭仍然帶著上一個視窗的權重
+    assert limiter.hit("k", start + 60) > 0
+    assert limiter.hit("k", start + 80) == 0.0
+    assert limiter.hit("k", start + 200) == 0.0  # 隔了好幾個視窗就歸零
+
+    limiter.reset("k")
+    assert len(limiter) == 1
+
+
+def test_limiter_evicts_oldest_key_and_rejects_bad_config():
+    limiter = SlidingWindowLimiter(1, 60, max_keys=2)
+    for key in "abc":
+        limiter.hit(key, 0)
+    assert len(limiter) == 2 and limiter.hit("a", 1) == 0.0
+    with pytest.raises(ValueError):
+        SlidingWindowLimiter(0, 60)
+
+
+def test_match_accepts_drift_and_matches_pyotp():
+    verifier = TotpVerifier(drift=1)
+    otp = pyotp.TOTP(SECRET)
+    step = int(NOW // 30)
+    assert verifier.match("u", SECRET, otp.at(NOW), NOW) == step
+    assert verifier.match("u", SECRET, otp.at(NOW - 30), NOW) == step - 1
+    assert verifier.match("u", SECRET, otp.at(NOW + 30), NOW) == step + 1
+    assert verifier.match("u", SECRET, otp.at(NOW - 60), NOW) is None
+    assert verifier.match("u", SECRET, otp.at(NOW), NOW + 90) is None
+
+
+def test_key_cache_follows_secret_changes():
+    verifier = TotpVerifier(max_keys=2)
+    other = pyotp.random_base32()
+    assert verifier.match("u", SECRET, pyotp.TOTP(SECRET).at(NOW), NOW) is not None
+    # 重新註冊換了 secret：舊 code 不能再用
+    assert verifier.match("u", other, pyotp.TOTP(SECRET).at(NOW), NOW) is None
+    assert verifier.match("u", other, pyotp.TOTP(other).at(NOW), NOW) is not None
+    verifier.match("v", SECRET, "000000", NOW)
+    verifier.match("w", SECRET, "000000", NOW)
+    assert list(verifier._keys) == ["v", "w"]
+
+
+def test_verify_rejects_replay_of_same_or_older_step(monkeypatch):
+    steps = {}
+
+    def record(user_id, step):
+        if step <= steps.get(user_id, -1):
+            return False
+        steps[user_id] = step
+        return True
+
+    monkeypatch.setattr(db, "get_totp_secret", lambda user_id: SECRET)
+    monkeypatch.setattr(db, "record_totp_step", record)
+    verifier = TotpVerifier()
+    otp = pyotp.TOTP(SECRET)
+
+    assert verifier.verify("u", otp.at(NOW), NOW)
+    with pytest.raises(TotpReplay):
+        verifier.verify("u", otp.at(NOW), NOW)
+    with pytest.raises(TotpReplay):
+        verifier.verify("u", otp.at(NOW - 30), NOW)
+    assert not verifier.verify("u", "000000" if otp.at(NOW) != "000000" else "111111", NOW)
+
+
+@pytest.fixture
+def totp_client(monkeypatch):
+    monkeypatch.setattr(totp, "user_limiter", SlidingWindowLimiter(3, 60))
+    monkeypatch.setattr(totp, "ip_limiter", SlidingWindowLimiter(100, 60))
+    app = FastAPI()
+    app.include_router(totp.router, prefix="/2fa/totp")
+    with TestClient(app) as client:
+        yield client
+
+
+def test_verify_route_replay_and_rate_limit(totp_client):
+    secret = totp_client.post("/2fa/totp/register", json={"user_id": "route-user"}).json()["secret"]
+    code = pyotp.TOTP(secret).now()
+
+    ok = totp_client.post("/2fa/totp/verify", json={"user_id": "route-user", "code": code})
+    assert ok.status_code == 200 and db.is_totp_enabled("route-user")
+    replay = totp_client.post("/2fa/totp/verify", json={"user_id": "route-user", "code": code})
+    assert replay.status_code == 401 and replay.json()["detail"] == "TOTP code already used"
+
+    wrong_code = "000000" if code != "000000" else "111111"
+    wrong = totp_client.post("/2fa/totp/verify", json={"user_id": "route-user", "code": wrong_code})
+    assert wrong.status_code == 401 and wrong.json()["detail"] == "Invalid TOTP code"
+    # 第四次嘗試超過每個 user 3 次的上限，連正確的 code 都不檢查
+    limited = totp_client.post("/2fa/totp/verify", json={"user_id": "route-user", "code": code})
+    assert limited.status_code == 429 and int(limited.headers["Retry-After"]) >= 1
+
+
+def test_verify_route_unknown_user(totp_client):
+    resp = totp_client.post("/2fa/totp/verify", json={"user_id": "nobody", "code": "123456"})
+    assert resp.status_code == 404
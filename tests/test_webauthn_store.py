@@ -0,0 +1,138 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+from fido2.cose import ES256
+from fido2.webauthn import Aaguid, AttestedCredentialData
+
+from backend import webauthn_store
+from backend.webauthn_store import (
+    CachedWebAuthnStore, MemoryChallengeStore, MemoryWebAuthnStore, SqliteWebAuthnStore,
+)
+
+
+def make_credential():
+    key = ec.generate_private_key(ec.SECP256R1())
+    return AttestedCredentialData.create(Aaguid.NONE, os.urandom(16), ES256.from_cryptography_key(key.public_key()))
+
+
+@pytest.fixture(params=["memory", "sqlite", "cached"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryWebAuthnStore()
+    sqlite = SqliteWebAuthnStore(str(tmp_path / "webauthn.db"))
+    return sqlite if request.param == "sqlite" else CachedWebAuthnStore(sqlite)
+
+
+def test_credentials_per_user(store):
+    a1, a2, b1 = make_credential(), make_credential(), make_credential()
+    store.add_credential("alice", a1)
+    store.add_credential("alice", a2)
+    store.add_credential("bob", b1)
+
+    assert {c.credential_id for c in store.get_credentials("alice")} == {a1.credential_id, a2.credential_id}
+    assert store.get_credentials("carol") == []
+    assert store.get_credential(b1.credential_id) == ("bob", b1)
+    assert store.get_credential(b"missing") is None
+
+    assert store.delete_credential(a1.credential_id)
+    assert not store.delete_credential(a1.credential_id)
+    assert store.get_credentials("alice") == [a2]
+
+
+def test_challenge_is_single_use_and_expires(store):
+    store.put_challenge("reg:alice", {"challenge": "abc"})
+    assert store.pop_challenge("reg:alice") == {"challenge": "abc"}
+    assert store.pop_challenge("reg:alice") is None
+    assert store.pop_challenge("never") is None
+
+    store.put_challenge("old", {"challenge": "x"}, ttl=-1)
+    store.put_challenge("fresh", {"challenge": "y"})
+    assert store.pop_challenge("old") is None
+    store.put_challenge("old2", {"challenge": "x"}, ttl=-1)
+    assert store.purge_expired() >= 1
+    assert store.pop_challenge("fresh") == {"challenge": "y"}
+
+
+def test_memory_challenges_are_bounded():
+    challenges = MemoryChallengeStore(max_entries=2)
+    for key in "abc":
+        challenges.put_challenge(key, {"k": key})
+    assert len(challenges) == 2
+    assert challenges.pop_challenge("a") is None and challenges.pop_challenge("c") == {"k": "c"}
+
+
+def test_sqlite_store_shared_between_workers(tmp_path):
+    path = str(tmp_path / "webauthn.db")
+    one = CachedWebAuthnStore(SqliteWebAuthnStore(path))
+    two = CachedWebAuthnStore(SqliteWebAuthnStore(path))
+
+    # 一個 worker 開始流程、另一個完成；同一份 state 只能被取用一次
+    one.put_challenge("auth:alice", {"challenge": "abc"})
+    assert two.pop_challenge("auth:alice") == {"challenge": "abc"}
+    assert one.pop_challenge("auth:alice") is None
+
+    cred = make_credential()
+    assert two.get_credentials("alice") == []
+    one.add_credential("alice", cred)
+    assert one.get_credentials("alice") == [cred]
+    assert two.get_credential(cred.credential_id) == ("alice", cred)
+
+
+def test_cached_credentials_invalidate_on_change(tmp_path):
+    backend = SqliteWebAuthnStore(str(tmp_path / "webauthn.db"))
+    cached = CachedWebAuthnStore(backend, ttl=60)
+    cred = make_credential()
+    assert cached.get_credentials("alice") == []
+    cached.add_credential("alice", cred)
+    assert cached.get_credentials("alice") == [cred]
+
+    calls = []
+    real = backend.get_credentials
+    backend.get_credentials = lambda user_id: calls.append(user_id) or real(user_id)
+    cached.get_credentials("alice")
+    assert calls == []  # 快取命中
+    cached.delete_credential(cred.credential_id)
+    assert cached.get_credentials("alice") == [] and calls == ["alice"]
+
+
+def test_store_selection(monkeypatch, tmp_path):
+    webauthn_store.get_webauthn_store.cache_clear()
+    try:
+        monkeypatch.setenv("WEBAUTHN_STORE", "memory")
+        assert isinstance(webauthn_store.get_webauthn_store(), MemoryWebAuthnStore)
+        webauthn_store.get_webauthn_store.cache_clear()
+        monkeypatch.setenv("WEBAUTHN_STORE", "sqlite")
+        monkeypatch.setenv("WEBAUTHN_DB_PATH", str(tmp_path / "w.db"))
+        store = webauthn_store.get_webauthn_store()
+        assert isinstance(store, CachedWebAuthnStore) and isinstance(store.backend, SqliteWebAuthnStore)
+        webauthn_store.get_webauthn_store.cache_clear()
+        monkeypatch.setenv("WEBAUTHN_STORE", "redis")
+        with pytest.raises(RuntimeError):
+            webauthn_store.get_webauthn_store()
+    finally:
+        webauthn_store.get_webauthn_store.cache_clear()
+
+
+def test_importing_routes_does_not_create_a_database(tmp_path):
+    env = {k: v for k, v in os.environ.items() if k not in ("WEBAUTHN_DB_PATH", "WEBAUTHN_STORE")}
+    env["PYTHONPATH"] = os.pathsep.join(sys.path)
+    subprocess.run([sys.executable, "-c", "import backend.routes.webauthn"], cwd=tmp_path, env=env, check=True)
+    assert os.listdir(tmp_path) == []
+
+
+def test_routes_use_the_store_dependency():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from backend.routes import webauthn
+
+    store = MemoryWebAuthnStore()
+    app = FastAPI()
+    app.include_router(webauthn.router, prefix="/webauthn")
+    app.dependency_overrides[webauthn_store.get_webauthn_store] = lambda: store
+    with TestClient(app) as client:
+        assert client.post("/webauthn/register/begin", json={"username": "alice"}).status_code == 200
+        assert client.post("/webauthn/authenticate/begin", json={"username": "alice"}).status_code == 404
+    assert store.pop_challenge("register:alice") is not None
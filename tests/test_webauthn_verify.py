@@ -0,0 +1,135 @@
+import asyncio
+import os
+import threading
+
+import pytest
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from fido2.cose import ES256, ES384, RS256, EdDSA
+from fido2.webauthn import Aaguid, AttestedCredentialData
+
+from backend.webauthn_verify import (
+    AssertionVerifier, LatencyStats, PublicKeyCache, VerifyQueueFull, load_verifier,
+)
+from conftest import run
+
+MESSAGE = b"authenticator data || client data hash"
+
+
+def _keys():
+    p256 = ec.generate_private_key(ec.SECP256R1())
+    p384 = ec.generate_private_key(ec.SECP384R1())
+    ed = ed25519.Ed25519PrivateKey.generate()
+    rs = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return [
+        (ES256.from_cryptography_key(p256.public_key()), lambda m: p256.sign(m, ec.ECDSA(hashes.SHA256()))),
+        (ES384.from_cryptography_key(p384.public_key()), lambda m: p384.sign(m, ec.ECDSA(hashes.SHA384()))),
+        (EdDSA.from_cryptography_key(ed.public_key()), ed.sign),
+        (RS256.from_cryptography_key(rs.public_key()), lambda m: rs.sign(m, padding.PKCS1v15(), hashes.SHA256())),
+    ]
+
+
+@pytest.mark.parametrize("index", range(4), ids=["es256", "es384", "eddsa", "rs256"])
+def test_loaded_verifier_agrees_with_fido2(index):
+    cose, sign = _keys()[index]
+    verify = load_verifier(cose)
+    assert verify != cose.verify  # 有轉成 cryptography 的 key
+    signature = sign(MESSAGE)
+    verify(MESSAGE, signature)
+    cose.verify(MESSAGE, signature)
+    with pytest.raises(InvalidSignature):
+        verify(MESSAGE + b"!", signature)
+
+
+def test_curve_must_match_algorithm():
+    # ES256 標頭卻帶 P-384 的點：不能照 crv 換曲線驗過，要交給 fido2 拒絕
+    p384 = ec.generate_private_key(ec.SECP384R1())
+    numbers = ES384.from_cryptography_key(p384.public_key())
+    cose = ES256({1: 2, 3: ES256.ALGORITHM, -1: 2, -2: numbers[-2], -3: numbers[-3]})
+    verify = load_verifier(cose)
+    assert verify == cose.verify
+    with pytest.raises(ValueError):
+        verify(MESSAGE, p384.sign(MESSAGE, ec.ECDSA(hashes.SHA256())))
+
+
+def _credential(cose=None):
+    cose = cose or _keys()[0][0]
+    return AttestedCredentialData.create(Aaguid.NONE, os.urandom(16), cose)
+
+
+def test_key_cache_hits_rebuilds_and_evicts():
+    cache = PublicKeyCache(max_entries=2)
+    a, b, c = _credential(), _credential(), _credential()
+    first = cache.get(a)
+    assert cache.get(a) is first and (cache.hits, cache.misses) == (1, 1)
+
+    # 同一個 credential_id 換了公鑰（重新註冊）就不能用舊的 key
+    replaced = AttestedCredentialData.create(Aaguid.NONE, a.credential_id, _keys()[2][0])
+    assert cache.get(replaced) is not first
+
+    cache.get(b)
+    cache.get(c)
+    assert list(cache._entries) == [b.credential_id, c.credential_id]
+    wrapped = cache.wrap([b, c])
+    assert [w.credential_id for w in wrapped] == [b.credential_id, c.credential_id]
+
+
+class FakeServer:
+    def __init__(self, fail=False, gate=None):
+        self.fail = fail
+        self.gate = gate
+        self.threads = []
+
+    def authenticate_complete(self, state, credentials, response):
+        self.threads.append(threading.current_thread().name)
+        if self.gate:
+            self.gate.wait(5)
+        if self.fail:
+            raise ValueError("Invalid signature")
+        return credentials[0]
+
+
+def test_verification_runs_in_pool_and_is_counted():
+    verifier = AssertionVerifier(workers=2, max_queue=8)
+    credential = _credential()
+    server = FakeServer()
+    result = run(verifier.authenticate_complete(server, {}, [credential], {}))
+    assert result.credential_id == credential.credential_id
+    assert server.threads[0].startswith("webauthn-verify")
+
+    with pytest.raises(ValueError):
+        run(verifier.authenticate_complete(FakeServer(fail=True), {}, [credential], {}))
+    stats = verifier.stats()
+    assert stats["failures"] == 1 and stats["pending"] == 0
+    assert stats["verify"]["count"] == 2 and stats["key_cache"]["hits"] == 1
+
+
+def test_queue_limit_rejects_excess_requests():
+    verifier = AssertionVerifier(workers=1, max_queue=2)
+    gate = threading.Event()
+    server = FakeServer(gate=gate)
+    credential = _credential()
+
+    async def scenario():
+        pending = [asyncio.ensure_future(verifier.authenticate_complete(server, {}, [credential], {}))
+                   for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(VerifyQueueFull):
+            await verifier.authenticate_complete(server, {}, [credential], {})
+        gate.set()
+        await asyncio.gather(*pending)
+
+    run(scenario())
+    assert verifier.rejected == 1 and verifier.stats()["pending"] == 0
+
+
+def test_latency_stats_snapshot():
+    stats = LatencyStats(window=4)
+    assert stats.snapshot()["p50_ms"] is None
+    for seconds in (0.001, 0.002, 0.003, 0.004, 0.010):
+        stats.add(seconds)
+    snap = stats.snapshot()
+    assert snap["count"] == 5 and snap["max_ms"] == 10.0
+    assert snap["p50_ms"] == 4.0  # 只看最近 4 筆
+    assert snap["avg_ms"] == 4.0
@@ -1,7 +1,10 @@
-from flask import Flask, render_template, request, redirect, flash, session, url_for
-import mysql.connector, hashlib, os
+from flask import Flask, render_template, request, redirect, flash, session, url_for, jsonify
+import os
 from dotenv import load_dotenv
 
+from dal import UserRepository, create_pool
+from passwords import HasherBusy, PasswordHasher
+
 # ────────────────────────────────
 # env & config
 # ────────────────────────────────
@@ -9,15 +12,11 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'dev_key')
 
-db_config = {
-    'host': os.getenv('DB_HOST', 'localhost'),
-    'user': os.getenv('DB_USER', 'root'),
-    'password': os.getenv('DB_PASSWORD', ''),
-    'database': os.getenv('DB_NAME', 'secure_share')
-}
-
-def get_db_connection():
-    return mysql.connector.connect(**db_config)
+# 連線池（DB_POOL_SIZE / DB_POOL_TIMEOUT；DB_BACKEND=sqlite 可改用本機 SQLite）
+db_pool = create_pool()
+users = UserRepository(db_pool)
+# Argon2id / scrypt，worker 數與排隊上限見 passwords.py
+hasher = PasswordHasher()
 
 # ────────────────────────────────
 # stub 2FA verifier ‑–– 之後由組員實作
@@ -36,11 +35,20 @@ def login():
     if request.method == 'POST':
         user = request.form['username']
         pwd = request.form['password']
-        hash_pwd = hashlib.sha256(pwd.encode()).hexdigest()
-        conn = get_db_connection(); cur = conn.cursor()
-        cur.execute("SELECT password FROM users WHERE username=%s", (user,))
-        row = cur.fetchone(); cur.close(); conn.close()
-        if row and row[0] == hash_pwd:
+        stored = users.get_password_hash(user)
+        try:
+            ok, needs_rehash = hasher.verify(pwd, stored)
+        except HasherBusy:
+            flash('Server busy, please try again', 'danger')
+            return render_template('login.html'), 503
+        if ok and needs_rehash:
+            # 舊的 SHA-256 或舊參數 → 趁有明文時換成目前的格式；
+            # 忙的話這次先不換（密碼已經驗證過了），下次登入再換
+            try:
+                users.update_password_hash(user, hasher.hash(pwd))
+            except HasherBusy:
+                pass
+        if ok:
             session['pending_user'] = user  # 暫存
             return redirect(url_for('verify'))
         flash('Invalid credentials', 'danger')
@@ -66,16 +74,15 @@ def signup():
     if request.method == 'POST':
         user = request.form['username']
         pwd = request.form['password']
-        hash_pwd = hashlib.sha256(pwd.encode()).hexdigest()
-        conn = get_db_connection(); cur = conn.cursor()
-        cur.execute("SELECT 1 FROM users WHERE username=%s", (user,))
-        if cur.fetchone():
-            flash('Username exists', 'danger')
-        else:
-            cur.execute("INSERT INTO users(username,password) VALUES(%s,%s)", (user, hash_pwd))
-            conn.commit(); flash('Signup success', 'success')
+        try:
+            hash_pwd = hasher.hash(pwd)
+        except HasherBusy:
+            flash('Server busy, please try again', 'danger')
+            return render_template('signup.html'), 503
+        if users.create_user(user, hash_pwd):
+            flash('Signup success', 'success')
             return redirect(url_for('login'))
-        cur.close(); conn.close()
+        flash('Username exists', 'danger')
     return render_template('signup.html')
 
 @app.route('/welcome')
@@ -84,6 +91,12 @@ def welcome():
         return redirect(url_for('login'))
     return render_template('welcome.html')
 
+@app.route('/healthz')
+def healthz():
+    """連線池狀態 + ping；資料庫連不上時回 503"""
+    health = db_pool.health()
+    return jsonify(health), (200 if health['ok'] else 503)
+
 @app.route('/logout')
 def logout():
     session.clear(); return redirect(url_for('login'))
@@ -0,0 +1,263 @@
+"""
+webpage 的資料存取層：連線池 + users 查詢。
+
+- 連線在池裡重複使用，不再每個 request 都重新 TCP 連線 + 登入 MySQL
+- MySQL 走 prepared statement（cursor(prepared=True)）
+- 借出前若閒置超過 DB_POOL_PING_INTERVAL 秒就先 ping，壞掉的連線直接換新的
+- 記錄借連線的等待時間，/healthz 會把這些數字連同 ping 結果一起回傳
+- DB_BACKEND=sqlite 時改用本機 SQLite（開發 / 測試用，不必裝 MySQL）
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+
+# ────────────────────────────────
+# 方言：連線方式、placeholder、prepared cursor
+# ────────────────────────────────
+class MySQLDialect:
+    name = 'mysql'
+
+    def __init__(self, config: dict):
+        import mysql.connector
+        self._mysql = mysql.connector
+        self.config = config
+        self.integrity_errors = (mysql.connector.errors.IntegrityError,)
+
+    def connect(self):
+        # autocommit：只有讀取的借用不會留下開著的 transaction（REPEATABLE READ 會一直看到舊的 snapshot）
+        return self._mysql.connect(**self.config, autocommit=True)
+
+    def cursor(self, conn):
+        return conn.cursor(prepared=True)
+
+    def ping(self, conn) -> None:
+        conn.ping(reconnect=False, attempts=1)
+
+    def sql(self, stmt: str) -> str:
+        return stmt
+
+
+class SQLiteDialect:
+    name = 'sqlite'
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL DEFAULT 'visitor',
+        cert_fingerprint TEXT
+    )
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.integrity_errors = (sqlite3.IntegrityError,)
+        with sqlite3.connect(path) as conn:
+            conn.execute(self.SCHEMA)
+
+    def connect(self):
+        # sqlite3 自己會快取編譯過的 statement（cached_statements）
+        return sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+
+    def cursor(self, conn):
+        return conn.cursor()
+
+    def ping(self, conn) -> None:
+        conn.execute('SELECT 1').fetchone()
+
+    def sql(self, stmt: str) -> str:
+        return stmt.replace('%s', '?')
+
+
+# ────────────────────────────────
+# 連線池
+# ────────────────────────────────
+class PoolTimeout(Exception):
+    """等了 timeout 秒還借不到連線。"""
+
+
+class ConnectionPool:
+    def __init__(self, dialect, size: int = 8, timeout: float = 5.0, ping_interval: float = 30.0):
+        self.dialect = dialect
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self._idle = queue.LifoQueue()       # (conn, 上次歸還時間)；LIFO 讓熱的連線優先被用
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.replaced = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _checkout(self):
+        try:
+            conn, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            self.created += 1
+            return self.dialect.connect()
+        if time.monotonic() - last_used >= self.ping_interval:
+            try:
+                self.dialect.ping(conn)
+            except Exception:
+                self._close(conn)
+                self.replaced += 1
+                return self.dialect.connect()
+        return conn
+
+    def _reset(self, conn):
+        """
+        還回池裡之前結束還開著的 transaction（出錯、或借用的人只讀沒 commit），
+        下一個借到的人才不會沿用舊的 snapshot。連 rollback 都失敗就當成壞掉的連線關掉，回傳 None。
+        """
+        try:
+            if getattr(conn, 'in_transaction', True):
+                conn.rollback()
+            return conn
+        except Exception:
+            self._close(conn)
+            return None
+
+    @staticmethod
+    def _close(conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeout(f'no database connection available within {self.timeout}s')
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.acquired += 1
+            self.in_use += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        conn = None
+        try:
+            conn = self._checkout()
+            yield conn
+        finally:
+            if conn is not None:
+                conn = self._reset(conn)
+            if conn is not None:
+                self._idle.put((conn, time.monotonic()))
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def close(self) -> None:
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'backend': self.dialect.name,
+                'size': self.size,
+                'in_use': self.in_use,
+                'idle': self._idle.qsize(),
+                'created': self.created,
+                'replaced': self.replaced,
+                'acquired': self.acquired,
+                'timeouts': self.timeouts,
+                'wait_avg_ms': round(self.wait_total / self.acquired * 1000, 3) if self.acquired else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 3),
+            }
+
+    def health(self) -> dict:
+        result = self.stats()
+        start = time.perf_counter()
+        try:
+            with self.connection() as conn:
+                self.dialect.ping(conn)
+            result['ok'] = True
+        except Exception as e:
+            result['ok'] = False
+            result['error'] = str(e)
+        result['ping_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        return result
+
+
+# ────────────────────────────────
+# users 查詢
+# ────────────────────────────────
+class UserRepository:
+    SELECT_PASSWORD = "SELECT password FROM users WHERE username=%s"
+    INSERT_USER = "INSERT INTO users(username,password) VALUES(%s,%s)"
+    UPDATE_PASSWORD = "UPDATE users SET password=%s WHERE username=%s"
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        sql: Callable[[str], str] = pool.dialect.sql
+        self._select_password = sql(self.SELECT_PASSWORD)
+        self._insert_user = sql(self.INSERT_USER)
+        self._update_password = sql(self.UPDATE_PASSWORD)
+
+    def _run(self, stmt: str, params: tuple, fetch: bool = False):
+        with self.pool.connection() as conn:
+            cur = self.pool.dialect.cursor(conn)
+            try:
+                cur.execute(stmt, params)
+                if fetch:
+                    return cur.fetchone()
+                conn.commit()
+                return cur.rowcount
+            finally:
+                cur.close()
+
+    def get_password_hash(self, username: str) -> Optional[str]:
+        row = self._run(self._select_password, (username,), fetch=True)
+        if not row:
+            return None
+        value = row[0]
+        return value.decode() if isinstance(value, (bytes, bytearray)) else value
+
+    def create_user(self, username: str, password_hash: str) -> bool:
+        """新增使用者；帳號已存在回傳 False（靠 UNIQUE 約束，不用先查一次）。"""
+        try:
+            self._run(self._insert_user, (username, password_hash))
+        except self.pool.dialect.integrity_errors:
+            return False
+        return True
+
+    def update_password_hash(self, username: str, password_hash: str) -> None:
+        self._run(self._update_password, (password_hash, username))
+
+
+def create_pool() -> ConnectionPool:
+    backend = os.getenv('DB_BACKEND', 'mysql').lower()
+    if backend == 'sqlite':
+        dialect = SQLiteDialect(os.getenv('DB_SQLITE_PATH', 'secure_share.db'))
+    elif backend == 'mysql':
+        dialect = MySQLDialect({
+            'host': os.getenv('DB_HOST', 'localhost'),
+            'user': os.getenv('DB_USER', 'root'),
+            'password': os.getenv('DB_PASSWORD', ''),
+            'database': os.getenv('DB_NAME', 'secure_share'),
+        })
+    else:
+        raise RuntimeError(f'Unknown DB_BACKEND: {backend}')
+    return ConnectionPool(
+        dialect,
+        size=int(os.getenv('DB_POOL_SIZE', '8')),
+        timeout=float(os.getenv('DB_POOL_TIMEOUT', '5')),
+        ping_interval=float(os.getenv('DB_POOL_PING_INTERVAL', '30')),
+    )
@@ -0,0 +1,228 @@
+"""
+密碼雜湊：Argon2id（有裝 argon2-cffi 時）或 scrypt（標準函式庫），參數跟鹽一起編進字串裡。
+
+- 新密碼一律用 PASSWORD_HASH 指定的演算法 / 參數
+- 舊的無鹽 SHA-256（64 個 hex 字元）仍可登入，登入成功後由 app.py 換成新格式
+- 雜湊丟到固定大小的 worker pool 做；排隊 + 執行中的數量超過 PASSWORD_MAX_PENDING 直接拒絕，
+  被撞庫時 CPU 用量有上限，正常使用者的延遲也可預期
+- `python passwords.py bench --target-ms 250` 會在這台機器上找出符合目標延遲的參數
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+try:
+    import argon2
+    from argon2.low_level import Type as _Argon2Type
+except ImportError:  # 沒裝 argon2-cffi 就只能用 scrypt
+    argon2 = None
+
+_LEGACY_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+_SCRYPT = re.compile(r'^\$scrypt\$ln=(\d+),r=(\d+),p=(\d+)\$([A-Za-z0-9+/]+)\$([A-Za-z0-9+/]+)$')
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip('=')
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+class HasherBusy(Exception):
+    """同時在排隊 / 計算的雜湊太多，請稍後再試。"""
+
+
+# ────────────────────────────────
+# 演算法
+# ────────────────────────────────
+class ScryptScheme:
+    name = 'scrypt'
+
+    def __init__(self, ln: int = 15, r: int = 8, p: int = 1):
+        self.ln, self.r, self.p = ln, r, p
+
+    def hash(self, password: str) -> str:
+        salt = os.urandom(16)
+        dk = self._derive(password, salt, self.ln, self.r, self.p)
+        return f'$scrypt$ln={self.ln},r={self.r},p={self.p}${_b64(salt)}${_b64(dk)}'
+
+    @staticmethod
+    def _derive(password: str, salt: bytes, ln: int, r: int, p: int) -> bytes:
+        n = 1 << ln
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + (1 << 20), dklen=32)
+
+    def verify(self, password: str, encoded: str) -> Tuple[bool, bool]:
+        m = _SCRYPT.match(encoded)
+        if not m:
+            return False, False
+        ln, r, p = int(m.group(1)), int(m.group(2)), int(m.group(3))
+        dk = self._derive(password, _unb64(m.group(4)), ln, r, p)
+        return hmac.compare_digest(dk, _unb64(m.group(5))), (ln, r, p) != (self.ln, self.r, self.p)
+
+
+class Argon2Scheme:
+    name = 'argon2id'
+
+    def __init__(self, time_cost: int = 3, memory_cost: int = 65536, parallelism: int = 1):
+        if argon2 is None:
+            raise RuntimeError('PASSWORD_HASH=argon2id requires the argon2-cffi package')
+        self._ph = argon2.PasswordHasher(
+            time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism, type=_Argon2Type.ID
+        )
+
+    def hash(self, password: str) -> str:
+        return self._ph.hash(password)
+
+    def verify(self, password: str, encoded: str) -> Tuple[bool, bool]:
+        try:
+            self._ph.verify(encoded, password)
+        except argon2.exceptions.VerificationError:
+            return False, False
+        except argon2.exceptions.InvalidHashError:
+            return False, False
+        return True, self._ph.check_needs_rehash(encoded)
+
+
+def _scheme_for(encoded: str) -> Optional[str]:
+    if encoded.startswith('$argon2'):
+        return 'argon2id'
+    if encoded.startswith('$scrypt$'):
+        return 'scrypt'
+    if _LEGACY_SHA256.match(encoded):
+        return 'sha256'
+    return None
+
+
+def make_scheme(name: Optional[str] = None):
+    name = (name or os.getenv('PASSWORD_HASH') or ('argon2id' if argon2 else 'scrypt')).lower()
+    if name == 'argon2id':
+        return Argon2Scheme(
+            time_cost=int(os.getenv('ARGON2_TIME_COST', '3')),
+            memory_cost=int(os.getenv('ARGON2_MEMORY_KIB', '65536')),
+            parallelism=int(os.getenv('ARGON2_PARALLELISM', '1')),
+        )
+    if name == 'scrypt':
+        return ScryptScheme(
+            ln=int(os.getenv('SCRYPT_LN', '15')),
+            r=int(os.getenv('SCRYPT_R', '8')),
+            p=int(os.getenv('SCRYPT_P', '1')),
+        )
+    raise RuntimeError(f'Unknown PASSWORD_HASH: {name}')
+
+
+# ────────────────────────────────
+# worker pool + admission control
+# ────────────────────────────────
+class PasswordHasher:
+    def __init__(self, scheme=None, workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 admit_timeout: float = 0.05):
+        self.scheme = scheme or make_scheme()
+        self.workers = workers or int(os.getenv('PASSWORD_WORKERS', str(os.cpu_count() or 2)))
+        self.max_pending = max_pending or int(os.getenv('PASSWORD_MAX_PENDING', str(self.workers * 4)))
+        self.admit_timeout = admit_timeout
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='pwhash')
+        self._admission = threading.BoundedSemaphore(self.max_pending)
+        self._schemes = {self.scheme.name: self.scheme}
+        self.rejected = 0
+        # 帳號不存在時也做一次等價的雜湊，讓回應時間不洩漏帳號是否存在
+        self._dummy = self.scheme.hash(os.urandom(16).hex())
+
+    def _submit(self, fn, *args):
+        # 呼叫端（Flask 的 request thread）會在 .result() 等到算完；pool 只限制同時計算的數量
+        if not self._admission.acquire(timeout=self.admit_timeout):
+            self.rejected += 1
+            raise HasherBusy()
+        try:
+            return self._pool.submit(fn, *args).result()
+        finally:
+            self._admission.release()
+
+    def _scheme(self, name: str):
+        if name not in self._schemes:
+            self._schemes[name] = make_scheme(name)
+        return self._schemes[name]
+
+    def _verify(self, password: str, encoded: Optional[str]) -> Tuple[bool, bool]:
+        if encoded is None:
+            self.scheme.verify(password, self._dummy)
+            return False, False
+        kind = _scheme_for(encoded)
+        if kind == 'sha256':
+            legacy = hashlib.sha256(password.encode()).hexdigest()
+            return hmac.compare_digest(legacy, encoded), True
+        if kind is None:
+            return False, False
+        ok, stale = self._scheme(kind).verify(password, encoded)
+        return ok, stale or kind != self.scheme.name
+
+    def hash(self, password: str) -> str:
+        return self._submit(self.scheme.hash, password)
+
+    def verify(self, password: str, encoded: Optional[str]) -> Tuple[bool, bool]:
+        """回傳 (是否正確, 是否該換成目前的格式 / 參數)。encoded 為 None 表示帳號不存在。"""
+        return self._submit(self._verify, password, encoded)
+
+
+# ────────────────────────────────
+# 參數 benchmark
+# ────────────────────────────────
+def _time(scheme, rounds: int = 3) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        scheme.hash('benchmark-password')
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark(name: str, target_ms: float) -> Tuple[dict, float]:
+    """逐步加大成本，回傳不超過目標延遲的最大參數與實測毫秒數。"""
+    target = target_ms / 1000
+    if name == 'scrypt':
+        best, best_t = {'ln': 14}, _time(ScryptScheme(ln=14))
+        for ln in range(15, 21):
+            t = _time(ScryptScheme(ln=ln))
+            if t > target:
+                break
+            best, best_t = {'ln': ln}, t
+    else:
+        memory = int(os.getenv('ARGON2_MEMORY_KIB', '65536'))
+        best, best_t = {'time_cost': 1, 'memory_cost': memory}, _time(Argon2Scheme(1, memory))
+        for cost in range(2, 33):
+            t = _time(Argon2Scheme(cost, memory))
+            if t > target:
+                break
+            best, best_t = {'time_cost': cost, 'memory_cost': memory}, t
+    return best, best_t * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='password hashing tools')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    bench = sub.add_parser('bench', help='find parameters that hash in about --target-ms on this machine')
+    bench.add_argument('--target-ms', type=float, default=250.0)
+    bench.add_argument('--scheme', choices=['argon2id', 'scrypt'], default='argon2id' if argon2 else 'scrypt')
+    args = parser.parse_args()
+
+    params, ms = benchmark(args.scheme, args.target_ms)
+    print(f'# {args.scheme}: {ms:.1f} ms per hash (target {args.target_ms:.0f} ms)')
+    print(f'PASSWORD_HASH={args.scheme}')
+    if args.scheme == 'scrypt':
+        print(f"SCRYPT_LN={params['ln']}")
+    else:
+        print(f"ARGON2_TIME_COST={params['time_cost']}")
+        print(f"ARGON2_MEMORY_KIB={params['memory_cost']}")
+    workers = os.cpu_count() or 2
+    print(f'# capacity ≈ {workers * 1000 / ms:.0f} logins/s with PASSWORD_WORKERS={workers}')
+
+
+if __name__ == '__main__':
+    main()
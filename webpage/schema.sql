@@ -4,7 +4,7 @@ USE secure_share;
 CREATE TABLE users (
     id INT AUTO_INCREMENT PRIMARY KEY,
     username VARCHAR(255) NOT NULL UNIQUE,
-    password VARCHAR(64) NOT NULL,
+    password VARCHAR(255) NOT NULL,  -- Argon2id / scrypt 編碼字串（舊資料庫：ALTER TABLE users MODIFY password VARCHAR(255) NOT NULL;）
     role ENUM('professor', 'assistant', 'visitor') NOT NULL,
     cert_fingerprint VARCHAR(128)
 );
@@ -29,3 +29,28 @@ CREATE TABLE audit_logs (
     FOREIGN KEY (user_id) REFERENCES users(id),
     FOREIGN KEY (file_id) REFERENCES files(id)
 );
+
+-- 後端 TOTP secret（AES-GCM 加密後存放，見 src/backend/db.py 的 MySQLTotpStore）
+CREATE TABLE totp_secrets (
+    user_id VARCHAR(255) PRIMARY KEY,
+    secret VARBINARY(128) NOT NULL,
+    enabled BOOLEAN NOT NULL DEFAULT FALSE,
+    last_step BIGINT NOT NULL DEFAULT -1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- 後端 WebAuthn credential / challenge（見 src/backend/webauthn_store.py 的 MySQLWebAuthnStore）
+CREATE TABLE webauthn_credentials (
+    credential_id VARBINARY(1023) PRIMARY KEY,
+    user_id VARCHAR(255) NOT NULL,
+    credential_data BLOB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_webauthn_credentials_user (user_id)
+);
+
+CREATE TABLE webauthn_challenges (
+    challenge_key VARCHAR(255) PRIMARY KEY,
+    state TEXT NOT NULL,
+    expires_at DOUBLE NOT NULL,
+    INDEX idx_webauthn_challenges_expires (expires_at)
+);